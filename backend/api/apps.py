@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401  (registers receivers)
+        from .utils_partitions import create_future_partitions
+        post_migrate.connect(create_future_partitions, sender=self, dispatch_uid='invoice_partitions')
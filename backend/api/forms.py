@@ -1,7 +1,12 @@
+import calendar
+from datetime import date
+
 from django import forms
 from django.forms import inlineformset_factory
 from .models import Customer, Vendor, Product, Transaction,PurchaseOrder, PurchaseItem, Product, Invoice, InvoiceItem,Company
 from django.core.validators import FileExtensionValidator
+from django.db.models import Q
+from .utils_search import search
 from django import forms
 
 
@@ -157,6 +162,8 @@ class PurchaseOrderForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Option labels show the company: join it (one query per dropdown, not one per option)
+        self.fields['vendor'].queryset = Vendor.objects.select_related('company')
         # Set default date
         if not self.instance.pk:
             from django.utils import timezone
@@ -172,6 +179,10 @@ class PurchaseItemForm(forms.ModelForm):
             'unit_cost': forms.NumberInput(attrs={'class': 'form-control price', 'step': '1'}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['product'].queryset = Product.objects.select_related('company')
+
 # Logic: Link Parent (PurchaseOrder) to Child (PurchaseItem)
 PurchaseItemFormSet = inlineformset_factory(
     PurchaseOrder, 
@@ -220,6 +231,7 @@ class InvoiceForm(forms.ModelForm):
             
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['customer'].queryset = Customer.objects.select_related('company')
         if not self.instance.pk:
             from django.utils import timezone
             self.fields['invoice_date'].initial = timezone.now().date()
@@ -234,7 +246,7 @@ class InvoiceItemCustomChoiceField(forms.ModelChoiceField):
 class InvoiceItemForm(forms.ModelForm):
     # 1. Product Field (User selects this first)
     product = forms.ModelChoiceField(
-        queryset=Product.objects.filter(is_active=True),
+        queryset=Product.objects.filter(is_active=True).select_related('company'),
         widget=forms.Select(attrs={'class': 'form-select product-select'}),
         required=True
     )
@@ -300,4 +312,100 @@ class ReportFilterForm(forms.Form):
     end_date = forms.DateField(
         widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
         label="End Date"
-    )
\ No newline at end of file
+    )
+
+
+class InvoiceBulkPrintForm(forms.Form):
+    """Select invoices to print: explicit ids, or a date range with optional channel/status."""
+    OUTPUT_CHOICES = [
+        ('pdf', 'PDF รวมไฟล์เดียว'),
+        ('zip', 'ZIP (แยกไฟล์)'),
+    ]
+
+    ids = forms.CharField(required=False, help_text="Comma-separated invoice ids")
+    start_date = forms.DateField(required=False)
+    end_date = forms.DateField(required=False)
+    platform_name = forms.CharField(required=False)
+    status = forms.ChoiceField(choices=[('', 'ทั้งหมด')] + Invoice.STATUS_CHOICES, required=False)
+    output = forms.ChoiceField(choices=OUTPUT_CHOICES, required=False)
+
+    def clean_ids(self):
+        raw = self.cleaned_data['ids']
+        try:
+            return [int(part) for part in raw.split(',') if part.strip()]
+        except ValueError:
+            raise forms.ValidationError("ids must be a comma-separated list of numbers.")
+
+    def clean(self):
+        cleaned = super().clean()
+        if not cleaned.get('ids') and not (cleaned.get('start_date') and cleaned.get('end_date')):
+            raise forms.ValidationError("Provide invoice ids or a start_date/end_date range.")
+        return cleaned
+
+
+class InvoiceFilterForm(forms.Form):
+    """
+    Invoice table / API filters, all on indexed columns (see Invoice.Meta.indexes).
+    number / tracking are prefix matches; date takes YYYY, YYYY-MM or YYYY-MM-DD.
+    """
+    company = forms.IntegerField(required=False)
+    customer = forms.IntegerField(required=False)
+    status = forms.ChoiceField(choices=[('', 'ทั้งหมด')] + Invoice.STATUS_CHOICES, required=False)
+    platform_name = forms.CharField(required=False)
+    date = forms.CharField(required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    number = forms.CharField(required=False)  # Invoice no. or platform order id
+    order_status = forms.CharField(required=False)
+    tracking = forms.CharField(required=False)
+    min_total = forms.DecimalField(required=False, max_digits=12, decimal_places=2)
+    q = forms.CharField(required=False)
+
+    def clean_date(self):
+        raw = self.cleaned_data['date'].strip()
+        if not raw:
+            return None
+        parts = raw.split('-')
+        try:
+            if len(parts) == 1 and len(parts[0]) == 4:
+                year = int(parts[0])
+                return date(year, 1, 1), date(year, 12, 31)
+            if len(parts) == 2:
+                start = date(int(parts[0]), int(parts[1]), 1)
+                return start, date(start.year, start.month, calendar.monthrange(start.year, start.month)[1])
+            if len(parts) == 3:
+                day = date(int(parts[0]), int(parts[1]), int(parts[2]))
+                return day, day
+        except ValueError:
+            pass
+        raise forms.ValidationError("Use YYYY, YYYY-MM or YYYY-MM-DD.")
+
+    def filter(self, queryset):
+        """Applies every valid, non-empty filter (invalid ones are skipped)."""
+        self.is_valid()  # Fills cleaned_data with the fields that passed
+        data = self.cleaned_data if self.is_bound else {}
+        if data.get('company'):
+            queryset = queryset.filter(company_id=data['company'])
+        if data.get('customer'):
+            queryset = queryset.filter(customer_id=data['customer'])
+        for field in ('status', 'platform_name'):
+            if data.get(field):
+                queryset = queryset.filter(**{field: data[field]})
+        if data.get('date'):
+            queryset = queryset.filter(invoice_date__range=data['date'])
+        if data.get('date_from'):
+            queryset = queryset.filter(invoice_date__gte=data['date_from'])
+        if data.get('date_to'):
+            queryset = queryset.filter(invoice_date__lte=data['date_to'])
+        if data.get('number'):
+            number = data['number'].strip()
+            queryset = queryset.filter(Q(invoice_number__startswith=number) | Q(platform_order_id__startswith=number))
+        if data.get('order_status'):
+            queryset = queryset.filter(platform_order_status__iexact=data['order_status'].strip())
+        if data.get('tracking'):
+            queryset = queryset.filter(platform_tracking_number__startswith=data['tracking'].strip())
+        if data.get('min_total') is not None:
+            queryset = queryset.filter(grand_total__gte=data['min_total'])
+        if data.get('q'):
+            queryset = search(queryset, data['q'])
+        return queryset
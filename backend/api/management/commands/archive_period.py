@@ -0,0 +1,54 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import ArchivedPeriod, Company
+from api.utils_archive import ArchiveError, archive_period, restore_period
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a closed month of one company (invoices, sold-out purchase orders) into the "
+        "compressed archive, restore it, or list archived months"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help="Company id")
+        parser.add_argument(
+            '--month', type=lambda value: datetime.strptime(value, '%Y-%m').date(), metavar='YYYY-MM',
+            help="Month to archive (or restore)",
+        )
+        parser.add_argument('--restore', action='store_true', help="Move the month back into the live tables")
+        parser.add_argument('--list', action='store_true', help="Show archived months")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            periods = ArchivedPeriod.objects.select_related('company').order_by('company__name', 'month')
+            if options['company']:
+                periods = periods.filter(company_id=options['company'])
+            for period in periods:
+                self.stdout.write(
+                    f"{period.company} {period.month:%Y-%m}: {period.invoice_count} invoices, "
+                    f"{period.purchase_order_count} POs (archived {period.archived_at:%Y-%m-%d})"
+                )
+            return
+
+        if not options['company'] or not options['month']:
+            raise CommandError("--company and --month are required")
+        company = Company.objects.filter(pk=options['company']).first()
+        if company is None:
+            raise CommandError(f"Company {options['company']} does not exist")
+
+        try:
+            if options['restore']:
+                restored = restore_period(company, options['month'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Restored {options['month']:%Y-%m}: " + ', '.join(f"{table} {count}" for table, count in restored.items())
+                ))
+            else:
+                period = archive_period(company, options['month'])
+                self.stdout.write(self.style.SUCCESS(
+                    f"Archived {period.month:%Y-%m}: {period.invoice_count} invoices, {period.purchase_order_count} POs"
+                ))
+        except ArchiveError as exc:
+            raise CommandError(str(exc))
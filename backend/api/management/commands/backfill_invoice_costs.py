@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api.utils_allocation import backfill_invoice_costs
+
+
+class Command(BaseCommand):
+    help = "Freeze batch unit costs onto existing invoice lines (InvoiceItem.unit_cost / total_cost)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Invoice lines per UPDATE")
+        parser.add_argument(
+            '--only-missing', action='store_true',
+            help="Only lines still at cost 0 (keep costs already frozen)",
+        )
+
+    def handle(self, *args, **options):
+        count = backfill_invoice_costs(batch_size=options['batch_size'], only_missing=options['only_missing'])
+        self.stdout.write(self.style.SUCCESS(f"Invoice line costs updated: {count}"))
@@ -0,0 +1,74 @@
+import json
+import os
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.models import Company
+from api.utils_benchmark import run_report_benchmarks, seed_benchmark_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and time every report end to end "
+        "(wall time, query count, peak memory, output size). Results are saved per run as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=10000, help="Invoices per company (e.g. 10000, 100000, 1000000)")
+        parser.add_argument('--companies', type=int, default=1)
+        parser.add_argument('--products', type=int, default=500, help="Products per company")
+        parser.add_argument('--months', type=int, default=12, help="History length to spread documents over")
+        parser.add_argument('--report', action='append', dest='reports', help="Only run this report (repeatable)")
+        parser.add_argument('--label', default='', help="Free text stored with the run, e.g. a branch name")
+        parser.add_argument(
+            '--output-dir', default=os.path.join(settings.BASE_DIR, 'benchmark_results'),
+            help="Directory for per-run JSON result files",
+        )
+
+    def handle(self, *args, **options):
+        # 1. Throwaway database (same mechanism as the test runner)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            end_date = date.today().replace(day=1) - timedelta(days=1)  # last complete month
+            start_date = end_date.replace(day=1)
+
+            self.stdout.write(f"Seeding {options['companies']} x {options['invoices']} invoices ...")
+            counts = seed_benchmark_data(
+                invoices=options['invoices'], companies=options['companies'],
+                products=options['products'], end_date=end_date, months=options['months'],
+            )
+
+            # 2. Time each report for one company over the last complete month
+            company = Company.objects.order_by('id').first()
+            results = run_report_benchmarks(company, start_date, end_date, only=options['reports'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        # 3. Store the run
+        run = {
+            'run_at': datetime.now().isoformat(timespec='seconds'),
+            'label': options['label'],
+            'database': connection.vendor,
+            'params': {k: options[k] for k in ('invoices', 'companies', 'products', 'months')},
+            'counts': counts,
+            'period': [start_date.isoformat(), end_date.isoformat()],
+            'results': results,
+        }
+        os.makedirs(options['output_dir'], exist_ok=True)
+        path = os.path.join(
+            options['output_dir'],
+            f"reports_{options['invoices']}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+        )
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(run, fh, indent=2)
+
+        for row in results:
+            self.stdout.write(
+                f"{row['report']:<14} {row['seconds']:>9.3f}s {row['queries']:>7} queries "
+                f"{row['peak_memory_bytes'] / 1e6:>8.1f} MB peak {row['output_bytes'] / 1e3:>9.1f} KB"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {path}"))
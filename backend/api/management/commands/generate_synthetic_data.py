@@ -0,0 +1,47 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.utils_synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a production-shaped synthetic dataset with COPY for benchmarking: companies, vendors, "
+        "products with platform aliases, purchase batches, Shopee / TikTok / Lazada invoices with skewed "
+        "product popularity, transactions and the stock ledger. Run on an idle database (ids are reserved "
+        "from the sequences). Postgres only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--companies', type=int, default=1)
+        parser.add_argument('--products', type=int, default=500, help="Products per company")
+        parser.add_argument('--invoices', type=int, default=100000, help="Invoices per company (about 1.5 lines each)")
+        parser.add_argument('--months', type=int, default=12, help="History length to spread documents over")
+        parser.add_argument(
+            '--end-date', type=lambda value: datetime.strptime(value, '%Y-%m-%d').date(), default=None,
+            metavar='YYYY-MM-DD', help="Last document date (default: today)",
+        )
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent of product popularity (0 = uniform)")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("generate_synthetic_data loads with COPY: Postgres only")
+
+        started = time.perf_counter()
+        counts = generate_dataset(
+            companies=options['companies'], products=options['products'], invoices=options['invoices'],
+            months=options['months'], end_date=options['end_date'], skew=options['skew'], seed=options['seed'],
+            log=self.stdout.write,
+        )
+        seconds = time.perf_counter() - started
+
+        for table, rows in counts.items():
+            self.stdout.write(f"{table:<18} {rows:>12,}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {seconds:.1f}s ({counts['invoice_items'] / seconds:,.0f} invoice lines/s). "
+            "Search documents: manage.py rebuild_search_documents"
+        ))
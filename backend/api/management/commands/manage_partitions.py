@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.utils_partitions import PARTITIONED_TABLES, detach_month, ensure_partitions, is_partitioned, list_partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Create upcoming monthly partitions of invoices / invoice_items (run from cron), "
+        "list them, or detach an old month for archiving"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=None, help="Months to create ahead (default: settings)")
+        parser.add_argument('--list', action='store_true', help="Show every partition and its range")
+        parser.add_argument(
+            '--detach', type=lambda value: datetime.strptime(value, '%Y-%m').date(), metavar='YYYY-MM',
+            help="Detach this month from both tables (DETACH ... CONCURRENTLY)",
+        )
+
+    def handle(self, *args, **options):
+        if not is_partitioned():
+            raise CommandError("invoices is not a partitioned table (Postgres only, see migration 0023)")
+
+        if options['detach']:
+            detached = detach_month(options['detach'])
+            if not detached:
+                raise CommandError(f"No partition for {options['detach']:%Y-%m}")
+            self.stdout.write(self.style.SUCCESS(f"Detached: {', '.join(detached)}"))
+            return
+
+        created = ensure_partitions(months_ahead=options['ahead'])
+        self.stdout.write(f"Partitions created: {', '.join(created) or 'none'}")
+
+        if options['list']:
+            for table in PARTITIONED_TABLES:
+                for name, bound in list_partitions(table):
+                    self.stdout.write(f"{name:<28} {bound}")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from api.models import SearchDocument
+from api.utils_search import SEARCH_DOCUMENTS, index_queryset
+
+
+class Command(BaseCommand):
+    help = "Rebuild the global-search documents for invoices, purchase orders and customers"
+
+    def handle(self, *args, **options):
+        SearchDocument.objects.all().delete()
+        for model, (resource, *_) in SEARCH_DOCUMENTS.items():
+            count = index_queryset(model.objects.all())
+            self.stdout.write(f"{resource}: {count} documents")
+        self.stdout.write(self.style.SUCCESS("Search documents rebuilt"))
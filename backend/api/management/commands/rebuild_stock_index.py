@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.utils_stock import build_stock_snapshots, rebuild_stock_movements
+
+
+class Command(BaseCommand):
+    help = "Rebuild the dated stock ledger and month-end stock snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--snapshots-only', action='store_true',
+            help="Only rebuild month-end snapshots (keep existing ledger rows)",
+        )
+        parser.add_argument(
+            '--upto', type=date.fromisoformat, default=None,
+            help="Build snapshots for months ending before this date (YYYY-MM-DD). Default: today",
+        )
+
+    def handle(self, *args, **options):
+        if not options['snapshots_only']:
+            count = rebuild_stock_movements()
+            self.stdout.write(f"Stock ledger rebuilt: {count} movements")
+
+        count = build_stock_snapshots(upto=options['upto'])
+        self.stdout.write(self.style.SUCCESS(f"Month-end snapshots built: {count}"))
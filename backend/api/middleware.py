@@ -0,0 +1,75 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+from .utils_metrics import REQUEST_SECONDS, REQUESTS
+from .utils_profiling import install_template_timer, record, start_profile, stop_profile
+
+
+class ProfilingMiddleware:
+    """
+    Per-request wall time, SQL count / time, duplicate queries and template render time.
+    Adds a Server-Timing header and keeps the newest requests in a per-process store
+    (utils_profiling), shown on /profiling/ (staff only).
+    Enabled with PROFILING_ENABLED; otherwise Django drops it from the chain at startup.
+    Keep it first in MIDDLEWARE so the wall time covers the other middleware too.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install_template_timer()
+
+    def __call__(self, request):
+        profile, token = start_profile()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile.execute):
+                response = self.get_response(request)
+        finally:
+            stop_profile(token)
+        total_ms = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        sql, repeats = profile.most_repeated()
+        record({
+            'endpoint': f"{request.method} /{match.route}" if match else f"{request.method} (unresolved)",
+            'path': request.get_full_path()[:300],
+            'status': response.status_code,
+            'total_ms': total_ms,
+            'sql_count': profile.sql_count,
+            'sql_ms': profile.sql_ms,
+            'duplicates': profile.duplicates,
+            'most_repeated': sql[:300] if repeats > 1 else '',
+            'most_repeated_count': repeats,
+            'template_ms': profile.template_ms,
+            'at': timezone.now(),
+        })
+        response['Server-Timing'] = profile.server_timing(total_ms)
+        return response
+
+
+class MetricsMiddleware:
+    """
+    Prometheus request count (by status: error rates) and latency per view, labelled with
+    the URL pattern so ids in paths don't create new series. Exposed on /metrics/.
+    Disabled with METRICS_ENABLED=False.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        match = request.resolver_match
+        view = f"/{match.route}" if match else '(unresolved)'
+        REQUEST_SECONDS.labels(view, request.method).observe(time.perf_counter() - start)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        return response
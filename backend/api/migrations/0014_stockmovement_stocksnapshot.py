@@ -0,0 +1,66 @@
+# Generated by Django 5.1.3 on 2026-10-19 13:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_alter_invoice_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='product',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='invoice_items', to='api.product'),
+        ),
+        migrations.AlterField(
+            model_name='purchaseitem',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchase_items', to='api.product'),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='category',
+            field=models.CharField(choices=[('REPAIR_SERVICE', 'ค่าซ่อมบริการ'), ('DELIVERY', 'ค่าส่งสินค้า'), ('SALARY', 'เงินเดือนพนักงาน'), ('RENT', 'ค่าเช่า'), ('UTILITY', 'ค่าสาธารณูปโภค'), ('MARKETING', 'ค่าโฆษณา'), ('OTHER', 'อื่นๆ')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='type',
+            field=models.CharField(choices=[('INCOME', 'รายรับ'), ('EXPENSE', 'รายจ่าย')], max_length=10),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_date', models.DateField()),
+                ('quantity', models.IntegerField()),
+                ('source', models.CharField(choices=[('PURCHASE', 'รับเข้า'), ('SALE', 'ขายออก')], max_length=20)),
+                ('company', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='api.company')),
+                ('invoice_item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movement', to='api.invoiceitem')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='api.product')),
+                ('purchase_item', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movement', to='api.purchaseitem')),
+            ],
+            options={
+                'db_table': 'stock_movements',
+                'indexes': [models.Index(fields=['product', 'movement_date'], name='stock_mov_product_date_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('snapshot_date', models.DateField()),
+                ('balance', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='api.product')),
+            ],
+            options={
+                'db_table': 'stock_snapshots',
+                'ordering': ['-snapshot_date'],
+                'unique_together': {('product', 'snapshot_date')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.3 on 2026-10-19 13:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_list_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['invoice_number'], name='invoice_number_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['platform_order_id'], name='invoice_order_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['platform_tracking_number'], name='invoice_tracking_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['grand_total'], name='invoice_grand_total_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+from django.db import migrations, models
+
+# Search-box columns (api.utils_search.SEARCH_FIELDS). The index expression matches
+# what icontains compiles to on Postgres: UPPER("col"::text) LIKE UPPER('%term%').
+TRIGRAM_COLUMNS = [
+    ('companies', 'name'),
+    ('customers', 'name'),
+    ('customers', 'phone'),
+    ('customers', 'tax_id'),
+    ('customers', 'email'),
+    ('vendors', 'name'),
+    ('vendors', 'contact_person'),
+    ('vendors', 'phone'),
+    ('products', 'name'),
+    ('products', 'sku'),
+    ('products', 'category'),
+    ('transactions', 'transaction_number'),
+    ('transactions', 'reference'),
+    ('transactions', 'description'),
+    ('purchase_orders', 'po_number'),
+    ('invoices', 'invoice_number'),
+    ('invoices', 'platform_order_id'),
+    ('invoices', 'platform_tracking_number'),
+]
+
+
+def trigram_available(connection):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # Postgres with contrib only: elsewhere (SQLite test runs, a server built
+    # without pg_trgm) search still works, as plain LIKE scans
+    if not trigram_available(schema_editor.connection):
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in TRIGRAM_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{table}_{column}_trgm" '
+            f'ON "{table}" USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TRIGRAM_COLUMNS:
+        schema_editor.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{table}_{column}_trgm"')
+
+
+class Migration(migrations.Migration):
+    # CONCURRENTLY: large tables stay writable while the indexes build
+    atomic = False
+
+    dependencies = [
+        ('api', '0019_invoice_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['amount'], name='transaction_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.3 on 2026-10-19 13:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_document_index(apps, schema_editor):
+    # Same guard as 0020: without pg_trgm, global search is a LIKE scan
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS "search_documents_document_trgm" '
+        'ON "search_documents" USING gin ("document" gin_trgm_ops)'
+    )
+
+
+def drop_document_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS "search_documents_document_trgm"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_trigram_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.CharField(max_length=200)),
+                ('subtitle', models.CharField(blank=True, max_length=300)),
+                ('document', models.TextField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('company', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.company')),
+            ],
+            options={
+                'db_table': 'search_documents',
+                'unique_together': {('resource', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_document_index, drop_document_index),
+    ]
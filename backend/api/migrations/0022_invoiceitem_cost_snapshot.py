@@ -0,0 +1,24 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+
+# Existing lines start at cost 0: run `manage.py backfill_invoice_costs` after migrating
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_searchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='total_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,162 @@
+import re
+from datetime import date
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+# Self-contained on purpose (migrations must not follow later edits of api.utils_partitions)
+PARTITION_KEY = 'invoice_date'
+MONTHS_AHEAD = 3
+MONTHS_BACK = 36  # Older rows share one "<table>_history" partition
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def copy_invoice_dates(apps, schema_editor):
+    Invoice = apps.get_model('api', 'Invoice')
+    InvoiceItem = apps.get_model('api', 'InvoiceItem')
+    InvoiceItem.objects.update(
+        invoice_date=Subquery(Invoice.objects.filter(pk=OuterRef('invoice_id')).values('invoice_date')[:1])
+    )
+
+
+def _definition(cursor, table):
+    """What CREATE TABLE ... LIKE doesn't carry over: indexes, FKs, a serial (non-identity) sequence."""
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s", [table]
+    )
+    indexes = [definition for name, definition in cursor.fetchall() if not name.endswith('_pkey')]
+    cursor.execute("SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'", [table])
+    foreign_keys = cursor.fetchall()
+    cursor.execute("SELECT attidentity FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'", [table])
+    identity = cursor.fetchone()[0]
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    return indexes, foreign_keys, identity, sequence
+
+
+def _move_rows(cursor, old, table, definition, primary_key):
+    """Copies the rows of `old` into `table`, drops `old`, then recreates keys and indexes on `table`."""
+    indexes, foreign_keys, identity, sequence = definition
+    overriding = 'OVERRIDING SYSTEM VALUE' if identity == 'a' else ''
+    cursor.execute(f'INSERT INTO "{table}" {overriding} SELECT * FROM "{old}"')
+    if not identity and sequence:
+        cursor.execute(f'ALTER SEQUENCE {sequence} OWNED BY "{table}".id')
+    cursor.execute(
+        f"""SELECT setval(pg_get_serial_sequence('"{table}"', 'id'), COALESCE((SELECT MAX(id) FROM "{table}"), 0) + 1, false)"""
+    )
+    cursor.execute(f'DROP TABLE "{old}"')  # With its partitions, when partitioned
+
+    # Created on the parent, so every partition gets them
+    cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ({primary_key})')
+    for index in indexes:
+        cursor.execute(re.sub(rf'\sON (ONLY )?(\S+\.)?"?{old}"?\s', f' ON "{table}" ', index, count=1))
+    for name, constraint in foreign_keys:
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {constraint}')
+
+
+def _partition(cursor, table, first, last):
+    """
+    Rebuilds `table` as PARTITION BY RANGE (invoice_date): copy the rows into the
+    partitioned table, then recreate indexes and outgoing FKs under their old names.
+    """
+    old = f'{table}_unpartitioned'
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    definition = _definition(cursor, old)
+
+    # Partitioned table + partitions (history, then one per month)
+    cursor.execute(
+        f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY) '
+        f'PARTITION BY RANGE ("{PARTITION_KEY}")'
+    )
+    cursor.execute(f"""CREATE TABLE "{table}_history" PARTITION OF "{table}" FOR VALUES FROM (MINVALUE) TO ('{first.isoformat()}')""")
+    month = first
+    while month <= last:
+        cursor.execute(
+            f'CREATE TABLE "{table}_p{month:%Y_%m}" PARTITION OF "{table}" '
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+        )
+        month = _add_months(month, 1)
+
+    _move_rows(cursor, old, table, definition, f'id, "{PARTITION_KEY}"')
+
+
+def _unpartition(cursor, table):
+    """Reverse of _partition(): every partition's rows back into one plain table keyed by id."""
+    old = f'{table}_partitioned'
+    cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{old}"')
+    definition = _definition(cursor, old)
+    cursor.execute(f'CREATE TABLE "{table}" (LIKE "{old}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING IDENTITY)')
+    _move_rows(cursor, old, table, definition, 'id')
+
+
+def partition_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT MIN("{PARTITION_KEY}"), MAX("{PARTITION_KEY}") FROM invoices')
+        oldest, newest = cursor.fetchone()
+        current = date.today().replace(day=1)
+        first = max((oldest or current).replace(day=1), _add_months(current, -MONTHS_BACK))
+        last = max(_add_months(current, MONTHS_AHEAD), (newest or current).replace(day=1))
+        for table in ('invoices', 'invoice_items'):
+            _partition(cursor, table, first, last)
+
+
+def unpartition_tables(apps, schema_editor):
+    """Detached (archived) months aren't partitions any more: re-attach them first to keep their rows."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in ('invoice_items', 'invoices'):
+            _unpartition(cursor, table)
+
+
+class Migration(migrations.Migration):
+    """
+    Range-partitions invoices and invoice_items by month on invoice_date (Postgres).
+    Rewrites both tables in one transaction: plan a maintenance window on large data.
+    Partitioned tables need the partition key in every unique constraint, so:
+    the primary keys become (id, invoice_date), FKs pointing at these tables are
+    enforced by Django only, and (company, invoice_number) moves to Invoice.validate_unique().
+    """
+
+    dependencies = [
+        ('api', '0022_invoiceitem_cost_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='invoice',
+            field=models.ForeignKey(db_constraint=False, on_delete=models.deletion.CASCADE, related_name='invoice_items', to='api.invoice'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='invoice_item',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=models.deletion.CASCADE, related_name='stock_movement', to='api.invoiceitem'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='invoice',
+            unique_together=set(),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'invoice_number'], name='invoice_company_number_idx'),
+        ),
+        migrations.AddField(
+            model_name='invoiceitem',
+            name='invoice_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(copy_invoice_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='invoiceitem',
+            name='invoice_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.RunPython(partition_tables, unpartition_tables),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_partition_invoices'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='invoice',
+            name='invoice_company_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['company', 'invoice_date', 'status'], name='invoice_co_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(fields=['product', 'invoice_date'], include=('quantity',), name='invoice_item_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(condition=models.Q(('product__isnull', True)), fields=['sku'], name='invoice_item_unmapped_sku_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseitem',
+            index=models.Index(condition=models.Q(('remaining_quantity__gt', 0)), fields=['product', 'id'], name='purchase_item_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['company', 'order_date'], name='po_company_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['company', 'transaction_date'], name='transaction_company_date_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('purchase_order_count', models.PositiveIntegerField(default=0)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('archived_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_periods', to='api.company')),
+            ],
+            options={
+                'db_table': 'archived_periods',
+                'ordering': ['-month'],
+                'unique_together': {('company', 'month')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedRows',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=50)),
+                ('row_count', models.PositiveIntegerField(default=0)),
+                ('data', models.BinaryField()),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.archivedperiod')),
+            ],
+            options={
+                'db_table': 'archived_rows',
+                'unique_together': {('period', 'table')},
+            },
+        ),
+    ]
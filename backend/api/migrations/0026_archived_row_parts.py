@@ -0,0 +1,26 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_archived_periods'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='archivedrows',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='archivedrows',
+            name='part',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedrows',
+            unique_together={('period', 'table', 'part')},
+        ),
+    ]
@@ -1,11 +1,13 @@
+from contextlib import nullcontext
+
 from django.db import models
 from django.contrib.auth.models import User
 
 from django.core.validators import MinValueValidator
 from django.utils import timezone
 from decimal import Decimal
-from django.db import migrations, models
-from django.db.models import Sum
+from django.db import IntegrityError, migrations, models, transaction
+from django.db.models import Q, Sum
 from django.db.models.functions import Coalesce
 
 
@@ -64,10 +66,15 @@ class Vendor(models.Model):
     tax_id = models.CharField(max_length=20, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'vendors'
         unique_together = ['company', 'name']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='vendor_updated_idx'),  # Change feed
+            models.Index(fields=['created_at', 'id'], name='vendor_created_id_idx'),  # List pages (keyset_paginate)
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.company})"
@@ -82,9 +89,14 @@ class Customer(models.Model):
     tax_id = models.CharField(max_length=20, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'customers'
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='customer_updated_idx'),  # Change feed
+            models.Index(fields=['company', 'created_at', 'id'], name='customer_company_created_idx'),  # List pages
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.company})"
@@ -108,10 +120,15 @@ class Product(models.Model):
     selling_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'products'
         unique_together = ['company', 'sku']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='product_updated_idx'),  # Change feed
+            models.Index(fields=['created_at', 'id'], name='product_created_id_idx'),  # List pages (keyset_paginate)
+        ]
     
     def __str__(self):
         return f"{self.sku} - {self.name} ({self.company})"
@@ -119,20 +136,11 @@ class Product(models.Model):
     @property
     def current_stock(self):
         """
-        Calculate current stock: Total Purchased - Total Sold.
+        Calculate current stock: Total Purchased - Total Sold, from the stock ledger.
+        The ledger keeps the rows of archived periods (utils_archive), the line tables don't.
         Uses Coalesce ensures we get 0 instead of None if no records exist.
         """
-        # Note: We use 'purchase_items' and 'invoice_items' here. 
-        # This requires related_name to be set in the child models (see below).
-        total_in = self.purchase_items.aggregate(
-            total=Coalesce(Sum('quantity'), 0)
-        )['total']
-        
-        total_out = self.invoice_items.aggregate(
-            total=Coalesce(Sum('quantity'), 0)
-        )['total']
-        
-        return total_in - total_out
+        return self.stock_movements.aggregate(total=Coalesce(Sum('quantity'), 0))['total']
 
 class PurchaseOrder(models.Model):
     """Purchase order from vendors"""
@@ -177,6 +185,10 @@ class PurchaseOrder(models.Model):
         db_table = 'purchase_orders'
         #unique_together = ['company', 'po_number'] # Changed 12-12-2025 Allow duplicate PO numbers for testing
         ordering = ['-order_date']
+        indexes = [
+            models.Index(fields=['order_date', 'id'], name='po_date_id_idx'),  # List pages (keyset_paginate)
+            models.Index(fields=['company', 'order_date'], name='po_company_date_idx'),  # Purchase tax report
+        ]
     
     def __str__(self):
         return f"{self.po_number} ({self.company})"
@@ -185,7 +197,12 @@ class PurchaseOrder(models.Model):
         """Calculate order totals from items"""
         from .models import PurchaseItem
         items = PurchaseItem.objects.filter(purchase_order=self)
-        self.subtotal = sum(item.total_price for item in items)
+        self.apply_totals(sum(item.total_price for item in items))
+        self.save()
+
+    def apply_totals(self, subtotal):
+        """Set subtotal/tax/total in memory (no save). Also used by bulk inserts."""
+        self.subtotal = subtotal
         # Assuming 7% VAT for Thailand
         if self.tax_include:
             self.tax_amount = self.subtotal - (self.subtotal / (1 + self.tax_percent / 100))
@@ -193,7 +210,6 @@ class PurchaseOrder(models.Model):
             self.tax_amount = self.subtotal * (self.tax_percent / 100)
         
         self.total_amount = self.subtotal + self.tax_amount
-        self.save()
     
     def get_item_count(self):
         """Get item count without using reverse relation in property"""
@@ -213,6 +229,10 @@ class PurchaseItem(models.Model):
     
     class Meta:
         db_table = 'purchase_items'
+        indexes = [
+            # Open batches of a product in FIFO order (allocation, batch dropdown); sold-out batches aren't indexed
+            models.Index(fields=['product', 'id'], name='purchase_item_open_idx', condition=Q(remaining_quantity__gt=0)),
+        ]
     
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
@@ -228,6 +248,10 @@ class PurchaseItem(models.Model):
         super().save(*args, **kwargs)
         # Update purchase order totals
         self.purchase_order.calculate_totals()
+
+        # Keep the dated stock ledger in sync
+        from .utils_stock import sync_stock_movements
+        sync_stock_movements(purchase_items=PurchaseItem.objects.filter(pk=self.pk))
     
     @property
     def available_quantity(self):
@@ -285,12 +309,65 @@ class Invoice(models.Model):
     warehouse_name = models.CharField(max_length=100, blank=True) 
     
     class Meta:
+        # On Postgres, invoices and invoice_items are range-partitioned by month on
+        # invoice_date (migration 0023, utils_partitions): the primary key is
+        # (id, invoice_date) and (company, invoice_number) is checked in validate_unique()
         db_table = 'invoices'
-        unique_together = ['company', 'invoice_number']
         ordering = ['-invoice_date']
+        indexes = [
+            models.Index(fields=['company', 'invoice_number'], name='invoice_company_number_idx'),
+            # API filters / cursor ordering (see InvoiceAPIMixin, InvoiceCursorPagination)
+            models.Index(fields=['invoice_date', 'id'], name='invoice_date_id_idx'),
+            models.Index(fields=['company', 'invoice_date', 'status'], name='invoice_co_date_status_idx'),
+            models.Index(fields=['status', 'invoice_date'], name='invoice_status_date_idx'),
+            models.Index(fields=['platform_name', 'invoice_date'], name='invoice_platform_date_idx'),
+            models.Index(fields=['updated_at', 'id'], name='invoice_updated_idx'),  # Change feed
+            # Invoice table column filters (InvoiceFilterForm): prefix LIKE + amount threshold
+            models.Index(fields=['invoice_number'], name='invoice_number_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['platform_order_id'], name='invoice_order_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['platform_tracking_number'], name='invoice_tracking_prefix_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['grand_total'], name='invoice_grand_total_idx'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} ({self.company})"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_invoice_date = instance.__dict__.get('invoice_date')
+        instance._loaded_number = (instance.__dict__.get('company_id'), instance.__dict__.get('invoice_number'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .utils_partitions import ensure_partitions_for, lock_invoice_numbers
+        ensure_partitions_for([self.invoice_date])  # No 500 for a month without a partition
+        number = (self.company_id, self.invoice_number)
+        claim = number != getattr(self, '_loaded_number', None)  # New, or number / company changed
+        with transaction.atomic() if claim else nullcontext():
+            if claim:
+                # No unique index on a partitioned table: check under a lock held until commit.
+                # IntegrityError, so update_or_create() / get_or_create() fetch the winner's row.
+                lock_invoice_numbers([number])
+                if Invoice.objects.filter(company_id=self.company_id, invoice_number=self.invoice_number).exclude(pk=self.pk).exists():
+                    raise IntegrityError(f"Invoice {self.invoice_number} already exists for company {self.company_id}.")
+            super().save(*args, **kwargs)
+        # Lines carry the date too (their partition key): move them with the header
+        loaded = getattr(self, '_loaded_invoice_date', None)
+        if loaded is not None and loaded != self.invoice_date:
+            InvoiceItem.objects.filter(invoice=self).update(invoice_date=self.invoice_date)
+        self._loaded_invoice_date = self.invoice_date
+        self._loaded_number = number
+
+    def validate_unique(self, exclude=None):
+        """(company, invoice_number) is unique: a partitioned table can't enforce it without invoice_date."""
+        super().validate_unique(exclude=exclude)
+        if exclude and ('company' in exclude or 'invoice_number' in exclude):
+            return
+        duplicate = Invoice.objects.filter(company_id=self.company_id, invoice_number=self.invoice_number).exclude(pk=self.pk)
+        if self.company_id and duplicate.exists():
+            from django.core.exceptions import ValidationError
+            raise ValidationError({'invoice_number': f"Invoice {self.invoice_number} already exists."})
     
     def calculate_totals(self):
         """
@@ -299,7 +376,12 @@ class Invoice(models.Model):
         """
         from .models import InvoiceItem
         items = InvoiceItem.objects.filter(invoice=self)
-        self.subtotal = sum(item.total_price for item in items)
+        self.apply_totals(sum(item.total_price for item in items))
+        self.save()
+
+    def apply_totals(self, subtotal):
+        """Set subtotal/tax/grand total in memory (no save). Also used by bulk inserts."""
+        self.subtotal = subtotal
 
         if self.tax_include:
             # Reverse Calc: Tax = Subtotal - (Subtotal / 1.07)
@@ -316,8 +398,6 @@ class Invoice(models.Model):
             self.grand_total = self.subtotal + self.shipping_cost - self.discount_amount
         else:
             self.grand_total = self.subtotal + self.tax_amount + self.shipping_cost - self.discount_amount
-            
-        self.save()
     
     def get_item_count(self):
         """Get item count without using reverse relation in property"""
@@ -329,29 +409,54 @@ class Invoice(models.Model):
     def get_profit_margin(self):
         """Calculate profit margin for this invoice"""
         from .models import InvoiceItem
-        items = InvoiceItem.objects.filter(invoice=self)
-        total_cost = sum(item.total_cost for item in items)
+        total_cost = InvoiceItem.objects.filter(invoice=self).aggregate(total=Coalesce(Sum('total_cost'), Decimal('0')))['total']
         return self.subtotal - total_cost
     
     profit_margin = property(get_profit_margin)
 
 class InvoiceItem(models.Model):
     """Individual items in an invoice with purchase item tracking"""
-    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='invoice_items')
+    # No DB-level FK: invoices is partitioned, its unique keys include invoice_date (cascade runs in Django)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='invoice_items', db_constraint=False)
     product = models.ForeignKey(Product, on_delete=models.PROTECT, null=True, blank=True, related_name='invoice_items')
     purchase_item = models.ForeignKey(PurchaseItem, on_delete=models.PROTECT, related_name='invoice_items', null=True, blank=True)
 
+    # Copy of invoice.invoice_date: the partition key of invoice_items (kept in sync by Invoice.save())
+    invoice_date = models.DateField(editable=False)
+
     sku = models.CharField(max_length=100, blank=True)  # Store platform SKU/name for reference
     item_name = models.TextField(blank=True)    
     quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
     total_price = models.DecimalField(max_digits=12, decimal_places=2, editable=False)
+
+    # Batch cost frozen when the batch is assigned: margins don't follow later
+    # edits of PurchaseItem.unit_cost, and COGS is a plain Sum over this table
+    unit_cost = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    total_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
     
     class Meta:
         db_table = 'invoice_items'
+        indexes = [
+            # Units sold per product and period (stock report), answered from the index alone
+            models.Index(fields=['product', 'invoice_date'], name='invoice_item_product_date_idx', include=['quantity']),
+            # Mapping screen: only unmapped platform lines, looked up by their external key
+            models.Index(fields=['sku'], name='invoice_item_unmapped_sku_idx', condition=Q(product__isnull=True)),
+        ]
     
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Batch as loaded: save() re-freezes the cost only when this changes
+        instance._loaded_purchase_item_id = instance.__dict__.get('purchase_item_id')
+        return instance
+
+    def set_cost(self, unit_cost):
+        self.unit_cost = unit_cost or Decimal('0')
+        self.total_cost = self.quantity * self.unit_cost
     
     def clean(self):
         """Validate that purchase item has enough quantity"""
@@ -365,6 +470,14 @@ class InvoiceItem(models.Model):
     def save(self, *args, **kwargs):
         # 1. Ensure total_price is set (vital for manual saves)
         self.total_price = self.quantity * self.unit_price
+        self.invoice_date = self.invoice.invoice_date
+
+        # 1b. Cost snapshot: taken when the batch is assigned or changed
+        if self.pk is None or self.purchase_item_id != getattr(self, '_loaded_purchase_item_id', None):
+            self.set_cost(self.purchase_item.unit_cost if self.purchase_item_id else None)
+            self._loaded_purchase_item_id = self.purchase_item_id
+        else:
+            self.set_cost(self.unit_cost)
         
         # 2. Validate
         self.clean()
@@ -386,17 +499,11 @@ class InvoiceItem(models.Model):
         # 4. Trigger Parent Update
         self.invoice.calculate_totals()
 
-    # --- SAFE PROPERTIES ---
-    @property
-    def unit_cost(self):
-        if self.purchase_item:
-            return self.purchase_item.unit_cost
-        return 0 # Or Decimal(0)
-
-    @property
-    def total_cost(self):
-        return self.quantity * self.unit_cost
+        # 5. Keep the dated stock ledger in sync
+        from .utils_stock import sync_stock_movements
+        sync_stock_movements(invoice_items=InvoiceItem.objects.filter(pk=self.pk))
 
+    # --- SAFE PROPERTIES (from the frozen cost, no batch lookup) ---
     @property
     def profit(self):
         return self.total_price - self.total_cost
@@ -434,11 +541,18 @@ class Transaction(models.Model):
     reference = models.CharField(max_length=100, blank=True)  # For external reference
     created_by = models.ForeignKey('auth.User', on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         db_table = 'transactions'
         unique_together = ['company', 'transaction_number']
         ordering = ['-transaction_date']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='transaction_updated_idx'),  # Change feed
+            models.Index(fields=['transaction_date', 'id'], name='transaction_date_id_idx'),  # List pages
+            models.Index(fields=['company', 'transaction_date'], name='transaction_company_date_idx'),  # P&L
+            models.Index(fields=['amount'], name='transaction_amount_idx'),  # Search box: exact amount
+        ]
     
     def __str__(self):
         return f"{self.transaction_number} - {self.description} ({self.company})"
@@ -519,3 +633,152 @@ class ProductAlias(models.Model):
 
     def __str__(self):
         return f"{self.external_key} -> {self.product.name}"
+
+
+class StockMovement(models.Model):
+    """
+    Dated stock ledger. One row per purchase line (+qty) or invoice line (-qty),
+    kept in sync by utils_stock so historical balances don't need the full history.
+    """
+    SOURCE_CHOICES = [
+        ('PURCHASE', 'รับเข้า'),
+        ('SALE', 'ขายออก'),
+    ]
+
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='stock_movements', null=True, blank=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_movements')
+    movement_date = models.DateField()
+    quantity = models.IntegerField()  # Signed: positive = in, negative = out
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+
+    # Source line (deleting the line removes its movement automatically)
+    purchase_item = models.OneToOneField(PurchaseItem, on_delete=models.CASCADE, related_name='stock_movement', null=True, blank=True)
+    invoice_item = models.OneToOneField(InvoiceItem, on_delete=models.CASCADE, related_name='stock_movement', null=True, blank=True,
+                                        db_constraint=False)  # invoice_items is partitioned (see Invoice.Meta)
+
+    class Meta:
+        db_table = 'stock_movements'
+        indexes = [
+            models.Index(fields=['product', 'movement_date'], name='stock_mov_product_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.movement_date} {self.product_id} {self.quantity:+d}"
+
+class StockSnapshot(models.Model):
+    """
+    Periodic (month-end) stock balance checkpoint per product.
+    Balance as of any date = latest snapshot <= date + movements after it.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    snapshot_date = models.DateField()
+    balance = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'stock_snapshots'
+        unique_together = ['product', 'snapshot_date']
+        ordering = ['-snapshot_date']
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.snapshot_date}: {self.balance}"
+
+
+class Tombstone(models.Model):
+    """
+    Deleted row marker for the change feed (utils_changes), written by a post_delete signal.
+    No FK constraints: the referenced rows (and maybe the company) are already gone.
+    """
+    resource = models.CharField(max_length=50)  # Feed name, e.g. 'invoices'
+    object_id = models.BigIntegerField()
+    company = models.ForeignKey(Company, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'tombstones'
+        indexes = [
+            models.Index(fields=['resource', 'deleted_at', 'id'], name='tombstone_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.resource}#{self.object_id} deleted {self.deleted_at}"
+
+
+class DataVersion(models.Model):
+    """
+    Counter per (resource, company), bumped whenever a row of that resource is saved
+    or deleted (see utils_versions). List/detail pages derive their ETag from it.
+    """
+    resource = models.CharField(max_length=50)
+    company = models.ForeignKey(Company, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'data_versions'
+        unique_together = ['resource', 'company']
+
+    def __str__(self):
+        return f"{self.resource}/{self.company_id}: v{self.version}"
+
+
+class SearchDocument(models.Model):
+    """
+    Denormalized global-search row per invoice / purchase order / customer (see utils_search).
+    `document` holds the normalized identifiers as |TOKEN|TOKEN|, trigram-indexed on Postgres.
+    """
+    resource = models.CharField(max_length=50)  # 'invoices', 'purchase_orders', 'customers'
+    object_id = models.BigIntegerField()
+    company = models.ForeignKey(Company, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+')
+    title = models.CharField(max_length=200)
+    subtitle = models.CharField(max_length=300, blank=True)
+    document = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'search_documents'
+        unique_together = ['resource', 'object_id']
+
+    def __str__(self):
+        return f"{self.resource}#{self.object_id}: {self.title}"
+
+
+class ArchivedPeriod(models.Model):
+    """
+    A closed tax month of one company whose invoices and (sold-out) purchase orders
+    were moved out of the hot tables into compressed ArchivedRows (see utils_archive).
+    Reports over this month read the archive; restore_period() moves the rows back.
+    """
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='archived_periods')
+    month = models.DateField()  # First day of the month
+    invoice_count = models.PositiveIntegerField(default=0)
+    purchase_order_count = models.PositiveIntegerField(default=0)
+    archived_by = models.ForeignKey('auth.User', on_delete=models.PROTECT, null=True, blank=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'archived_periods'
+        unique_together = ['company', 'month']
+        ordering = ['-month']
+
+    def __str__(self):
+        return f"{self.company} {self.month:%Y-%m} (archived)"
+
+
+class ArchivedRows(models.Model):
+    """
+    Rows of one table for an ArchivedPeriod: gzip'd JSON lines keyed by column, split into
+    parts of utils_archive.ARCHIVE_CHUNK_ROWS rows so a large month never sits in memory at once.
+    """
+    period = models.ForeignKey(ArchivedPeriod, on_delete=models.CASCADE, related_name='chunks')
+    table = models.CharField(max_length=50)  # db_table of the archived model
+    part = models.PositiveIntegerField(default=0)
+    row_count = models.PositiveIntegerField(default=0)
+    data = models.BinaryField()
+
+    class Meta:
+        db_table = 'archived_rows'
+        unique_together = ['period', 'table', 'part']
+
+    def __str__(self):
+        return f"{self.period}: {self.table} #{self.part} x {self.row_count}"
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class InvoiceCursorPagination(CursorPagination):
+    """
+    Seek pagination on (invoice_date, id): every page is one indexed range scan,
+    no COUNT(*) and no OFFSET, however deep the client pages.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-invoice_date', '-id')
@@ -1,6 +1,12 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import User
+from django.db import transaction
 from rest_framework import serializers
-from .models import Note
+from rest_framework.validators import UniqueTogetherValidator
+from .models import Invoice, InvoiceItem, Note, PurchaseItem, PurchaseOrder
+from .utils_allocation import StockAllocationError, allocate_invoice_items, release_invoice_items
+from .utils_stock import delete_stock_movements, sync_stock_movements
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,4 +24,174 @@ class NoteSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'title', 'content', 'created_at', 'updated_at']
         read_only_fields = ['user', 'created_at', 'updated_at'] # user will be set from request, timestamps are read-only
         extra_kwargs = {"user": {"read_only": True}}
-    
\ No newline at end of file
+    
+
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    Lets clients pick fields with ?fields=a,b,c (unknown names are ignored).
+    Views can check requested_fields() to skip joins for fields that were not asked for.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        wanted = requested_fields(request)
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+def requested_fields(request):
+    raw = request.query_params.get('fields', '')
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+class InvoiceItemSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InvoiceItem
+        fields = ['id', 'product', 'purchase_item', 'sku', 'item_name', 'quantity', 'unit_price', 'total_price',
+                  'unit_cost', 'total_cost']
+        read_only_fields = ['total_price', 'unit_cost', 'total_cost']
+
+
+class InvoiceSerializer(DynamicFieldsModelSerializer):
+    """
+    Invoice with nested lines. On write, `items` (if sent) replaces all lines:
+    stock is restored for the old lines and deducted for the new ones (blank batch = FIFO).
+    """
+    customer_name = serializers.CharField(source='customer.name', read_only=True, default=None)
+    items = InvoiceItemSerializer(source='invoice_items', many=True, required=False)
+
+    class Meta:
+        model = Invoice
+        fields = [
+            'id', 'invoice_number', 'company', 'customer', 'customer_name', 'invoice_date', 'status',
+            'tax_include', 'tax_percent', 'tax_amount', 'subtotal', 'discount_amount', 'shipping_cost', 'grand_total',
+            'notes', 'platform_name', 'platform_order_id', 'platform_order_status', 'platform_tracking_number',
+            'recipient_name', 'recipient_phone', 'recipient_address', 'warehouse_name',
+            'created_at', 'updated_at', 'items',
+        ]
+        read_only_fields = ['tax_amount', 'subtotal', 'grand_total', 'created_at', 'updated_at']
+        # Model default is int 7, which breaks Decimal math in calculate_totals()
+        extra_kwargs = {'tax_percent': {'default': Decimal('7')}}
+        # Not a DB constraint since invoices is partitioned (see Invoice.Meta)
+        validators = [UniqueTogetherValidator(queryset=Invoice.objects.all(), fields=['company', 'invoice_number'])]
+
+    def validate_items(self, items):
+        for item in items:
+            batch = item.get('purchase_item')
+            if batch and item.get('product') and batch.product_id != item['product'].pk:
+                raise serializers.ValidationError(f"Batch {batch} does not belong to product {item['product']}")
+        return items
+
+    def create(self, validated_data):
+        items = validated_data.pop('invoice_items', [])
+        with transaction.atomic():
+            invoice = Invoice.objects.create(**validated_data)
+            self.replace_items(invoice, items)
+        return invoice
+
+    def update(self, instance, validated_data):
+        items = validated_data.pop('invoice_items', None)
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if items is not None:
+                self.replace_items(instance, items)
+            else:
+                # invoice_date may have changed
+                sync_stock_movements(invoice_items=InvoiceItem.objects.filter(invoice=instance))
+        return instance
+
+    def replace_items(self, invoice, items):
+        # 1. Restore stock held by the current lines
+        old_lines = invoice.invoice_items.all()
+        release_invoice_items(old_lines)
+        delete_stock_movements(invoice_items=old_lines)
+        old_lines.delete()
+
+        # 2. Allocate the new lines (same service as invoice_view: locked FIFO, may split across batches)
+        try:
+            allocate_invoice_items(invoice, [InvoiceItem(invoice=invoice, **data) for data in items])
+        except StockAllocationError as e:
+            raise serializers.ValidationError({'items': str(e)})
+
+
+# --- Bulk endpoints ---
+# Relations are plain ids here; utils_bulk checks them with one query per model
+# instead of one query per document (and uniqueness is checked there too).
+
+class BulkInvoiceItemSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField(required=False, allow_null=True)
+    purchase_item = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta:
+        model = InvoiceItem
+        fields = ['product', 'purchase_item', 'sku', 'item_name', 'quantity', 'unit_price']
+
+
+class BulkInvoiceSerializer(serializers.ModelSerializer):
+    company = serializers.IntegerField()
+    customer = serializers.IntegerField(required=False, allow_null=True)
+    items = BulkInvoiceItemSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = Invoice
+        fields = [
+            'invoice_number', 'company', 'customer', 'invoice_date', 'status',
+            'tax_include', 'tax_percent', 'discount_amount', 'shipping_cost', 'notes',
+            'platform_name', 'platform_order_id', 'platform_order_status', 'platform_tracking_number',
+            'recipient_name', 'recipient_phone', 'recipient_address', 'warehouse_name', 'items',
+        ]
+        extra_kwargs = {'tax_percent': {'default': Decimal('7')}}
+        validators = []
+
+
+class BulkInvoiceUpdateSerializer(BulkInvoiceSerializer):
+    """Full replacement of an existing invoice (header + lines), addressed by id."""
+    id = serializers.IntegerField()
+
+    class Meta(BulkInvoiceSerializer.Meta):
+        fields = ['id'] + BulkInvoiceSerializer.Meta.fields
+
+
+class BulkPurchaseItemSerializer(serializers.ModelSerializer):
+    product = serializers.IntegerField()
+
+    class Meta:
+        model = PurchaseItem
+        fields = ['product', 'quantity', 'unit_cost']
+
+
+class BulkPurchaseOrderSerializer(serializers.ModelSerializer):
+    company = serializers.IntegerField()
+    vendor = serializers.IntegerField()
+    items = BulkPurchaseItemSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = PurchaseOrder
+        fields = [
+            'po_number', 'company', 'vendor', 'purchase_type', 'order_date', 'vendor_invoice_number',
+            'expected_delivery_date', 'status', 'tax_include', 'tax_percent', 'discount_amount', 'notes', 'items',
+        ]
+        extra_kwargs = {'tax_percent': {'default': Decimal('7')}}
+        validators = []
+
+
+class BulkPurchaseItemUpdateSerializer(BulkPurchaseItemSerializer):
+    """A line with an id edits that batch; without one it adds a batch."""
+    id = serializers.IntegerField(required=False, allow_null=True)
+
+    class Meta(BulkPurchaseItemSerializer.Meta):
+        fields = ['id'] + BulkPurchaseItemSerializer.Meta.fields
+
+
+class BulkPurchaseOrderUpdateSerializer(BulkPurchaseOrderSerializer):
+    """Full replacement of an existing purchase order (header + batches), addressed by id."""
+    id = serializers.IntegerField()
+    items = BulkPurchaseItemUpdateSerializer(many=True, allow_empty=False)
+
+    class Meta(BulkPurchaseOrderSerializer.Meta):
+        fields = ['id'] + BulkPurchaseOrderSerializer.Meta.fields
@@ -0,0 +1,43 @@
+from django.db.models.signals import post_delete, post_save
+
+from .models import PurchaseItem, SearchDocument, Tombstone
+from .utils_changes import CHANGE_FEEDS, feed_for_model
+from .utils_search import SEARCH_DOCUMENTS, index_documents
+from .utils_stock import invalidate_open_batches
+from .utils_versions import VERSIONED_MODELS, bump_for_instance
+
+
+def record_tombstone(sender, instance, **kwargs):
+    """Deleted rows of change-feed models leave a Tombstone for clients syncing with a cursor."""
+    Tombstone.objects.create(resource=feed_for_model(sender), object_id=instance.pk, company_id=instance.company_id)
+
+
+def update_search_document(sender, instance, raw=False, **kwargs):
+    """Keeps the global-search row of an invoice / PO / customer current (saves and imports)."""
+    if not raw:
+        index_documents([instance])
+
+
+def delete_search_document(sender, instance, **kwargs):
+    SearchDocument.objects.filter(resource=SEARCH_DOCUMENTS[sender][0], object_id=instance.pk).delete()
+
+
+def invalidate_batch_dropdown(sender, instance, **kwargs):
+    """Any saved / deleted batch may change its product's open-batch list."""
+    invalidate_open_batches([instance.product_id])
+
+
+# Connected per model (not globally) so other models keep Django's fast-delete path
+for _model, _ in CHANGE_FEEDS.values():
+    post_delete.connect(record_tombstone, sender=_model, dispatch_uid=f"tombstone_{_model.__name__}")
+
+for _model in VERSIONED_MODELS:
+    post_save.connect(bump_for_instance, sender=_model, dispatch_uid=f"data_version_save_{_model.__name__}")
+    post_delete.connect(bump_for_instance, sender=_model, dispatch_uid=f"data_version_delete_{_model.__name__}")
+
+for _model in SEARCH_DOCUMENTS:
+    post_save.connect(update_search_document, sender=_model, dispatch_uid=f"search_document_save_{_model.__name__}")
+    post_delete.connect(delete_search_document, sender=_model, dispatch_uid=f"search_document_delete_{_model.__name__}")
+
+post_save.connect(invalidate_batch_dropdown, sender=PurchaseItem, dispatch_uid="open_batches_save")
+post_delete.connect(invalidate_batch_dropdown, sender=PurchaseItem, dispatch_uid="open_batches_delete")
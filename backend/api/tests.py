@@ -1,4 +1,43 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Sum
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from .models import ArchivedPeriod, Company, Customer, DataVersion, Note, SearchDocument, Vendor, Product, ProductAlias, ProductMapping, PurchaseOrder, PurchaseItem, Invoice, InvoiceItem, StockMovement, StockSnapshot, Tombstone, Transaction
+from .utils_allocation import StockAllocationError, allocate_invoice_items, release_invoice_items
+from .utils_archive import ArchiveError, archive_period, archived_stock_quantities, restore_period, with_archived
+from .utils_benchmark import run_report_benchmarks, seed_benchmark_data
+from .utils_paging import keyset_paginate
+from .utils_partitions import detach_month, ensure_partitions, ensure_partitions_for, is_partitioned, list_partitions
+from .utils_pdf import InvoicePdfRenderer, _store_invoice_pdf, get_pdf_renderer, invoice_pdf_cache_key, invoice_pdf_path, render_invoice_html, static_url_fetcher
+from .utils_pnl import build_profit_and_loss, generate_pnl_report, load_pnl_frames
+from .utils_metrics import METRICS_CONTENT_TYPE
+from .utils_profiling import clear as clear_profiles, recent_requests, start_profile, stop_profile
+from .utils_search import global_search, index_queryset, search, trigram_columns
+from .utils_stock import build_stock_snapshots, get_open_batches, get_stock_balances_as_of, rebuild_stock_movements, sync_stock_movements, with_current_stock
+from .utils_synthetic import generate_dataset
 #from .models import Product, ProductMapping
 #from .utils_import_core import process_shopee_orders
 from .utils_processors import process_shopee_orders,process_lazada_orders
@@ -54,4 +93,1371 @@ class LazadaOrderProcessingTestCase(TestCase):
         # Check if expected columns are present in items
         expected_item_columns = ['order_id', 'sku', 'item_name', 'quantity', 'unit_price']
         for col in expected_item_columns:
-            self.assertIn(col, items.columns, f"Column '{col}' should be in items dataframe")
\ No newline at end of file
+            self.assertIn(col, items.columns, f"Column '{col}' should be in items dataframe")
+
+class InventoryFixtureMixin:
+    """One product, one batch of 10 @ 100, two billed invoices selling 3 + 2 @ 150."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='stock', password='x')
+        self.company = Company.objects.create(name='NMK')
+        vendor = Vendor.objects.create(company=self.company, name='Vendor A')
+        self.product = Product.objects.create(company=self.company, sku='SKU-1', name='Phone', category='SMARTPHONE')
+
+        po = PurchaseOrder.objects.create(company=self.company, po_number='PO-1', vendor=vendor,
+                                          order_date=date(2025, 1, 10), created_by=self.user,
+                                          tax_percent=Decimal('7'))
+        self.batch = PurchaseItem.objects.create(purchase_order=po, product=self.product, quantity=10, unit_cost=100)
+
+        for number, day, qty in [('INV-1', date(2025, 1, 20), 3), ('INV-2', date(2025, 2, 5), 2)]:
+            inv = Invoice.objects.create(company=self.company, invoice_number=number, invoice_date=day,
+                                         created_by=self.user, status='BILLED', tax_percent=Decimal('7'))
+            InvoiceItem.objects.create(invoice=inv, product=self.product, purchase_item=self.batch,
+                                       quantity=qty, unit_price=150)
+
+
+class StockLedgerTestCase(InventoryFixtureMixin, TestCase):
+    """Point-in-time balances from the stock ledger must match a full-history sum."""
+
+    def test_balance_as_of_with_and_without_snapshots(self):
+        expected = {date(2025, 1, 15): 10, date(2025, 1, 31): 7, date(2025, 2, 28): 5}
+        for as_of, balance in expected.items():
+            self.assertEqual(get_stock_balances_as_of(as_of)[self.product.pk], balance)
+
+        build_stock_snapshots(upto=date(2025, 3, 1))
+        self.assertEqual(StockSnapshot.objects.get(product=self.product, snapshot_date=date(2025, 1, 31)).balance, 7)
+        for as_of, balance in expected.items():
+            self.assertEqual(get_stock_balances_as_of(as_of)[self.product.pk], balance)
+
+    def test_backdated_sale_invalidates_later_snapshots(self):
+        build_stock_snapshots(upto=date(2025, 3, 1))
+        inv = Invoice.objects.create(company=self.company, invoice_number='INV-3', invoice_date=date(2025, 1, 25),
+                                     created_by=self.user, tax_percent=Decimal('7'))
+        InvoiceItem.objects.create(invoice=inv, product=self.product, quantity=1, unit_price=150)
+
+        self.assertFalse(StockSnapshot.objects.filter(product=self.product, snapshot_date__gte=date(2025, 1, 25)).exists())
+        self.assertEqual(get_stock_balances_as_of(date(2025, 2, 28))[self.product.pk], 4)
+
+    def test_reimport_moving_an_order_invalidates_its_old_snapshots(self):
+        import pandas as pd
+        from .utils_import_core import universal_invoice_import
+
+        ProductAlias.objects.create(external_key='Phone (Shopee)', product=self.product, platform='SHOPEE')
+        items = pd.DataFrame([{'order_id': 'ORD-1', 'item_name': 'Phone (Shopee)', 'quantity': '2', 'unit_price': '150'}])
+
+        def run(shipped):
+            header = pd.DataFrame([{'order_id': 'ORD-1', 'total_amount': '300', 'subtotal': '300', 'shipped_date': shipped}])
+            result = universal_invoice_import(header, items.copy(), self.company.pk, self.user.pk, 'Shopee')
+            self.assertEqual((result['imported'], result['failed']), (1, 0), result)
+
+        run('2025-01-10')
+        build_stock_snapshots(upto=date(2025, 3, 1))
+        self.assertEqual(get_stock_balances_as_of(date(2025, 1, 31))[self.product.pk], 5)
+        run('2025-02-20')  # Same order, now shipped in February
+        self.assertEqual(get_stock_balances_as_of(date(2025, 1, 31))[self.product.pk], 7)
+        self.assertEqual(get_stock_balances_as_of(date(2025, 2, 28))[self.product.pk], 3)
+
+
+class ProfitAndLossTestCase(InventoryFixtureMixin, TestCase):
+    """P&L engine: 5 units sold at 150 from a batch costing 100."""
+
+    def test_profit_and_loss_summary(self):
+        Transaction.objects.create(company=self.company, transaction_number='TX-1', transaction_date=date(2025, 1, 15),
+                                   type='EXPENSE', category='RENT', amount=Decimal('100'), description='rent',
+                                   created_by=self.user)
+
+        pnl = build_profit_and_loss(self.company, date(2025, 1, 1), date(2025, 2, 28))
+        self.assertEqual(pnl['summary']['revenue'], 750)
+        self.assertEqual(pnl['summary']['cogs'], 500)
+        self.assertEqual(pnl['summary']['expenses'], 100)
+        self.assertEqual(pnl['summary']['net_profit'], 150)
+        self.assertEqual(pnl['by_channel'][0]['channel'], 'Offline')
+        self.assertEqual(pnl['by_category'][0]['category'], 'SMARTPHONE')
+
+        response = generate_pnl_report(self.company, date(2025, 1, 1), date(2025, 2, 28))
+        self.assertTrue(response['Content-Disposition'].endswith('.xlsx"'))
+
+    def test_line_cost_is_frozen_until_backfilled(self):
+        line = InvoiceItem.objects.get(invoice__invoice_number='INV-1')
+        self.assertEqual((line.unit_cost, line.total_cost), (Decimal('100.00'), Decimal('300.00')))
+
+        self.batch.unit_cost = 130
+        self.batch.save()
+        line.quantity = 4
+        line.save()  # Same batch: the cost stays frozen
+        line.refresh_from_db()
+        self.assertEqual((line.unit_cost, line.total_cost), (Decimal('100.00'), Decimal('400.00')))
+        self.assertEqual(build_profit_and_loss(self.company, date(2025, 1, 1), date(2025, 2, 28))['summary']['cogs'], 600)
+
+        call_command('backfill_invoice_costs', stdout=io.StringIO())
+        self.assertEqual(build_profit_and_loss(self.company, date(2025, 1, 1), date(2025, 2, 28))['summary']['cogs'], 780)
+
+
+class ReportBenchmarkTestCase(TestCase):
+    """Smoke test for the benchmark harness at a tiny scale."""
+
+    def test_seed_and_measure_reports(self):
+        end_date = date(2025, 6, 30)
+        counts = seed_benchmark_data(invoices=40, companies=1, products=10, end_date=end_date, months=2)
+        self.assertEqual(counts['invoices'], 40)
+
+        company = Company.objects.get(name='Bench Company 1')
+        results = run_report_benchmarks(company, date(2025, 6, 1), end_date)
+        self.assertEqual({r['report'] for r in results},
+                         {'purchase_tax', 'sales_tax', 'stock_report', 'stock_as_of', 'profit_loss'})
+        for row in results:
+            self.assertGreater(row['queries'], 0)
+            self.assertGreater(row['output_bytes'], 0)
+
+
+class InvoicePdfCacheTestCase(InventoryFixtureMixin, TestCase):
+    """Cached PDFs are served from disk and unchanged invoices answer 304."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.invoice = Invoice.objects.get(invoice_number='INV-1')
+
+    def test_serves_cached_file_and_304(self):
+        with self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir):
+            key = invoice_pdf_cache_key(self.invoice.pk, self.invoice.updated_at)
+            with open(invoice_pdf_path(key), 'wb') as fh:
+                fh.write(b'%PDF-cached')
+
+            url = reverse('invoice_pdf', args=[self.invoice.pk])
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-cached')
+            self.assertEqual(response['ETag'], f'"{key}"')
+
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'"{key}"').status_code, 304)
+
+    def test_cache_key_changes_on_save(self):
+        key = invoice_pdf_cache_key(self.invoice.pk, self.invoice.updated_at)
+        self.invoice.notes = 'edited'
+        self.invoice.save()
+        self.assertNotEqual(key, invoice_pdf_cache_key(self.invoice.pk, self.invoice.updated_at))
+
+    def test_store_keeps_newer_versions_and_missing_file_is_rendered(self):
+        stamp = self.invoice.updated_at
+        with self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir):
+            paths = {delta: invoice_pdf_path(invoice_pdf_cache_key(self.invoice.pk, stamp + timedelta(seconds=delta)))
+                     for delta in (-1, 0, 1)}
+            for delta in (-1, 1, 0):
+                _store_invoice_pdf(self.invoice.pk, paths[delta], b'%PDF-stored')
+            # The older version goes; the newer one another request may be opening stays
+            self.assertEqual({delta for delta, path in paths.items() if os.path.isfile(path)}, {0, 1})
+
+            os.remove(paths[0])  # Removed by a writer between get_or_render_invoice_pdf() and open()
+            with mock.patch('api.views.get_or_render_invoice_pdf', return_value=paths[0]), \
+                    mock.patch('api.utils_pdf.render_invoice_pdf', return_value=b'%PDF-rendered'):
+                response = self.client.get(reverse('invoice_pdf', args=[self.invoice.pk]))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'%PDF-rendered')
+
+
+
+def _weasyprint_available():
+    try:
+        import weasyprint  # noqa: F401
+        return True
+    except (ImportError, OSError):  # OSError: Pango/Cairo system libraries missing
+        return False
+
+
+class InvoicePdfRendererTestCase(InventoryFixtureMixin, TestCase):
+    """Static assets come from disk, and one renderer per process parses the stylesheet / fonts once."""
+
+    def test_static_fetcher_reads_from_disk(self):
+        fetched = static_url_fetcher('http://testserver/static/fonts/Sarabun-Regular.ttf')
+        self.assertTrue(fetched['string'])
+        self.assertEqual(fetched['redirected_url'], 'http://testserver/static/fonts/Sarabun-Regular.ttf')
+
+    @unittest.skipUnless(_weasyprint_available(), "WeasyPrint system libraries not installed")
+    def test_renderer_parses_stylesheet_and_fonts_once(self):
+        import weasyprint
+        from weasyprint.text import fonts
+
+        html_string = render_invoice_html(Invoice.objects.get(invoice_number='INV-1'))
+        with mock.patch.object(weasyprint, 'CSS', wraps=weasyprint.CSS) as css, \
+                mock.patch.object(fonts, 'FontConfiguration', wraps=fonts.FontConfiguration) as font_config:
+            renderer = InvoicePdfRenderer()
+            pdfs = [renderer.render(html_string, 'http://testserver/') for _ in range(3)]
+
+        self.assertEqual((css.call_count, font_config.call_count), (1, 1))
+        self.assertTrue(all(pdf.startswith(b'%PDF') for pdf in pdfs))
+        self.assertIs(get_pdf_renderer(), get_pdf_renderer())
+
+
+class InvoiceBulkPrintTestCase(InventoryFixtureMixin, TestCase):
+    """Bulk print selects by filter or ids and returns a merged PDF or a ZIP (cache hits only, no rendering)."""
+
+    def setUp(self):
+        super().setUp()
+        from pypdf import PdfWriter
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.invoices = list(Invoice.objects.order_by('invoice_date'))
+        for invoice in self.invoices:
+            writer = PdfWriter()
+            writer.add_blank_page(width=595, height=842)
+            with self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir):
+                with open(invoice_pdf_path(invoice_pdf_cache_key(invoice.pk, invoice.updated_at)), 'wb') as fh:
+                    writer.write(fh)
+
+    def test_merged_pdf_by_date_range(self):
+        from pypdf import PdfReader
+
+        with self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir):
+            response = self.client.get(reverse('invoice_bulk_print'), {
+                'start_date': '2025-01-01', 'end_date': '2025-02-28', 'status': 'BILLED',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(len(PdfReader(io.BytesIO(b''.join(response.streaming_content))).pages), 2)
+
+    def test_zip_by_ids(self):
+        with self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir):
+            response = self.client.post(reverse('invoice_bulk_print'), {
+                'ids': str(self.invoices[0].pk), 'output': 'zip',
+            })
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['Invoice_INV-1.pdf'])
+
+    def test_requires_ids_or_range(self):
+        self.assertEqual(self.client.get(reverse('invoice_bulk_print'), {'status': 'BILLED'}).status_code, 400)
+
+
+class ImportFootprintTestCase(SimpleTestCase):
+    """Loading the URLconf must not pull in the PDF / import / report libraries (checked with -X importtime)."""
+    HEAVY = ('pandas', 'numpy', 'openpyxl', 'weasyprint', 'xhtml2pdf', 'pypdf')
+
+    def test_urls_do_not_import_heavy_libraries(self):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import api.urls'],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+            capture_output=True, text=True, timeout=120,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        # Lines look like "import time:   self [us] | cumulative | imported package"
+        loaded = {}
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:'):
+                _, cumulative, name = (part.strip() for part in line[len('import time:'):].split('|'))
+                if name in self.HEAVY:  # Top-level package (any submodule import loads it too)
+                    loaded[name] = f"{cumulative} us"
+        self.assertEqual(loaded, {}, "api.urls imports heavy libraries eagerly; import them inside the views that use them")
+
+
+class InvoiceAPITestCase(InventoryFixtureMixin, TestCase):
+    """Invoice API: constant queries per page, ?fields=, nested create with FIFO stock."""
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.url = reverse('invoice_api_list')
+
+    def _add_invoices(self, count, lines):
+        for i in range(count):
+            inv = Invoice.objects.create(company=self.company, invoice_number=f"BULK-{lines}-{i}",
+                                         invoice_date=date(2025, 3, 1), created_by=self.user, tax_percent=Decimal('7'))
+            for _ in range(lines):
+                InvoiceItem.objects.create(invoice=inv, product=self.product, quantity=1, unit_price=10)
+
+    def test_page_costs_constant_queries(self):
+        self._add_invoices(5, lines=1)
+        with self.assertNumQueries(3):  # ETag versions + page (customer joined) + prefetched lines
+            small = self.api.get(self.url)
+        self._add_invoices(20, lines=6)
+        with self.assertNumQueries(3):
+            large = self.api.get(self.url, {'page_size': 50})
+        self.assertEqual(len(small.data['results']), 7)
+        self.assertEqual(len(large.data['results']), 27)
+        self.assertEqual(len(large.data['results'][0]['items']), 6)
+
+    def test_fields_filter_and_ordering(self):
+        with self.assertNumQueries(2):  # ETag versions + page; no items requested -> no prefetch
+            response = self.api.get(self.url, {'fields': 'id,invoice_number', 'ordering': 'invoice_date',
+                                               'date_from': '2025-01-01', 'status': 'BILLED'})
+        self.assertEqual([row['invoice_number'] for row in response.data['results']], ['INV-1', 'INV-2'])
+        self.assertEqual(set(response.data['results'][0]), {'id', 'invoice_number'})
+
+    def test_create_with_items_assigns_fifo_batch(self):
+        response = self.api.post(self.url, {
+            'invoice_number': 'API-1', 'company': self.company.pk, 'invoice_date': '2025-03-02', 'status': 'DRAFT',
+            'items': [{'product': self.product.pk, 'quantity': 4, 'unit_price': '150.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['items'][0]['purchase_item'], self.batch.pk)
+        self.assertEqual(Decimal(response.data['grand_total']), Decimal('600.00'))
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, 6)
+
+        self.assertEqual(self.api.delete(reverse('invoice_api_detail', args=[response.data['id']])).status_code, 204)
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, 10)
+
+
+class BulkCreateAPITestCase(InventoryFixtureMixin, TestCase):
+    """Bulk JSON endpoints: fixed number of statements per batch, all-or-nothing validation."""
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+        self.vendor = Vendor.objects.get(name='Vendor A')
+
+    def _invoices(self, count, start=0):
+        return [{
+            'invoice_number': f"B-{start + i}", 'company': self.company.pk, 'invoice_date': '2025-03-01',
+            'status': 'BILLED',
+            'items': [{'product': self.product.pk, 'purchase_item': self.batch.pk, 'quantity': 1, 'unit_price': '150.00'}],
+        } for i in range(count)]
+
+    def _post_invoices(self, documents):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.api.post(reverse('invoice_api_bulk'), documents, format='json')
+        return response, len(ctx.captured_queries)
+
+    def test_invoice_batch_uses_constant_queries(self):
+        ensure_partitions_for([date(2025, 3, 1)])  # Looked up once per process, then cached
+        small, small_queries = self._post_invoices(self._invoices(2))
+        large, large_queries = self._post_invoices(self._invoices(6, start=2))
+        self.assertEqual((small.status_code, large.status_code), (201, 201))
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large.data['created'], 6)
+        self.assertEqual({row['status'] for row in large.data['results']}, {'created'})
+
+        invoice = Invoice.objects.get(invoice_number='B-0')
+        self.assertEqual(invoice.grand_total, Decimal('150.00'))
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, 2)
+        self.assertEqual(StockMovement.objects.filter(invoice_item__invoice=invoice).get().quantity, -1)
+
+    def test_invalid_document_rejects_whole_batch(self):
+        documents = self._invoices(2)
+        documents[1]['invoice_number'] = 'INV-1'  # Already exists
+        documents.append({'invoice_number': 'B-9', 'company': self.company.pk, 'items': []})
+        response, _ = self._post_invoices(documents)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['status'] for row in response.data['results']], ['skipped', 'error', 'error'])
+        self.assertIn('invoice_number', response.data['results'][1]['errors'])
+        self.assertFalse(Invoice.objects.filter(invoice_number__startswith='B-').exists())
+
+    def test_oversold_batch_is_rejected(self):
+        documents = self._invoices(1)
+        documents[0]['items'][0]['quantity'] = 11
+        response, _ = self._post_invoices(documents)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data['results'][0]['errors'])
+
+    def test_blank_batch_lines_are_allocated_fifo(self):
+        later = PurchaseItem.objects.create(purchase_order=self.batch.purchase_order, product=self.product,
+                                            quantity=4, unit_cost=120)
+        documents = self._invoices(2)
+        documents[1]['items'] = [{'product': self.product.pk, 'quantity': 20, 'unit_price': '150.00'}]
+        response, _ = self._post_invoices(documents)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row['status'] for row in response.data['results']], ['skipped', 'error'])
+        self.assertFalse(Invoice.objects.filter(invoice_number__startswith='B-').exists())
+
+        documents[1]['items'][0]['quantity'] = 11  # 9 left in the first batch after B-0, then 2 from the later one
+        response, _ = self._post_invoices(documents)
+        self.assertEqual(response.status_code, 201, response.data)
+
+        lines = InvoiceItem.objects.filter(invoice__invoice_number='B-1').order_by('purchase_item_id')
+        self.assertEqual([(line.purchase_item_id, line.quantity, line.unit_cost) for line in lines],
+                         [(self.batch.pk, 9, Decimal('100.00')), (later.pk, 2, Decimal('120.00'))])
+        self.assertEqual(Invoice.objects.get(invoice_number='B-1').subtotal, Decimal('1650.00'))
+        self.batch.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((self.batch.remaining_quantity, later.remaining_quantity), (0, 2))
+        self.assertEqual(StockMovement.objects.filter(invoice_item__invoice__invoice_number='B-1')
+                         .aggregate(total=Sum('quantity'))['total'], -11)
+
+    def test_bulk_update_releases_and_reallocates_stock(self):
+        response, _ = self._post_invoices(self._invoices(2))
+        ids = [row['id'] for row in response.data['results']]
+        documents = self._invoices(2)
+        for document, pk in zip(documents, ids):
+            document['id'] = pk
+        documents[0]['items'][0]['quantity'] = 11  # 8 left + the 2 held by this batch's own lines
+        documents[1]['id'] = 999999
+
+        response = self.api.put(reverse('invoice_api_bulk'), documents, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('items', response.data['results'][0]['errors'])
+        self.assertIn('id', response.data['results'][1]['errors'])
+
+        documents[0]['items'][0]['quantity'] = 4
+        documents[1]['id'] = ids[1]
+        documents[1]['invoice_number'] = 'B-1X'
+        documents[1]['items'] = [{'product': self.product.pk, 'quantity': 2, 'unit_price': '150.00'}]
+        stamped = Invoice.objects.get(pk=ids[0]).updated_at
+        with mock.patch('api.utils_bulk.schedule_invoice_pdf') as schedule:
+            response = self.api.put(reverse('invoice_api_bulk'), documents, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual({row['status'] for row in response.data['results']}, {'updated'})
+        self.assertEqual(sorted(call.args[0] for call in schedule.call_args_list), sorted(ids))  # BILLED
+        self.assertGreater(Invoice.objects.get(pk=ids[0]).updated_at, stamped)  # bulk_update skips auto_now
+
+        self.batch.refresh_from_db()
+        self.assertEqual(self.batch.remaining_quantity, 4)
+        invoice = Invoice.objects.get(pk=ids[0])
+        self.assertEqual(invoice.grand_total, Decimal('600.00'))
+        self.assertEqual(StockMovement.objects.filter(invoice_item__invoice=invoice).get().quantity, -4)
+        line = InvoiceItem.objects.get(invoice__invoice_number='B-1X')
+        self.assertEqual((line.purchase_item_id, line.unit_cost), (self.batch.pk, Decimal('100.00')))
+
+    def test_purchase_orders(self):
+        response = self.api.post(reverse('purchase_order_api_bulk'), [{
+            'po_number': f"PO-B{i}", 'company': self.company.pk, 'vendor': self.vendor.pk, 'order_date': '2025-03-01',
+            'items': [{'product': self.product.pk, 'quantity': 5, 'unit_cost': '100.00'},
+                      {'product': self.product.pk, 'quantity': 2, 'unit_cost': '90.00'}],
+        } for i in range(3)], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        order = PurchaseOrder.objects.get(po_number='PO-B0')
+        self.assertEqual(order.subtotal, Decimal('680.00'))
+        self.assertEqual(list(order.purchase_items.values_list('remaining_quantity', flat=True).order_by('id')), [5, 2])
+        self.assertEqual(StockMovement.objects.filter(purchase_item__purchase_order=order).count(), 2)
+
+    def test_purchase_order_bulk_update_keeps_sold_units(self):
+        document = {'po_number': 'PO-U', 'company': self.company.pk, 'vendor': self.vendor.pk, 'order_date': '2025-03-01',
+                    'items': [{'product': self.product.pk, 'quantity': 5, 'unit_cost': '100.00'},
+                              {'product': self.product.pk, 'quantity': 2, 'unit_cost': '90.00'}]}
+        response = self.api.post(reverse('purchase_order_api_bulk'), [document], format='json')
+        order = PurchaseOrder.objects.get(pk=response.data['results'][0]['id'])
+        first, second = order.purchase_items.order_by('id')
+        invoices = self._invoices(1)
+        invoices[0]['items'][0].update(purchase_item=first.pk, quantity=3)
+        self.assertEqual(self._post_invoices(invoices)[0].status_code, 201)
+
+        document['id'] = order.pk
+        document['items'] = [{'id': second.pk, 'product': self.product.pk, 'quantity': 2, 'unit_cost': '90.00'}]
+        response = self.api.put(reverse('purchase_order_api_bulk'), [document], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f"Batch {first.pk} has sales and can't be removed.", response.data['results'][0]['errors']['items'])
+
+        document['items'] = [{'id': first.pk, 'product': self.product.pk, 'quantity': 6, 'unit_cost': '100.00'},
+                             {'product': self.product.pk, 'quantity': 4, 'unit_cost': '80.00'}]
+        response = self.api.put(reverse('purchase_order_api_bulk'), [document], format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+
+        order.refresh_from_db()
+        self.assertEqual(order.subtotal, Decimal('920.00'))
+        self.assertEqual(list(order.purchase_items.values_list('quantity', 'remaining_quantity').order_by('id')),
+                         [(6, 3), (4, 4)])
+        self.assertFalse(PurchaseItem.objects.filter(pk=second.pk).exists())
+        self.assertEqual(StockMovement.objects.filter(purchase_item__purchase_order=order)
+                         .aggregate(total=Sum('quantity'))['total'], 10)
+
+
+class ChangeFeedTestCase(InventoryFixtureMixin, TestCase):
+    """Cursor-based change feed: upserts after the cursor, tombstones for deletes, paging."""
+
+    def setUp(self):
+        super().setUp()
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def _changes(self, resource, **params):
+        with self.settings(CHANGES_SETTLE_SECONDS=0):
+            response = self.api.get(reverse('changes', args=[resource]), params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_changes_and_tombstones_after_cursor(self):
+        initial = self._changes('products')
+        self.assertEqual([row['sku'] for row in initial['changed']], ['SKU-1'])
+        self.assertEqual(self._changes('products', cursor=initial['cursor'])['changed'], [])
+
+        self.product.name = 'Phone 2'
+        self.product.save()
+        extra = Product.objects.create(company=self.company, sku='SKU-2', name='Case', category='ACCESSORY')
+        extra_id = extra.pk
+        extra.delete()
+
+        delta = self._changes('products', cursor=initial['cursor'])
+        self.assertEqual([row['name'] for row in delta['changed']], ['Phone 2'])
+        self.assertEqual(delta['deleted'], [extra_id])
+        self.assertEqual(self._changes('products', cursor=delta['cursor'])['deleted'], [])
+
+    def test_paging_and_company_filter(self):
+        first = self._changes('invoices', limit=1, company=self.company.pk)
+        self.assertTrue(first['has_more'])
+        second = self._changes('invoices', limit=1, company=self.company.pk, cursor=first['cursor'])
+        self.assertEqual({first['changed'][0]['invoice_number'], second['changed'][0]['invoice_number']}, {'INV-1', 'INV-2'})
+        self.assertEqual(self._changes('invoices', company=self.company.pk + 1)['changed'], [])
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "Open transactions are read from pg_stat_activity")
+    def test_rows_after_an_open_write_transaction_are_held_back(self):
+        initial = self._changes('products')
+        other = connection.get_new_connection(connection.get_connection_params())
+        try:
+            with other.cursor() as cursor:
+                cursor.execute("SELECT txid_current()")  # A writing transaction that hasn't committed yet
+            self.product.name = 'Phone 2'
+            self.product.save()
+            self.assertEqual(self._changes('products', cursor=initial['cursor'])['changed'], [])
+        finally:
+            other.rollback()
+            other.close()
+        self.assertEqual([row['name'] for row in self._changes('products', cursor=initial['cursor'])['changed']], ['Phone 2'])
+
+    def test_bad_cursor_and_resource(self):
+        self.assertEqual(self.api.get(reverse('changes', args=['products']), {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(self.api.get(reverse('changes', args=['notes'])).status_code, 404)
+
+
+class DataVersionETagTestCase(InventoryFixtureMixin, TestCase):
+    """Saves/deletes bump per-resource versions; unchanged pages answer 304 with one query."""
+
+    def test_html_list_304_until_data_changes(self):
+        url = reverse('customer_list')
+        etag = self.client.get(url)['ETag']
+
+        with self.assertNumQueries(1):  # data_versions only
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(company=self.company, name='New customer')
+        self.assertEqual(DataVersion.objects.get(resource='customers', company=self.company).version, 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_login_invalidates_pages_with_forms(self):
+        url = reverse('customer_list')
+        self.client.force_login(self.user)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.logout()
+        self.client.force_login(self.user)  # Rotates the CSRF secret the cached page embeds
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_detail_304_and_bump_on_delete(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        invoice = Invoice.objects.get(invoice_number='INV-1')
+        url = reverse('invoice_api_detail', args=[invoice.pk])
+        etag = api.get(url)['ETag']
+        self.assertEqual(api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Invoice.objects.get(invoice_number='INV-2').delete()
+        self.assertEqual(api.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class KeysetPaginationTestCase(InventoryFixtureMixin, TestCase):
+    """Seek pages cover every row exactly once in both directions, ties included."""
+
+    def _walk(self, queryset, ordering, params=None):
+        factory = RequestFactory()
+        pages, page = [], keyset_paginate(factory.get('/', params or {}), queryset, ordering, page_size=3)
+        while True:
+            pages.append([row.pk for row in page])
+            if not page.has_next:
+                return pages, page
+            page = keyset_paginate(factory.get('/?' + page.next_query), queryset, ordering, page_size=3)
+
+    def test_forward_and_back_with_tied_sort_keys(self):
+        for i in range(7):
+            Customer.objects.create(company=self.company, name=f'Customer {i}')
+        Customer.objects.update(created_at=timezone.now())  # Every row ties on the leading column
+        expected = list(Customer.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+        pages, last = self._walk(Customer.objects.all(), ('-created_at', '-id'))
+        self.assertEqual([len(p) for p in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+        back, page = [], last
+        while page.has_previous:
+            page = keyset_paginate(RequestFactory().get('/?' + page.prev_query), Customer.objects.all(),
+                                   ('-created_at', '-id'), page_size=3)
+            back.insert(0, [row.pk for row in page])
+        self.assertEqual(back, pages[:-1])
+        self.assertFalse(page.has_previous)
+
+    def test_list_view_pages_by_cursor_and_keeps_filters(self):
+        for i in range(60):
+            Invoice.objects.create(company=self.company, invoice_number=f'PAGE-{i}', invoice_date=date(2025, 3, 1),
+                                   created_by=self.user, tax_percent=Decimal('7'))
+        first = self.client.get(reverse('invoice_list'), {'q': 'PAGE'})
+        self.assertEqual(len(first.context['invoices']), 50)
+        self.assertIn('q=PAGE', first.context['invoices'].next_query)
+
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(reverse('invoice_list') + '?' + first.context['invoices'].next_query)
+        self.assertEqual(len(second.context['invoices']), 10)
+        self.assertFalse(any('OFFSET' in q['sql'] for q in ctx.captured_queries))
+        self.assertFalse({inv.pk for inv in first.context['invoices']} & {inv.pk for inv in second.context['invoices']})
+
+        bad = self.client.get(reverse('invoice_list'), {'cursor': 'garbage'})  # Falls back to the first page
+        self.assertEqual(len(bad.context['invoices']), 50)
+        self.assertFalse(bad.context['invoices'].has_previous)
+
+
+class InvoiceFilterTestCase(InventoryFixtureMixin, TestCase):
+    """Invoice table column filters run in the DB, for the HTML table and the API alike."""
+
+    def setUp(self):
+        super().setUp()
+        for number, day, tracking, total in [('SHP-100', date(2024, 6, 1), 'TH100', '99.00'),
+                                             ('SHP-101', date(2024, 6, 30), 'TH200', '500.00'),
+                                             ('LZD-100', date(2024, 7, 1), 'TH101', '1500.00')]:
+            inv = Invoice.objects.create(company=self.company, invoice_number=number, invoice_date=day,
+                                         platform_tracking_number=tracking, created_by=self.user,
+                                         tax_percent=Decimal('7'))
+            Invoice.objects.filter(pk=inv.pk).update(grand_total=Decimal(total))
+
+    def _numbers(self, params):
+        response = self.client.get(reverse('invoice_list'), {**params, 'partial': 'table'})
+        self.assertTemplateUsed(response, 'partials/invoice_table.html')
+        return sorted(inv.invoice_number for inv in response.context['invoices'])
+
+    def test_table_filters(self):
+        self.assertEqual(self._numbers({'min_total': '500'}), ['LZD-100', 'SHP-101'])
+        self.assertEqual(self._numbers({'number': 'SHP-10'}), ['SHP-100', 'SHP-101'])
+        self.assertEqual(self._numbers({'date': '2024-06'}), ['SHP-100', 'SHP-101'])
+        self.assertEqual(self._numbers({'tracking': 'TH10', 'min_total': '100'}), ['LZD-100'])
+        self.assertEqual(self._numbers({'status': 'BILLED'}), ['INV-1', 'INV-2'])
+        # A malformed value is ignored on the HTML page rather than failing it
+        self.assertEqual(len(self._numbers({'min_total': 'lots', 'date': '2024-06'})), 2)
+
+    def test_api_filters_and_validation(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.get(reverse('invoice_api_list'), {'min_total': '500', 'fields': 'invoice_number'})
+        self.assertEqual(sorted(row['invoice_number'] for row in response.data['results']), ['LZD-100', 'SHP-101'])
+        response = api.get(reverse('invoice_api_list'), {'date': '2024-13'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date', response.data)
+
+
+class SearchTestCase(InventoryFixtureMixin, TestCase):
+    """The shared search box lookup, and the trigram indexes backing it on Postgres."""
+
+    def test_search_fields_and_relations(self):
+        customer = Customer.objects.create(company=self.company, name='Somchai', phone='081-555-0199')
+        Invoice.objects.filter(invoice_number='INV-2').update(customer=customer)
+        Transaction.objects.create(company=self.company, transaction_number='TX-1', type='EXPENSE', category='RENT',
+                                   amount=Decimal('1500.00'), description='Office rent', created_by=self.user)
+
+        self.assertEqual(list(search(Customer.objects.all(), '555-01')), [customer])
+        self.assertEqual(list(search(Vendor.objects.all(), 'nmk')), list(Vendor.objects.all()))  # Company name
+        self.assertEqual([i.invoice_number for i in search(Invoice.objects.all(), 'somCHAI')], ['INV-2'])
+        self.assertEqual(search(Transaction.objects.all(), '1,500').count(), 1)  # Exact amount
+        self.assertEqual(search(Transaction.objects.all(), 'RENT').count(), 1)
+        self.assertEqual(search(Product.objects.all(), '  ').count(), Product.objects.count())
+
+    def test_trigram_indexes_serve_icontains(self):
+        with connection.cursor() as cursor:
+            if connection.vendor != 'postgresql':
+                self.skipTest("pg_trgm indexes are Postgres only")
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            if cursor.fetchone() is None:
+                self.skipTest("pg_trgm is not available on this server")
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE indexname LIKE '%%_trgm'")
+            indexes = {row[0] for row in cursor.fetchall()}
+            self.assertEqual(indexes, {f'{table}_{column}_trgm' for table, column in trigram_columns()})
+
+            cursor.execute('SET LOCAL enable_seqscan = off')  # Tiny test tables would never pick an index
+            plan = search(Customer.objects.all(), 'somchai', fields=['name']).explain()
+        self.assertIn('customers_name_trgm', plan)
+
+
+class GlobalSearchTestCase(InventoryFixtureMixin, TestCase):
+    """Search documents follow saves/deletes; whole identifiers outrank partial matches."""
+
+    def setUp(self):
+        super().setUp()
+        self.invoice = Invoice.objects.get(invoice_number='INV-1')
+        self.invoice.platform_tracking_number = 'TH0123456789'
+        self.invoice.recipient_phone = '081-555-0199'
+        self.invoice.recipient_name = 'Somchai Jaidee'
+        self.invoice.save()
+        self.customer = Customer.objects.create(company=self.company, name='Somchai Shop', phone='0815550199')
+
+    def test_ranked_results_follow_saves_and_deletes(self):
+        with self.assertNumQueries(1):
+            results = global_search('081 555 0199')
+        self.assertEqual({(r['type'], r['id'], r['rank']) for r in results},
+                         {('invoices', self.invoice.pk, 3), ('customers', self.customer.pk, 3)})
+
+        results = global_search('th01234')
+        self.assertEqual([(r['type'], r['rank']) for r in results], [('invoices', 2)])
+        self.assertEqual(results[0]['url'], reverse('invoice_edit', args=[self.invoice.pk]))
+        self.assertEqual({(r['type'], r['rank']) for r in global_search('somchai')},
+                         {('invoices', 2), ('customers', 2)})  # Prefix of a name token
+        self.assertEqual(global_search('PO-1')[0]['type'], 'purchase_orders')
+        self.assertEqual(global_search('TH'), [])  # Too short for the trigram index
+
+        self.invoice.platform_tracking_number = 'KEX999000111'
+        self.invoice.save()
+        self.assertEqual(global_search('TH0123456789'), [])
+        self.invoice.delete()
+        self.assertFalse(SearchDocument.objects.filter(resource='invoices', object_id=self.invoice.pk).exists())
+
+    def test_endpoint_and_rebuild_command(self):
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_documents', stdout=io.StringIO())
+        self.assertEqual(SearchDocument.objects.count(), Invoice.objects.count() + PurchaseOrder.objects.count() + 1)
+
+        response = self.client.get(reverse('global_search'), {'q': 'th0123456789', 'company': self.company.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(r['type'], r['title']) for r in response.json()['results']], [('invoices', 'INV-1')])
+
+
+class OpenBatchesTestCase(InventoryFixtureMixin, TestCase):
+    """Invoice line batches: fetched per product, cached until stock moves, not rendered into every row."""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_endpoint_is_cached_until_stock_changes(self):
+        url = reverse('product_batches', args=[self.product.pk])
+        self.assertEqual(self.client.get(url).json()['batches'], [
+            {'id': self.batch.pk, 'po_number': 'PO-1', 'remaining_quantity': 10, 'unit_cost': '100.00'},
+        ])
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.batch.remaining_quantity = 0
+            self.batch.save(update_fields=['remaining_quantity'])
+        self.assertEqual(self.client.get(url).json()['batches'], [])
+
+    def test_invoice_page_queries_do_not_grow_with_open_batches(self):
+        url = reverse('invoice_edit', args=[Invoice.objects.get(invoice_number='INV-1').pk])
+        with CaptureQueriesContext(connection) as few:
+            response = self.client.get(url)
+        self.assertContains(response, 'PO-1 | Stock: 10 | Cost: 100.00')  # The row's current batch
+
+        PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase_order=self.batch.purchase_order, product=self.product,
+                         quantity=1, unit_cost=90, total_price=90, remaining_quantity=1)
+            for _ in range(30)
+        ])
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+        self.assertEqual(len(many), len(few))
+        self.assertNotContains(response, 'Stock: 1 |')
+
+
+class StockAllocationTestCase(InventoryFixtureMixin, TestCase):
+    """FIFO lines span batches; chosen batches are checked under lock; released stock comes back."""
+
+    def setUp(self):
+        super().setUp()
+        self.batch2 = PurchaseItem.objects.create(purchase_order=self.batch.purchase_order, product=self.product,
+                                                  quantity=5, unit_cost=120)
+        self.invoice = Invoice.objects.create(company=self.company, invoice_number='INV-9', invoice_date=date(2025, 3, 1),
+                                              created_by=self.user, tax_percent=Decimal('7'))
+
+    def remaining(self):
+        return list(PurchaseItem.objects.order_by('id').values_list('remaining_quantity', flat=True))
+
+    def test_fifo_line_spans_batches(self):
+        with transaction.atomic():
+            allocate_invoice_items(self.invoice, [InvoiceItem(product=self.product, quantity=12, unit_price=150)])
+
+        self.assertEqual(list(self.invoice.invoice_items.order_by('id').values_list('purchase_item_id', 'quantity')),
+                         [(self.batch.pk, 10), (self.batch2.pk, 2)])
+        self.assertEqual(self.remaining(), [0, 3])
+        self.invoice.refresh_from_db()
+        self.assertEqual(self.invoice.subtotal, Decimal('1800.00'))
+        self.assertEqual(StockMovement.objects.filter(invoice_item__invoice=self.invoice).count(), 2)
+
+    def test_release_and_rejected_allocation(self):
+        with transaction.atomic():
+            allocate_invoice_items(self.invoice, [InvoiceItem(product=self.product, quantity=12, unit_price=150)])
+        release_invoice_items(self.invoice.invoice_items.all())
+        self.assertEqual(self.remaining(), [10, 5])
+
+        with self.assertRaisesMessage(StockAllocationError, 'Available: 5'), transaction.atomic():
+            allocate_invoice_items(self.invoice, [
+                InvoiceItem(product=self.product, quantity=1, unit_price=150),
+                InvoiceItem(product=self.product, purchase_item=self.batch2, quantity=6, unit_price=150),
+            ])
+        self.assertEqual(self.remaining(), [10, 5])
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Needs SELECT ... FOR UPDATE SKIP LOCKED")
+class ConcurrentAllocationTestCase(TransactionTestCase):
+    """Many invoices for one product allocated in parallel: no overselling, no lost stock."""
+
+    WORKERS = 16
+
+    def test_parallel_fifo_allocations(self):
+        user = User.objects.create_user(username='stock', password='x')
+        company = Company.objects.create(name='NMK')
+        vendor = Vendor.objects.create(company=company, name='Vendor A')
+        product = Product.objects.create(company=company, sku='SKU-1', name='Phone', category='SMARTPHONE')
+        po = PurchaseOrder.objects.create(company=company, po_number='PO-1', vendor=vendor, order_date=date(2025, 1, 10),
+                                          created_by=user, tax_percent=Decimal('7'))
+        for _ in range(4):
+            PurchaseItem.objects.create(purchase_order=po, product=product, quantity=10, unit_cost=100)
+        invoice_ids = [
+            Invoice.objects.create(company=company, invoice_number=f'INV-{n}', invoice_date=date(2025, 2, 1),
+                                   created_by=user, tax_percent=Decimal('7')).pk
+            for n in range(self.WORKERS)
+        ]
+        barrier = threading.Barrier(self.WORKERS)
+
+        def sell(invoice_id):
+            try:
+                barrier.wait()
+                with transaction.atomic():
+                    invoice = Invoice.objects.get(pk=invoice_id)
+                    allocate_invoice_items(invoice, [InvoiceItem(product_id=product.pk, quantity=3, unit_price=150)])
+                return True
+            except StockAllocationError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            outcomes = list(pool.map(sell, invoice_ids))
+
+        # 40 units, 16 x 3 requested: 13 invoices fit, 1 unit is left
+        self.assertEqual(outcomes.count(True), 13)
+        for batch in PurchaseItem.objects.annotate(sold=Sum('invoice_items__quantity')):
+            self.assertEqual((batch.sold or 0) + batch.remaining_quantity, batch.quantity)
+        self.assertEqual(PurchaseItem.objects.aggregate(left=Sum('remaining_quantity'))['left'], 1)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Declarative partitioning is Postgres-only")
+class PartitionOnDemandLockTestCase(TransactionTestCase):
+    """A month added before an insert is committed on its own and never waits for readers of invoices."""
+
+    def test_partition_added_while_invoices_are_read(self):
+        reader = connection.get_new_connection(connection.get_connection_params())
+        try:
+            with reader.cursor() as cursor:
+                cursor.execute("SELECT count(*) FROM invoices")  # Holds ACCESS SHARE until its transaction ends
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL lock_timeout = '5s'")  # Fail instead of hanging on ACCESS EXCLUSIVE
+                created = ensure_partitions_for([date(2045, 3, 1)])
+                with reader.cursor() as cursor:  # Committed already, while the caller's transaction is open
+                    cursor.execute("SELECT to_regclass('invoices_p2045_03') IS NOT NULL")
+                    self.assertTrue(cursor.fetchone()[0])
+        finally:
+            reader.rollback()
+            reader.close()
+        self.assertEqual(sorted(created), ['invoice_items_p2045_03', 'invoices_p2045_03'])
+
+
+class ConcurrentInvoiceNumberTestCase(TransactionTestCase):
+    """Parallel writers of one invoice number (different months, so different partitions): only one row."""
+
+    WORKERS = 8
+
+    def test_parallel_saves_of_one_number(self):
+        user = User.objects.create_user(username='numbers', password='x')
+        company = Company.objects.create(name='NMK')
+        barrier = threading.Barrier(self.WORKERS)
+
+        def create(month):
+            try:
+                barrier.wait()
+                Invoice.objects.create(company=company, invoice_number='INV-1', invoice_date=date(2025, month, 1),
+                                       created_by=user, tax_percent=Decimal('7'))
+                return True
+            except IntegrityError:
+                return False
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as pool:
+            outcomes = list(pool.map(create, range(1, self.WORKERS + 1)))
+
+        self.assertEqual(outcomes.count(True), 1)
+        self.assertEqual(Invoice.objects.filter(company=company, invoice_number='INV-1').count(), 1)
+        invoice, created = Invoice.objects.update_or_create(company=company, invoice_number='INV-1',
+                                                            defaults={'notes': 'imported again'})
+        self.assertFalse(created)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "Declarative partitioning is Postgres-only")
+class InvoicePartitionTestCase(InventoryFixtureMixin, TestCase):
+    """invoices / invoice_items by month: partitions created ahead, lines follow their header, dates prune."""
+
+    def test_lines_follow_header_into_new_month_partition(self):
+        self.assertTrue(is_partitioned('invoices') and is_partitioned('invoice_items'))
+        created = ensure_partitions(months_ahead=1, today=date(2031, 5, 10))
+        self.assertEqual(sorted(created), ['invoice_items_p2031_05', 'invoice_items_p2031_06',
+                                           'invoices_p2031_05', 'invoices_p2031_06'])
+        self.assertEqual(ensure_partitions(months_ahead=1, today=date(2031, 5, 10)), [])
+
+        invoice = Invoice.objects.get(invoice_number='INV-1')
+        invoice.invoice_date = date(2031, 5, 20)
+        invoice.save()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tableoid::regclass::text, invoice_date FROM invoice_items WHERE invoice_id = %s", [invoice.pk])
+            self.assertEqual(cursor.fetchall(), [('invoice_items_p2031_05', date(2031, 5, 20))])
+
+        plan = Invoice.objects.filter(invoice_date__range=(date(2031, 5, 1), date(2031, 5, 31))).explain()
+        self.assertIn('invoices_p2031_05', plan)
+        self.assertNotIn('invoices_history', plan)
+        self.assertEqual({name for name, _ in list_partitions('invoices')} & {'invoices_history', 'invoices_p2031_06'},
+                         {'invoices_history', 'invoices_p2031_06'})
+
+    def test_insert_creates_missing_month_partition(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        response = api.post(reverse('invoice_api_list'), {
+            'invoice_number': 'FAR-1', 'company': self.company.pk, 'invoice_date': '2040-02-10', 'status': 'DRAFT',
+            'items': [{'product': self.product.pk, 'quantity': 1, 'unit_price': '150.00'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        response = api.post(reverse('invoice_api_bulk'), [{
+            'invoice_number': 'FAR-2', 'company': self.company.pk, 'invoice_date': '2040-07-01', 'status': 'DRAFT',
+            'items': [{'product': self.product.pk, 'quantity': 1, 'unit_price': '150.00'}],
+        }], format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        for table in ('invoices', 'invoice_items'):
+            names = {name for name, _ in list_partitions(table)}
+            self.assertTrue({f'{table}_p2040_02', f'{table}_p2040_07'} <= names)
+            self.assertNotIn(f'{table}_p2040_03', names)
+
+    def test_invoice_number_uniqueness_and_detach_guard(self):
+        duplicate = Invoice(company=self.company, invoice_number='INV-1', invoice_date=date(2025, 3, 1), created_by=self.user)
+        with self.assertRaises(ValidationError):
+            duplicate.validate_unique()
+        with self.assertRaises(IntegrityError):
+            duplicate.save()  # Enforced on save too, not only by forms / serializers
+        with self.assertRaises(RuntimeError):
+            detach_month(date(2025, 1, 1))  # DETACH CONCURRENTLY can't run inside a transaction
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "EXPLAIN output and partial/covering indexes are Postgres-specific")
+class QueryPlanIndexTestCase(TestCase):
+    """The report, list and import queries are answered from their purpose-built indexes (migration 0024)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_benchmark_data(invoices=2000, companies=2, products=50, end_date=date(2025, 6, 30), months=6)
+        cls.company = Company.objects.get(name='Bench Company 1')
+        cls.product = Product.objects.filter(company=cls.company).first()
+        # Some unmapped platform lines and sold-out batches, as in production
+        InvoiceItem.objects.filter(id__in=InvoiceItem.objects.order_by('id').values('id')[:200]).update(product=None)
+        PurchaseItem.objects.filter(id__in=PurchaseItem.objects.order_by('id').values('id')[:150]).update(remaining_quantity=0)
+        with connection.cursor() as cursor:
+            for table in ('invoices', 'invoice_items', 'purchase_items', 'purchase_orders', 'transactions'):
+                cursor.execute(f'ANALYZE "{table}"')
+
+    def plans(self, run):
+        """EXPLAIN of every SELECT that run() sends, as the code built it."""
+        with CaptureQueriesContext(connection) as queries:
+            run()
+        plans = []
+        with connection.cursor() as cursor:
+            # Test-sized tables fit in a few pages: price them like the production (SSD) server
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL random_page_cost = 1.1')
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN ' + query['sql'])
+                    plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+        return plans
+
+    def assertUsesIndex(self, index, run):
+        # A partitioned table's index shows up under each partition's own index name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "WITH RECURSIVE tree(oid) AS (SELECT %s::regclass UNION ALL "
+                "SELECT i.inhrelid FROM pg_inherits i JOIN tree ON i.inhparent = tree.oid) "
+                "SELECT relname FROM pg_class WHERE oid IN (SELECT oid FROM tree)", [index]
+            )
+            names = [row[0] for row in cursor.fetchall()]
+        plans = self.plans(run)
+        self.assertTrue(any(name in plan for name in names for plan in plans),
+                        f"{index} unused:\n" + '\n\n'.join(plans))
+
+    def test_report_and_list_queries(self):
+        start, end = date(2025, 6, 1), date(2025, 6, 30)  # A monthly report
+        self.assertUsesIndex('invoice_co_date_status_idx', lambda: list(
+            Invoice.objects.filter(company=self.company, invoice_date__range=[start, end], status='BILLED')
+        ))
+        self.assertUsesIndex('po_company_date_idx', lambda: list(
+            PurchaseOrder.objects.filter(company=self.company, order_date__range=[start, end]).order_by('order_date')
+        ))
+        self.assertUsesIndex('transaction_company_date_idx', lambda: load_pnl_frames(self.company, start, end))
+        self.assertUsesIndex('invoice_item_product_date_idx', lambda: InvoiceItem.objects.filter(
+            product=self.product, invoice__status='BILLED', invoice_date__range=[start, end]
+        ).aggregate(Sum('quantity')))
+
+    def test_stock_and_import_queries(self):
+        self.assertUsesIndex('purchase_item_open_idx', lambda: get_open_batches(self.product.pk))
+        unmapped_sku = InvoiceItem.objects.filter(product__isnull=True).values_list('sku', flat=True).first()
+        self.assertUsesIndex('invoice_item_unmapped_sku_idx', lambda: list(
+            InvoiceItem.objects.filter(sku=unmapped_sku, product__isnull=True).values_list('id', flat=True)
+        ))
+        self.assertUsesIndex('invoice_company_number_idx', lambda: Invoice.objects.filter(
+            company=self.company, invoice_number='INV-0-00000042'
+        ).first())
+
+
+class ArchivePeriodTestCase(InventoryFixtureMixin, TestCase):
+    """Closed months move into the compressed archive, reports still count them, restore puts them back."""
+
+    def test_archive_keeps_reports_and_restore_is_exact(self):
+        before = build_profit_and_loss(self.company, date(2025, 1, 1), date(2025, 2, 28))['summary']
+        invoice = Invoice.objects.get(invoice_number='INV-1')
+        line = invoice.invoice_items.get()
+
+        period = archive_period(self.company, date(2025, 1, 15), user=self.user)
+        self.assertEqual((period.invoice_count, period.purchase_order_count), (1, 0))  # The batch still has stock
+        self.assertEqual(Product.objects.get(pk=self.product.pk).current_stock, 5)  # The batch stays, its sale is archived
+        self.assertEqual(with_current_stock(Product.objects.filter(pk=self.product.pk)).get().stock_balance, 5)
+        self.assertFalse(Invoice.objects.filter(pk=invoice.pk).exists())
+        self.assertEqual(build_profit_and_loss(self.company, date(2025, 1, 1), date(2025, 2, 28))['summary'], before)
+        rebuild_stock_movements()  # The archived sale stays in the ledger
+        self.assertEqual(get_stock_balances_as_of(date(2025, 1, 31))[self.product.pk], 7)
+        sales = with_archived(Invoice.objects.order_by('invoice_date'), date(2025, 1, 1), date(2025, 2, 28))
+        self.assertEqual([inv.invoice_number for inv in sales], ['INV-1', 'INV-2'])
+        with self.assertRaises(ArchiveError):
+            archive_period(self.company, date(2025, 1, 1))
+
+        restore_period(self.company, date(2025, 1, 1))
+        restored = Invoice.objects.get(pk=invoice.pk)
+        self.assertEqual((restored.created_at, restored.grand_total), (invoice.created_at, invoice.grand_total))
+        self.assertEqual(StockMovement.objects.get(invoice_item_id=line.pk).quantity, -3)
+        self.assertFalse(ArchivedPeriod.objects.exists())
+
+    def test_archive_writes_feed_markers_per_table_not_per_row(self):
+        for number in range(4):
+            Invoice.objects.create(company=self.company, invoice_number=f"INV-F{number}", invoice_date=date(2025, 2, 10),
+                                   created_by=self.user, status='BILLED', tax_percent=Decimal('7'))
+        february = list(Invoice.objects.filter(invoice_date__month=2).values_list('pk', flat=True))
+        with CaptureQueriesContext(connection) as one:
+            archive_period(self.company, date(2025, 1, 1))
+        with CaptureQueriesContext(connection) as five:
+            archive_period(self.company, date(2025, 2, 1))
+
+        self.assertEqual(len(one), len(five))
+        self.assertLessEqual(set(february), set(Tombstone.objects.filter(resource='invoices').values_list('object_id', flat=True)))
+        self.assertFalse(SearchDocument.objects.filter(resource='invoices').exists())
+
+    @mock.patch('api.utils_archive.ARCHIVE_CHUNK_ROWS', 1)
+    def test_sold_out_purchase_order_follows_its_sales(self):
+        PurchaseItem.objects.filter(pk=self.batch.pk).update(remaining_quantity=0)
+        archive_period(self.company, date(2025, 2, 1))
+        period = archive_period(self.company, date(2025, 1, 1))  # No hot line sells from PO-1 any more
+        self.assertEqual(period.purchase_order_count, 1)
+        self.assertEqual(list(period.chunks.filter(table='stock_movements').values_list('part', 'row_count')), [(0, 1), (1, 1)])
+        self.assertFalse(PurchaseItem.objects.exists())
+
+        orders = with_archived(PurchaseOrder.objects.order_by('order_date'), date(2025, 1, 1), date(2025, 1, 31), self.company)
+        self.assertEqual([po.po_number for po in orders], ['PO-1'])
+        quantities = archived_stock_quantities(date(2025, 1, 1), date(2025, 1, 31))
+        self.assertEqual([quantities[key][self.product.pk] for key in ('received', 'sold')], [10, 3])
+        self.assertEqual(archived_stock_quantities(date(2025, 3, 1), date(2025, 3, 31)), {'received': {}, 'sold': {}})
+
+        # February's line sells from January's batch: restoring February brings January back first
+        call_command('archive_period', '--restore', '--company', str(self.company.pk), '--month', '2025-02', stdout=io.StringIO())
+        self.assertEqual(Invoice.objects.count(), 2)
+        self.assertEqual(PurchaseItem.objects.get().pk, self.batch.pk)
+        self.assertFalse(ArchivedPeriod.objects.exists())
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingMiddlewareTestCase(InventoryFixtureMixin, TestCase):
+    """Per-request timings: Server-Timing header, duplicate query count, staff-only slowest endpoints page."""
+
+    def setUp(self):
+        super().setUp()
+        clear_profiles()
+
+    def test_requests_are_timed_and_listed_for_staff(self):
+        response = self.client.get(reverse('product_list'))
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, \d+ duplicates", tpl;dur=')
+        entry = recent_requests()[-1]
+        self.assertEqual(entry['endpoint'], 'GET /api/products/')
+        self.assertGreater(entry['sql_count'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('profiling')).status_code, 302)  # Staff only
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.assertContains(self.client.get(reverse('profiling')), 'GET /api/products/')
+
+    def test_duplicate_queries(self):
+        profile, token = start_profile()
+        try:
+            with connection.execute_wrapper(profile.execute):
+                for pk in (self.product.pk, self.product.pk, self.product.pk, 0):
+                    list(Product.objects.filter(pk=pk))
+        finally:
+            stop_profile(token)
+        self.assertEqual((profile.sql_count, profile.duplicates), (4, 2))
+        self.assertEqual(profile.most_repeated()[1], 4)  # Same statement, any parameters
+
+
+class MetricsTestCase(InventoryFixtureMixin, TestCase):
+    """Prometheus /metrics/: per-view requests and latency, report / allocation metrics, optional token."""
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_requests_reports_and_conflicts_are_exported(self):
+        page = {'view': '/api/products/', 'method': 'GET', 'status': '200'}
+        requests_before = self.sample('http_requests_total', **page)
+        reports_before = self.sample('report_generation_seconds_count', report='stock_report')
+        rejected_before = self.sample('stock_allocation_conflicts_total', reason='rejected')
+
+        self.client.get(reverse('product_list'))
+        self.client.post(reverse('reports'), {'company': self.company.pk, 'start_date': '2025-01-01',
+                                              'end_date': '2025-01-31', 'report_type': 'stock_report'})
+        invoice = Invoice.objects.get(invoice_number='INV-1')
+        with self.assertRaises(StockAllocationError), transaction.atomic():
+            allocate_invoice_items(invoice, [InvoiceItem(product=self.product, quantity=50, unit_price=150)])
+
+        self.assertEqual(self.sample('http_requests_total', **page), requests_before + 1)
+        self.assertEqual(self.sample('report_generation_seconds_count', report='stock_report'), reports_before + 1)
+        self.assertEqual(self.sample('stock_allocation_conflicts_total', reason='rejected'), rejected_before + 1)
+
+        with self.settings(METRICS_TOKEN='s3cret'):
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response['Content-Type'], METRICS_CONTENT_TYPE)
+        self.assertContains(response, 'http_request_duration_seconds_count{method="GET",view="/api/products/"}')
+        self.assertContains(response, 'db_connections{state="active"}')
+        self.assertContains(response, 'db_max_connections ')
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+
+    def test_no_token_is_rejected_outside_debug(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Every URL in api/urls.py, measured with 10 and then 1,000 rows per table: the query
+    count must not grow with the data (N+1) and must stay within the view's budget.
+    """
+    SMALL, LARGE = 10, 1000
+
+    # Queries per case, at any row count (session / user / ETag lookups included).
+    # Raise one only for a fixed number of new queries, never for one per row.
+    BUDGETS = {
+        'admin': 3, 'notes': 1, 'note_delete': 2, 'invoice_api_list': 3, 'invoice_api_detail': 3,
+        'invoice_api_bulk': 25, 'purchase_order_api_bulk': 18, 'changes': 3, 'root': 0, 'login': 0, 'logout': 4,
+        'purchase_list': 7, 'purchase_edit': 10, 'customer_list': 4, 'customers': 5, 'customer_edit': 6,
+        'invoice_list': 7, 'invoice_edit': 11, 'invoice_pdf': 2, 'invoice_bulk_print': 2,
+        'vendor_list': 5, 'vendor_edit': 7, 'product_list': 5, 'product_edit': 6, 'product_batches': 1,
+        'transaction_form': 2, 'transaction_list': 4, 'transaction_edit': 5, 'platform_import': 2,
+        'product_mapping': 4, 'help': 2, 'reports': 3,
+        'report_purchase_tax': 3, 'report_sales_tax': 3, 'report_stock': 7, 'report_stock_as_of': 6,
+        'report_profit_loss': 4, 'profit_loss_json': 4, 'global_search': 1, 'profiling': 2, 'metrics': 2,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='budget', password='x', is_staff=True, is_superuser=True)
+        cls.company = Company.objects.create(name='NMK', tax_id='0105555000000')
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.settings_override = self.settings(INVOICE_PDF_CACHE_DIR=self.cache_dir)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        ensure_partitions_for([date(2025, 1, 15)])  # Partition lookups are cached per process: keep them out of the counts
+
+    def seed(self, start, stop):
+        """Rows start..stop-1 of every listed table, linked the way real data is (bulk, no save hooks)."""
+        n = range(start, stop)
+        customers = Customer.objects.bulk_create([Customer(company=self.company, name=f'Customer {i}', phone=f'08{i:08d}') for i in n])
+        vendors = Vendor.objects.bulk_create([Vendor(company=self.company, name=f'Vendor {i}') for i in n])
+        products = Product.objects.bulk_create([
+            Product(company=self.company, sku=f'SKU-{i}', name=f'Product {i}', category='SMARTPHONE') for i in n
+        ])
+        ProductMapping.objects.bulk_create([ProductMapping(product=p, platform_name=f'Shop name {p.sku}') for p in products])
+        Note.objects.bulk_create([Note(user=self.user, title=f'Note {i}', content='-') for i in n])
+        Transaction.objects.bulk_create([
+            Transaction(company=self.company, transaction_number=f'TX-{i}', transaction_date=date(2025, 1, 1 + i % 28),
+                        type='EXPENSE', category='RENT', amount=Decimal('100'), description='rent', created_by=self.user)
+            for i in n
+        ])
+        orders = PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(company=self.company, po_number=f'PO-{i}', vendor=vendor, order_date=date(2025, 1, 1 + i % 28),
+                          status='PAID', created_by=self.user)
+            for i, vendor in zip(n, vendors)
+        ])
+        batches = PurchaseItem.objects.bulk_create([
+            PurchaseItem(purchase_order=order, product=product, quantity=5, unit_cost=100, total_price=500, remaining_quantity=4)
+            for order, product in zip(orders, products)
+        ])
+        invoices = Invoice.objects.bulk_create([
+            Invoice(company=self.company, customer=customer, invoice_number=f'INV-{i}', invoice_date=date(2025, 1, 1 + i % 28),
+                    status='BILLED', platform_name='Shopee', created_by=self.user, subtotal=150, grand_total=150)
+            for i, customer in zip(n, customers)
+        ])
+        lines = InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, invoice_date=invoice.invoice_date, product=batch.product, purchase_item=batch,
+                        sku=batch.product.sku, quantity=1, unit_price=150, total_price=150, unit_cost=100, total_cost=100)
+            for invoice, batch in zip(invoices, batches)
+        ] + [
+            InvoiceItem(invoice=invoice, invoice_date=invoice.invoice_date, sku=f'UNMAPPED-{invoice.pk}',
+                        item_name='Unknown', quantity=1, unit_price=10, total_price=10)
+            for invoice in invoices
+        ])
+        sync_stock_movements(purchase_items=PurchaseItem.objects.filter(pk__in=[b.pk for b in batches]),
+                             invoice_items=InvoiceItem.objects.filter(pk__in=[line.pk for line in lines]))
+        index_queryset(Invoice.objects.filter(pk__in=[i.pk for i in invoices]))
+        for invoice in invoices[:2]:  # Bulk print / PDF download are served from the cache
+            with open(invoice_pdf_path(invoice_pdf_cache_key(invoice.pk, invoice.updated_at)), 'wb') as fh:
+                fh.write(b'%PDF-cached')
+
+    def cases(self):
+        """(name, method, url, data, api) for every route in api/urls.py (the same views are mounted under api/)."""
+        invoice = Invoice.objects.order_by('pk').first()
+        order = PurchaseOrder.objects.order_by('pk').first()
+        product = Product.objects.order_by('pk').first()
+        report = {'company': self.company.pk, 'start_date': '2025-01-01', 'end_date': '2025-01-31'}
+        bulk_invoice = [{'company': self.company.pk, 'invoice_number': f'BULK-{Invoice.objects.count()}',
+                         'invoice_date': '2025-01-15', 'items': [{'product': product.pk, 'quantity': 1, 'unit_price': '150'}]}]
+        bulk_po = [{'company': self.company.pk, 'vendor': order.vendor_id, 'po_number': 'BULK-PO', 'order_date': '2025-01-15',
+                    'items': [{'product': product.pk, 'quantity': 1, 'unit_cost': '100'}]}]
+        return [
+            ('admin', 'get', reverse('admin:index'), None, False),
+            ('notes', 'get', reverse('note_list_create'), None, True),
+            ('note_delete', 'delete', reverse('note_delete', args=[Note.objects.latest('pk').pk]), None, True),
+            ('invoice_api_list', 'get', reverse('invoice_api_list'), None, True),
+            ('invoice_api_detail', 'get', reverse('invoice_api_detail', args=[invoice.pk]), None, True),
+            ('invoice_api_bulk', 'post', reverse('invoice_api_bulk'), bulk_invoice, True),
+            ('purchase_order_api_bulk', 'post', reverse('purchase_order_api_bulk'), bulk_po, True),
+            ('changes', 'get', reverse('changes', args=['invoices']), None, True),
+            ('root', 'get', '/', None, False),
+            ('login', 'get', reverse('login'), None, False),
+            ('purchase_list', 'get', reverse('purchase_list'), None, False),
+            ('purchase_edit', 'get', reverse('purchase_edit', args=[order.pk]), None, False),
+            ('customer_list', 'get', '/customer_list/', None, False),
+            ('customers', 'get', reverse('customer_list'), None, False),
+            ('customer_edit', 'get', reverse('customer_edit', args=[invoice.customer_id]), None, False),
+            ('invoice_list', 'get', reverse('invoice_list'), None, False),
+            ('invoice_edit', 'get', reverse('invoice_edit', args=[invoice.pk]), None, False),
+            ('invoice_pdf', 'get', reverse('invoice_pdf', args=[invoice.pk]), None, False),
+            ('invoice_bulk_print', 'get', reverse('invoice_bulk_print'), {'ids': str(invoice.pk), 'output': 'zip'}, False),
+            ('vendor_list', 'get', reverse('vendor_list'), None, False),
+            ('vendor_edit', 'get', reverse('vendor_edit', args=[order.vendor_id]), None, False),
+            ('product_list', 'get', reverse('product_list'), None, False),
+            ('product_edit', 'get', reverse('product_edit', args=[product.pk]), None, False),
+            ('product_batches', 'get', reverse('product_batches', args=[product.pk]), None, False),
+            ('transaction_form', 'get', reverse('transaction_form'), None, False),
+            ('transaction_list', 'get', reverse('transaction_list'), None, False),
+            ('transaction_edit', 'get', reverse('transaction_edit', args=[Transaction.objects.order_by('pk').first().pk]), None, False),
+            ('platform_import', 'get', reverse('platform_import'), None, False),
+            ('product_mapping', 'get', reverse('product_mapping'), None, False),
+            ('help', 'get', reverse('help'), None, False),
+            ('reports', 'get', reverse('reports'), None, False),
+            ('report_purchase_tax', 'post', reverse('reports'), {**report, 'report_type': 'purchase_tax'}, False),
+            ('report_sales_tax', 'post', reverse('reports'), {**report, 'report_type': 'sales_tax'}, False),
+            ('report_stock', 'post', reverse('reports'), {**report, 'report_type': 'stock_report'}, False),
+            ('report_stock_as_of', 'post', reverse('reports'), {**report, 'report_type': 'stock_as_of'}, False),
+            ('report_profit_loss', 'post', reverse('reports'), {**report, 'report_type': 'profit_loss'}, False),
+            ('profit_loss_json', 'get', reverse('profit_loss_json'), report, False),
+            ('global_search', 'get', reverse('global_search'), {'q': 'INV-1'}, False),
+            ('profiling', 'get', reverse('profiling'), None, False),
+            ('metrics', 'get', reverse('metrics'), None, False),
+            ('logout', 'get', reverse('logout'), None, False),  # Last: ends the session
+        ]
+
+    def measure(self):
+        api = APIClient()
+        api.force_authenticate(self.user)
+        self.client.force_login(self.user)
+        cache.clear()  # Cold caches (open batches, report ETags) on both runs
+        counts = {}
+        for name, method, url, data, is_api in self.cases():
+            client = api if is_api else self.client
+            connection.queries_log.clear()  # A full log (maxlen) would hide the captured queries
+            with CaptureQueriesContext(connection) as queries:
+                if is_api and method == 'post':
+                    response = client.post(url, data, format='json')
+                else:
+                    response = getattr(client, method)(url, data)
+                if hasattr(response, 'streaming_content'):
+                    b''.join(response.streaming_content)
+            self.assertLess(response.status_code, 500, name)
+            counts[name] = len(queries)
+        return counts
+
+    def test_every_route_is_measured(self):
+        from . import urls
+        self.seed(0, 1)
+        measured = {resolve(url.split('?')[0]).route.removeprefix('api/') for _, _, url, _, _ in self.cases()}
+        self.assertEqual({str(pattern.pattern) for pattern in urls.urlpatterns} - measured, set())
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        self.seed(0, self.SMALL)
+        small = self.measure()
+        self.seed(self.SMALL, self.LARGE)
+        large = self.measure()
+        self.assertEqual(set(small), set(self.BUDGETS))
+        for name, budget in self.BUDGETS.items():
+            with self.subTest(name):
+                self.assertEqual(large[name], small[name], f"{name}: {small[name]} queries at {self.SMALL} rows, {large[name]} at {self.LARGE}")
+                self.assertLessEqual(large[name], budget)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', "COPY loading is Postgres-only")
+class SyntheticDataTestCase(TestCase):
+    """The generator at a tiny scale: rows are consistent with what the ORM paths would write."""
+
+    def setUp(self):
+        self.end_date = date.today().replace(day=1) - timedelta(days=1)
+        self.counts = generate_dataset(companies=2, products=20, invoices=300, months=2, end_date=self.end_date, seed=7)
+
+    def test_counts_and_links(self):
+        for model, table in [(Product, 'products'), (PurchaseOrder, 'purchase_orders'), (PurchaseItem, 'purchase_items'),
+                             (Invoice, 'invoices'), (InvoiceItem, 'invoice_items'), (Transaction, 'transactions')]:
+            self.assertEqual(model.objects.count(), self.counts[table], table)
+        self.assertEqual(self.counts['invoices'], 600)
+        self.assertEqual(ProductAlias.objects.count(), 40 * 3)
+        self.assertEqual(set(Invoice.objects.values_list('platform_name', flat=True)), {'Shopee', 'TikTok Shop', 'Lazada'})
+        self.assertFalse(InvoiceItem.objects.exclude(invoice_date=F('invoice__invoice_date')).exists())
+        self.assertFalse(InvoiceItem.objects.filter(purchase_item__isnull=False).exclude(purchase_item__product=F('product')).exists())
+        self.assertFalse(InvoiceItem.objects.exclude(product__company=F('invoice__company')).filter(product__isnull=False).exists())
+        self.assertTrue(InvoiceItem.objects.filter(product__isnull=True).exists())  # Unmapped platform SKUs
+
+        invoice = Invoice.objects.order_by('id').first()
+        self.assertEqual(invoice.invoice_items.aggregate(total=Sum('total_price'))['total'], invoice.subtotal)
+        for batch in PurchaseItem.objects.annotate(sold=Sum('invoice_items__quantity')):
+            self.assertEqual(batch.remaining_quantity, batch.quantity - (batch.sold or 0))
+
+    def test_stock_ledger_matches_rebuild(self):
+        def ledger():
+            return sorted(StockMovement.objects.values_list('product_id', 'movement_date', 'quantity', 'source', 'purchase_item_id', 'invoice_item_id'))
+        loaded = ledger()
+        rebuild_stock_movements()
+        self.assertEqual(loaded, ledger())
+
+    def test_popularity_is_skewed(self):
+        sold = sorted(InvoiceItem.objects.filter(product__isnull=False).values('product').annotate(lines=Count('id')).values_list('lines', flat=True))
+        self.assertGreater(sold[-1], 4 * sold[len(sold) // 2])
+
+    def test_orm_inserts_after_loading(self):
+        company = Company.objects.get(name='Synthetic Company 1')
+        product = Product.objects.create(company=company, sku='NEW-1', name='New', category='OTHER')
+        invoice = Invoice.objects.create(company=company, invoice_number='NEW-1', invoice_date=self.end_date,
+                                         status='DRAFT', created_by=User.objects.get(username='synthetic'))
+        invoice.refresh_from_db()
+        InvoiceItem.objects.create(invoice=invoice, product=product, quantity=1, unit_price=Decimal('10'))
+        self.assertGreater(invoice.pk, Invoice.objects.exclude(pk=invoice.pk).order_by('-pk').values_list('pk', flat=True)[0])
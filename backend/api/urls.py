@@ -8,6 +8,11 @@ urlpatterns = [
     #path('api/user/register/', CreateUserView.as_view(), name='create_user'),
     path('notes/', views.NoteListCreateView.as_view(), name='note_list_create'),
     path('notes/<int:pk>/', views.NoteDeleteView.as_view(), name='note_delete'),
+    path('api/v1/invoices/', views.InvoiceListCreateView.as_view(), name='invoice_api_list'),
+    path('api/v1/invoices/<int:pk>/', views.InvoiceDetailView.as_view(), name='invoice_api_detail'),
+    path('api/v1/invoices/bulk/', views.InvoiceBulkCreateView.as_view(), name='invoice_api_bulk'),
+    path('api/v1/purchase-orders/bulk/', views.PurchaseOrderBulkCreateView.as_view(), name='purchase_order_api_bulk'),
+    path('api/v1/changes/<str:resource>/', views.ChangesView.as_view(), name='changes'),
 
     #path('', views.home, name='home'),
     path('', views.login_view, name='login'),
@@ -30,6 +35,7 @@ urlpatterns = [
     path('invoices/', views.invoice_view, name='invoice_list'),
     path('invoices/edit/<int:pk>/', views.invoice_view, name='invoice_edit'),
     path('invoice/<int:pk>/pdf/', views.invoice_pdf_view, name='invoice_pdf'),
+    path('invoices/print/', views.invoice_bulk_print_view, name='invoice_bulk_print'),
 
     # Vendor Management
     #path('vendor_list/', views.vendor_list, name='vendor_list'),
@@ -39,6 +45,7 @@ urlpatterns = [
     # Product Management
     path('products/', views.product_view, name='product_list'),
     path('products/edit/<int:pk>/', views.product_view, name='product_edit'),
+    path('products/<int:pk>/batches/', views.product_batches_view, name='product_batches'),
 
     # Transaction Management
     path('transaction_form/', views.transaction_form, name='transaction_form'),
@@ -49,12 +56,19 @@ urlpatterns = [
     path('import/platforms/', views.platform_import_view, name='platform_import'),
 
     path('product_mapping/', views.product_mapping_view, name='product_mapping'),
-    path('product_mapping/edit/<int:pk>/', views.product_mapping_view, name='product_mapping_edit'),
 
     # Help Page
     path('help/', views.help, name='help'),
 
     path('reports/', views.report_dashboard_view, name='reports'),
+    path('reports/profit-loss/', views.profit_loss_json_view, name='profit_loss_json'),
+
+    # Global search (invoices, purchase orders, customers)
+    path('search/', views.global_search_view, name='global_search'),
+
+    # Request profiling (staff only, PROFILING_ENABLED)
+    path('profiling/', views.profiling_view, name='profiling'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
 
 
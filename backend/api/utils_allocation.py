@@ -0,0 +1,247 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Max, Min, OuterRef, Subquery, Sum, Value, When
+
+from .models import InvoiceItem, PurchaseItem
+from .utils_metrics import ALLOCATION_CONFLICTS
+from .utils_stock import invalidate_open_batches, sync_stock_movements
+
+# Open batches locked per round trip while covering a FIFO quantity
+LOCK_CHUNK = 10
+BULK_BATCH_SIZE = 1000
+
+LINE_FIELDS = ['invoice_date', 'product', 'purchase_item', 'sku', 'item_name', 'quantity', 'unit_price', 'total_price', 'unit_cost', 'total_cost']
+
+
+class StockAllocationError(Exception):
+    """
+    An invoice line can't be covered by the stock left (message is shown to the user).
+    `lines`: indexes of the lines concerned, so bulk callers can point at their documents.
+    """
+
+    def __init__(self, message, lines=()):
+        super().__init__(message)
+        self.lines = list(lines)
+
+
+# --- 1. STOCK ADJUSTMENT (one UPDATE per call) ---
+def _adjust_remaining(deltas, product_ids):
+    """remaining_quantity += delta for every batch in {batch_id: delta}."""
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    PurchaseItem.objects.filter(pk__in=deltas).update(
+        remaining_quantity=F('remaining_quantity') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            output_field=IntegerField(),
+        )
+    )
+    invalidate_open_batches(product_ids)
+
+
+def release_invoice_items(invoice_items):
+    """
+    Gives back the stock held by these lines. Call before deleting them, or before
+    re-allocating edited lines (their stored batch/quantity is what gets released).
+    """
+    held = (
+        invoice_items.filter(purchase_item__isnull=False)
+        .values('purchase_item_id', 'purchase_item__product_id')
+        .annotate(qty=Sum('quantity'))
+        .order_by()
+    )
+    deltas, product_ids = {}, set()
+    for row in held:
+        deltas[row['purchase_item_id']] = deltas.get(row['purchase_item_id'], 0) + row['qty']
+        product_ids.add(row['purchase_item__product_id'])
+    _adjust_remaining(deltas, product_ids)
+
+
+# --- 2. LOCKING ---
+def _lock_open_batches(product_id, needed, exclude, skip_locked):
+    """Locks open batches of one product in FIFO (id) order, a chunk at a time, until `needed` is covered."""
+    rows, total, last_id = [], 0, 0
+    while total < needed:
+        chunk = list(
+            PurchaseItem.objects.select_for_update(skip_locked=skip_locked)
+            .filter(product_id=product_id, remaining_quantity__gt=0, id__gt=last_id)
+            .exclude(pk__in=exclude)
+            .order_by('id')
+            .values_list('id', 'remaining_quantity', 'unit_cost')[:LOCK_CHUNK]
+        )
+        if not chunk:
+            break
+        rows += chunk
+        total += sum(remaining for _, remaining, _ in chunk)
+        last_id = chunk[-1][0]
+    return rows
+
+
+def _lock_fifo(product_id, needed, exclude):
+    """
+    First pass skips batches other transactions hold (concurrent invoices for the
+    same product spread over different batches instead of queueing). If that comes
+    up short, the savepoint is rolled back, which frees those row locks, and the
+    batches are locked again in id order, waiting for the holders to commit.
+    """
+    savepoint = transaction.savepoint()
+    rows = _lock_open_batches(product_id, needed, exclude, skip_locked=True)
+    unlocked = sum(remaining for _, remaining, _ in rows)
+    if unlocked >= needed:
+        transaction.savepoint_commit(savepoint)
+        return rows
+    transaction.savepoint_rollback(savepoint)
+    rows = _lock_open_batches(product_id, needed, exclude, skip_locked=False)
+    if sum(remaining for _, remaining, _ in rows) > unlocked:  # Stock was there, held by another transaction
+        ALLOCATION_CONFLICTS.labels('lock_wait').inc()
+    return rows
+
+
+# --- 3. ALLOCATION ---
+def _plan(items):
+    """
+    [(batch_id, quantity), ...] per item, plus the product and unit cost of every
+    batch involved. Chosen batches are taken as is;
+    blank ones are filled FIFO, spanning as many batches as the quantity needs.
+    Items with neither batch nor product (unmapped platform lines) hold no stock.
+    """
+    plan = [[] for _ in items]
+    left, product_of, cost_of = {}, {}, {}
+
+    # A. Chosen batches, locked in id order
+    chosen = sorted({item.purchase_item_id for item in items if item.purchase_item_id})
+    if chosen:
+        for pk, product_id, remaining, unit_cost in (
+            PurchaseItem.objects.select_for_update().filter(pk__in=chosen)
+            .order_by('id').values_list('id', 'product_id', 'remaining_quantity', 'unit_cost')
+        ):
+            left[pk], product_of[pk], cost_of[pk] = remaining, product_id, unit_cost
+
+    for index, item in enumerate(items):
+        pk = item.purchase_item_id
+        if not pk:
+            continue
+        if pk not in left:
+            raise StockAllocationError(f"Batch {pk} does not exist.", [index])
+        if item.product_id and product_of[pk] != item.product_id:
+            raise StockAllocationError(f"Mismatch: Batch {pk} does not belong to product {item.product.name}", [index])
+        if item.quantity > left[pk]:
+            raise StockAllocationError(f"Not enough stock in selected batch {pk}. Available: {left[pk]}", [index])
+        left[pk] -= item.quantity
+        plan[index].append((pk, item.quantity))
+
+    # B. FIFO lines, product by product (sorted, so every transaction locks in the same order)
+    fifo = defaultdict(list)
+    for index, item in enumerate(items):
+        if not item.purchase_item_id and item.product_id:
+            fifo[item.product_id].append(index)
+
+    for product_id in sorted(fifo):
+        needed = sum(items[index].quantity for index in fifo[product_id])
+        have = sum(qty for pk, qty in left.items() if product_of[pk] == product_id)
+        if needed > have:
+            for pk, remaining, unit_cost in _lock_fifo(product_id, needed - have, exclude=list(left)):
+                left[pk], product_of[pk], cost_of[pk] = remaining, product_id, unit_cost
+
+        batches = sorted(pk for pk in left if product_of[pk] == product_id and left[pk] > 0)
+        available = sum(left[pk] for pk in batches)
+        if needed > available:
+            name = items[fifo[product_id][0]].product.name
+            raise StockAllocationError(
+                f"Not enough stock for Product: {name}. Available: {available}, requested: {needed}", fifo[product_id],
+            )
+
+        for index in fifo[product_id]:
+            wanted = items[index].quantity
+            for pk in batches:
+                if not wanted:
+                    break
+                take = min(wanted, left[pk])
+                if take:
+                    left[pk] -= take
+                    wanted -= take
+                    plan[index].append((pk, take))
+
+    return plan, product_of, cost_of
+
+
+def allocate_lines(items):
+    """
+    Assigns stock to new / edited lines (each with its saved invoice set, one or
+    several invoices) and writes them. Edited lines must have had their old stock
+    released first (release_invoice_items). A blank-batch line that spans several
+    batches is split into one line per batch, each carrying its batch's unit cost.
+
+    Set-based: one locking SELECT for chosen batches (+ one per FIFO product),
+    one UPDATE for every deduction, one bulk insert / update for the lines.
+    The ledger and invoice totals are left to the caller. Must run inside
+    transaction.atomic(). Raises StockAllocationError (nothing is written by this call then).
+    """
+    try:
+        plan, product_of, cost_of = _plan(items)
+    except StockAllocationError:
+        ALLOCATION_CONFLICTS.labels('rejected').inc()
+        raise
+
+    lines, deductions = [], defaultdict(int)
+    for item, allocations in zip(items, plan):
+        parts = allocations or [(item.purchase_item_id, item.quantity)]
+        for number, (batch_id, quantity) in enumerate(parts):
+            line = item if number == 0 else InvoiceItem(
+                invoice=item.invoice, product_id=item.product_id, sku=item.sku,
+                item_name=item.item_name, unit_price=item.unit_price,
+            )
+            line.invoice_date = item.invoice.invoice_date
+            line.purchase_item_id = batch_id
+            line.quantity = quantity
+            line.total_price = quantity * line.unit_price
+            line.set_cost(cost_of.get(batch_id))  # Frozen at allocation time
+            lines.append(line)
+            if batch_id:
+                deductions[batch_id] -= quantity
+
+    new = [line for line in lines if line.pk is None]
+    edited = [line for line in lines if line.pk is not None]
+    InvoiceItem.objects.bulk_create(new, batch_size=BULK_BATCH_SIZE)
+    InvoiceItem.objects.bulk_update(edited, LINE_FIELDS, batch_size=BULK_BATCH_SIZE)
+    _adjust_remaining(deductions, {product_of[pk] for pk in deductions})
+    return lines
+
+
+def allocate_invoice_items(invoice, items):
+    """
+    allocate_lines() for the lines of one invoice, then its ledger rows and totals.
+    Must run inside transaction.atomic(). Raises StockAllocationError.
+    """
+    for item in items:
+        item.invoice = invoice
+    lines = allocate_lines(items)
+
+    # bulk writes skip InvoiceItem.save(): ledger and totals once for the whole invoice
+    sync_stock_movements(invoice_items=InvoiceItem.objects.filter(invoice=invoice))
+    invoice.calculate_totals()
+    return lines
+
+
+# --- 4. COST SNAPSHOTS (lines written before costs were frozen) ---
+def backfill_invoice_costs(batch_size=5000, only_missing=False):
+    """
+    Copies each batch's current unit_cost onto the invoice lines that reference it,
+    one id range per UPDATE (short transactions on a large table). Returns rows updated.
+    """
+    lines = InvoiceItem.objects.filter(purchase_item__isnull=False)
+    if only_missing:
+        lines = lines.filter(unit_cost=0)
+    bounds = lines.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
+
+    batch_cost = Subquery(PurchaseItem.objects.filter(pk=OuterRef('purchase_item_id')).values('unit_cost')[:1])
+    updated = 0
+    for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+        updated += lines.filter(id__gte=start, id__lt=start + batch_size).update(
+            unit_cost=batch_cost,
+            total_cost=ExpressionWrapper(F('quantity') * batch_cost, output_field=DecimalField(max_digits=12, decimal_places=2)),
+        )
+    return updated
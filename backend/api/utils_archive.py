@@ -0,0 +1,315 @@
+import gzip
+import itertools
+import json
+from collections import Counter
+from datetime import date, datetime
+from operator import attrgetter
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, prefetch_related_objects
+
+from .models import (
+    ArchivedPeriod,
+    ArchivedRows,
+    Invoice,
+    InvoiceItem,
+    PurchaseItem,
+    PurchaseOrder,
+    SearchDocument,
+    StockMovement,
+    Tombstone,
+)
+from .utils_changes import CHANGE_FEEDS
+from .utils_partitions import ensure_partitions_for, month_start
+from .utils_search import SEARCH_DOCUMENTS, index_queryset
+from .utils_stock import invalidate_open_batches, month_end
+from .utils_versions import VERSIONED_MODELS, bump_data_version
+
+# Archived per (company, month), listed in insert order (restore); deletes run in reverse.
+# Stock movements stay in the ledger (balances must not change): only their links are archived.
+ARCHIVED_MODELS = (PurchaseOrder, PurchaseItem, Invoice, InvoiceItem)
+LEDGER_LINKS = StockMovement._meta.db_table
+DATE_FIELDS = {Invoice: 'invoice_date', PurchaseOrder: 'order_date'}
+BATCH_SIZE = 1000
+ARCHIVE_CHUNK_ROWS = 5000  # Rows per ArchivedRows part: archive / restore hold one part at a time
+
+
+class ArchiveError(Exception):
+    """A period can't be archived / restored (message is shown to the user)."""
+
+
+# --- 1. ENCODING (gzip'd JSON lines, one dict per row keyed by column) ---
+class ArchiveEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder, minus its millisecond rounding: restored timestamps are exact."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _pack(rows):
+    return gzip.compress('\n'.join(json.dumps(row, cls=ArchiveEncoder) for row in rows).encode())
+
+
+def _unpack(data):
+    text = gzip.decompress(bytes(data)).decode()
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def _columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def _instances(model, rows):
+    """Unsaved model instances with their archived pk and typed values."""
+    fields = model._meta.concrete_fields
+    return [model(**{field.attname: field.to_python(row[field.attname]) for field in fields}) for row in rows]
+
+
+def _archived(models, start_date, end_date, company=None):
+    """{model: [row, ...]} from the archived months overlapping [start_date, end_date]."""
+    by_table = {model._meta.db_table: model for model in models}
+    chunks = ArchivedRows.objects.filter(
+        table__in=by_table, period__month__gte=month_start(start_date), period__month__lte=end_date,
+    )
+    if company is not None:
+        chunks = chunks.filter(period__company=company)
+
+    rows = {model: [] for model in models}
+    for table, data in chunks.order_by('period__month', 'part').values_list('table', 'data').iterator(chunk_size=1):
+        rows[by_table[table]] += _unpack(data)
+    return rows
+
+
+def _write_parts(period, table, rows):
+    """Stores an iterable of rows as ArchivedRows parts of ARCHIVE_CHUNK_ROWS rows each."""
+    rows = iter(rows)
+    for part in itertools.count():
+        chunk = list(itertools.islice(rows, ARCHIVE_CHUNK_ROWS))
+        if not chunk:
+            return
+        ArchivedRows.objects.create(period=period, table=table, part=part, row_count=len(chunk), data=_pack(chunk))
+
+
+def _read_parts(period, table):
+    """The archived rows of one table, one part at a time."""
+    parts = period.chunks.filter(table=table).order_by('part').values_list('data', flat=True)
+    for data in parts.iterator(chunk_size=1):
+        yield _unpack(data)
+
+
+def _rows_by_id(model, ids):
+    """Current values of the given rows, ARCHIVE_CHUNK_ROWS ids per query."""
+    for start in range(0, len(ids), ARCHIVE_CHUNK_ROWS):
+        yield from model.objects.filter(pk__in=ids[start:start + ARCHIVE_CHUNK_ROWS]).order_by('pk').values(*_columns(model))
+
+
+# --- 2. ARCHIVING ---
+def archive_period(company, month, user=None):
+    """
+    Moves one closed month of a company out of the hot tables: its invoices + lines,
+    and its purchase orders + batches once they are sold out and no hot line outside
+    this month uses them (the others stay hot and can be archived with a later month).
+    All or nothing. Returns the ArchivedPeriod.
+    """
+    month = month_start(month)
+    if month >= month_start(date.today()):
+        raise ArchiveError(f"{month:%Y-%m} is not closed yet: only past months can be archived.")
+    period_range = (month, month_end(month))
+
+    with transaction.atomic():
+        if ArchivedPeriod.objects.filter(company=company, month=month).exists():
+            raise ArchiveError(f"{month:%Y-%m} of {company} is already archived.")
+
+        # A. What leaves (ids first: the querysets below must not change under the deletes)
+        invoice_ids = list(Invoice.objects.filter(company=company, invoice_date__range=period_range).values_list('pk', flat=True))
+        line_ids = list(
+            InvoiceItem.objects.filter(invoice_id__in=invoice_ids, invoice_date__range=period_range).values_list('pk', flat=True)
+        )
+        held = PurchaseItem.objects.filter(purchase_order=OuterRef('pk')).filter(
+            Q(remaining_quantity__gt=0)
+            | Exists(InvoiceItem.objects.filter(purchase_item=OuterRef('pk')).exclude(pk__in=line_ids))
+        )
+        order_ids = list(
+            PurchaseOrder.objects.filter(company=company, order_date__range=period_range)
+            .exclude(Exists(held)).values_list('pk', flat=True)
+        )
+        batch_ids = list(PurchaseItem.objects.filter(purchase_order_id__in=order_ids).values_list('pk', flat=True))
+        selected = {PurchaseOrder: order_ids, PurchaseItem: batch_ids, Invoice: invoice_ids, InvoiceItem: line_ids}
+        if not invoice_ids and not order_ids:
+            raise ArchiveError(f"Nothing to archive for {company} in {month:%Y-%m}.")
+
+        # B. Compressed copies
+        period = ArchivedPeriod.objects.create(
+            company=company, month=month, archived_by=user,
+            invoice_count=len(invoice_ids), purchase_order_count=len(order_ids),
+        )
+        for model, ids in selected.items():
+            _write_parts(period, model._meta.db_table, _rows_by_id(model, ids))
+        ledger = StockMovement.objects.filter(Q(invoice_item_id__in=line_ids) | Q(purchase_item_id__in=batch_ids))
+        _write_parts(period, LEDGER_LINKS, ledger.order_by('pk').values('id', 'invoice_item_id', 'purchase_item_id').iterator())
+
+        # C. Ledger rows stay (stock balances are unchanged), unlinked from the lines
+        ledger.update(invoice_item=None, purchase_item=None)
+
+        # D. Hot rows go
+        _delete_hot_rows(company, selected)
+
+    return period
+
+
+def _delete_hot_rows(company, selected):
+    """
+    Deletes the archived rows without the per-row delete signals (each would cost a
+    Tombstone INSERT, a SearchDocument DELETE and a data-version bump, and the
+    Collector loads every instance): their work is done here once per table.
+    Archived batches are sold out, so no open-batch list changes.
+    """
+    feeds = {model: resource for resource, (model, _) in CHANGE_FEEDS.items()}
+    for model in reversed(ARCHIVED_MODELS):  # Lines before their headers
+        ids = selected[model]
+        if not ids:
+            continue
+        if model in feeds:
+            Tombstone.objects.bulk_create(
+                [Tombstone(resource=feeds[model], object_id=pk, company=company) for pk in ids], batch_size=BATCH_SIZE,
+            )
+        if model in SEARCH_DOCUMENTS:
+            SearchDocument.objects.filter(resource=SEARCH_DOCUMENTS[model][0], object_id__in=ids).delete()
+        if model in VERSIONED_MODELS:
+            bump_data_version(VERSIONED_MODELS[model], company.pk)
+        for start in range(0, len(ids), ARCHIVE_CHUNK_ROWS):
+            # Plain DELETE: ledger rows were unlinked above and lines go before headers, nothing cascades
+            model.objects.filter(pk__in=ids[start:start + ARCHIVE_CHUNK_ROWS])._raw_delete(model.objects.db)
+
+
+# --- 3. RESTORE ---
+def _insert(model, rows):
+    objects = _instances(model, rows)
+    if model is Invoice:  # The month's partitions may have been detached meanwhile
+        ensure_partitions_for(obj.invoice_date for obj in objects)
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+    # bulk_create stamps auto_now_add columns with now(): put the archived values back
+    stamped = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now_add', False)]
+    if stamped and objects:
+        for obj, row in zip(objects, rows):
+            for field in stamped:
+                setattr(obj, field.attname, field.to_python(row[field.attname]))
+        model.objects.bulk_update(objects, [field.name for field in stamped], batch_size=BATCH_SIZE)
+    return objects
+
+
+def restore_period(company, month):
+    """
+    Moves an archived month back into the hot tables with its original ids.
+    Months holding batches that its lines sold from are restored first.
+    On Postgres the month's partition must still be attached (see utils_partitions).
+    Returns {table: rows restored}.
+    """
+    month = month_start(month)
+    with transaction.atomic():
+        period = ArchivedPeriod.objects.select_for_update().filter(company=company, month=month).first()
+        if period is None:
+            raise ArchiveError(f"{month:%Y-%m} of {company} is not archived.")
+        def ids(model, column='id'):
+            return {row[column] for rows in _read_parts(period, model._meta.db_table) for row in rows}
+
+        # A. Batches the lines point at must exist again (PROTECT FK)
+        wanted = ids(InvoiceItem, 'purchase_item_id') - ids(PurchaseItem) - {None}
+        wanted -= set(PurchaseItem.objects.filter(pk__in=wanted).values_list('pk', flat=True))
+        for other in ArchivedPeriod.objects.exclude(pk=period.pk).order_by('month'):
+            if not wanted:
+                break
+            archived = {row['id'] for row in _archived((PurchaseItem,), other.month, other.month, other.company)[PurchaseItem]}
+            if archived & wanted:
+                restore_period(other.company, other.month)
+                wanted -= archived
+        if wanted:
+            raise ArchiveError(f"Batches {sorted(wanted)} used by {month:%Y-%m} no longer exist.")
+
+        # B. Rows (one part at a time), then the ledger links
+        restored = {model: [] for model in ARCHIVED_MODELS}  # Ids only
+        products = set()
+        for model in ARCHIVED_MODELS:
+            for rows in _read_parts(period, model._meta.db_table):
+                restored[model] += [obj.pk for obj in _insert(model, rows)]
+                if model is PurchaseItem:
+                    products |= {row['product_id'] for row in rows}
+        for rows in _read_parts(period, LEDGER_LINKS):
+            StockMovement.objects.bulk_update([
+                StockMovement(pk=row['id'], invoice_item_id=row['invoice_item_id'], purchase_item_id=row['purchase_item_id'])
+                for row in rows
+            ], ['invoice_item', 'purchase_item'], batch_size=BATCH_SIZE)
+
+        # C. bulk_create sends no signals
+        bump_data_version('invoices', company.pk)
+        bump_data_version('purchase_orders', company.pk)
+        index_queryset(Invoice.objects.filter(pk__in=restored[Invoice]))
+        index_queryset(PurchaseOrder.objects.filter(pk__in=restored[PurchaseOrder]))
+        invalidate_open_batches(products)
+
+        period.delete()
+    return {model._meta.db_table: len(restored[model]) for model in ARCHIVED_MODELS}
+
+
+# --- 4. READING (reports over archived months) ---
+def archived_instances(model, start_date, end_date, company=None):
+    """Unsaved Invoice / PurchaseOrder instances archived with a date in the range."""
+    date_field = DATE_FIELDS[model]
+    rows = _archived((model,), start_date, end_date, company)[model]
+    return [obj for obj in _instances(model, rows) if start_date <= getattr(obj, date_field) <= end_date]
+
+
+def with_archived(queryset, start_date, end_date, company=None):
+    """
+    The rows of a dated report queryset plus its archived rows, in the queryset's order.
+    The queryset's select_related() relations are loaded for the archived rows too (one query each).
+    Returns the queryset untouched when nothing in the range is archived.
+    """
+    archived = archived_instances(queryset.model, start_date, end_date, company)
+    if not archived:
+        return queryset
+    if isinstance(queryset.query.select_related, dict):
+        prefetch_related_objects(archived, *queryset.query.select_related)
+    rows = list(queryset) + archived
+    for field in reversed(queryset.query.order_by):  # Stable sorts, last key first
+        rows.sort(key=attrgetter(field.lstrip('-')), reverse=field.startswith('-'))
+    return rows
+
+
+def archived_invoice_lines(start_date, end_date, company=None):
+    """Archived invoice lines dated in the range, with their header's status / platform_name."""
+    rows = _archived((Invoice, InvoiceItem), start_date, end_date, company)
+    headers = {row['id']: row for row in rows[Invoice]}
+    lines = []
+    for row in rows[InvoiceItem]:
+        day = date.fromisoformat(row['invoice_date'])
+        if start_date <= day <= end_date:
+            header = headers[row['invoice_id']]
+            lines.append({**row, 'invoice_date': day, 'status': header['status'], 'platform_name': header['platform_name']})
+    return lines
+
+
+def archived_stock_quantities(start_date, end_date):
+    """
+    Per product (all companies, like the stock report): units received / billed-sold
+    in the range, from the archived months it overlaps only. All-time balances come
+    from the stock ledger, which keeps archived rows.
+    """
+    rows = _archived(ARCHIVED_MODELS, start_date, end_date)
+    order_dates = {row['id']: date.fromisoformat(row['order_date']) for row in rows[PurchaseOrder]}
+    statuses = {row['id']: row['status'] for row in rows[Invoice]}
+    quantities = {key: Counter() for key in ('received', 'sold')}
+
+    for row in rows[PurchaseItem]:
+        if start_date <= order_dates[row['purchase_order_id']] <= end_date:
+            quantities['received'][row['product_id']] += row['quantity']
+
+    for row in rows[InvoiceItem]:
+        if row['product_id'] is None:
+            continue
+        if statuses[row['invoice_id']] == 'BILLED' and start_date <= date.fromisoformat(row['invoice_date']) <= end_date:
+            quantities['sold'][row['product_id']] += row['quantity']
+    return quantities
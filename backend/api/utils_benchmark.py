@@ -0,0 +1,191 @@
+import random
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from .models import (
+    Company,
+    Invoice,
+    InvoiceItem,
+    Product,
+    PurchaseItem,
+    PurchaseOrder,
+    Transaction,
+    Vendor,
+)
+from .utils_partitions import ensure_partitions_between
+from .utils_pnl import generate_pnl_report
+from .utils_reports import (
+    generate_purchase_tax_report,
+    generate_sales_tax_report,
+    generate_stock_report,
+)
+from .utils_stock import build_stock_snapshots, rebuild_stock_movements
+
+PLATFORMS = ['Shopee', 'TikTok Shop', 'Lazada', '']
+BATCH_SIZE = 2000
+
+
+# --- 1. SEEDING ---
+def seed_benchmark_data(invoices=10000, companies=1, products=500, end_date=None, months=12, seed=42):
+    """
+    Bulk-seeds a realistic-ish dataset (bypasses model save() hooks for speed),
+    then rebuilds the stock ledger. Returns a dict of row counts.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=30 * months)
+    span_days = (end_date - start_date).days
+
+    def random_day():
+        return start_date + timedelta(days=rng.randint(0, span_days))
+
+    user, _ = User.objects.get_or_create(username='benchmark')
+    counts = {'invoices': 0, 'invoice_items': 0, 'purchase_orders': 0, 'purchase_items': 0}
+    ensure_partitions_between(start_date, end_date)  # bulk_create skips Invoice.save()
+
+    with transaction.atomic():
+        for c in range(companies):
+            company = Company.objects.create(name=f"Bench Company {c + 1}", tax_id=f"{c:013d}")
+            vendors = Vendor.objects.bulk_create([
+                Vendor(company=company, name=f"Vendor {v}") for v in range(5)
+            ])
+            company_products = Product.objects.bulk_create([
+                Product(
+                    company=company, sku=f"B{c}-{p:05d}", name=f"Bench Product {p}",
+                    category=rng.choice(['SMARTPHONE', 'ACCESSORY', 'TABLET', 'OTHER']),
+                    cost_price=Decimal(rng.randint(50, 5000)),
+                    selling_price=Decimal(rng.randint(60, 6000)),
+                ) for p in range(products)
+            ], batch_size=BATCH_SIZE)
+
+            # A. Purchase orders: one PO per 20 invoices, 1-5 batches each
+            orders = PurchaseOrder.objects.bulk_create([
+                PurchaseOrder(
+                    company=company, po_number=f"PO-{c}-{i:07d}", vendor=rng.choice(vendors),
+                    order_date=random_day(), status='PAID', created_by=user,
+                ) for i in range(max(1, invoices // 20))
+            ], batch_size=BATCH_SIZE)
+
+            batches = []
+            for order in orders:
+                subtotal = Decimal(0)
+                for _ in range(rng.randint(1, 5)):
+                    qty = rng.randint(10, 200)
+                    cost = Decimal(rng.randint(50, 5000))
+                    batches.append(PurchaseItem(
+                        purchase_order=order, product=rng.choice(company_products), quantity=qty,
+                        unit_cost=cost, total_price=qty * cost, remaining_quantity=qty,
+                    ))
+                    subtotal += qty * cost
+                order.subtotal = subtotal
+                order.tax_amount = (subtotal - subtotal / Decimal('1.07')).quantize(Decimal('0.01'))
+                order.total_amount = subtotal + order.tax_amount
+            PurchaseOrder.objects.bulk_update(orders, ['subtotal', 'tax_amount', 'total_amount'], batch_size=BATCH_SIZE)
+            batches = PurchaseItem.objects.bulk_create(batches, batch_size=BATCH_SIZE)
+
+            # B. Invoices with 1-3 lines each, linked to a batch for COGS
+            for chunk_start in range(0, invoices, BATCH_SIZE):
+                chunk = range(chunk_start, min(invoices, chunk_start + BATCH_SIZE))
+                headers = Invoice.objects.bulk_create([
+                    Invoice(
+                        company=company, invoice_number=f"INV-{c}-{i:08d}", invoice_date=random_day(),
+                        status=rng.choice(['BILLED', 'BILLED', 'BILLED', 'DRAFT', 'CANCELLED']),
+                        platform_name=rng.choice(PLATFORMS), platform_order_id=f"{c}{i:012d}",
+                        platform_tracking_number=f"TH{i:012d}", recipient_name=f"Customer {i}",
+                        recipient_phone=f"08{i % 100000000:08d}", created_by=user,
+                    ) for i in chunk
+                ])
+
+                lines = []
+                for header in headers:
+                    subtotal = Decimal(0)
+                    for _ in range(rng.randint(1, 3)):
+                        batch = rng.choice(batches)
+                        qty = rng.randint(1, 3)
+                        price = batch.unit_cost * Decimal('1.2')
+                        lines.append(InvoiceItem(
+                            invoice=header, invoice_date=header.invoice_date, product_id=batch.product_id, purchase_item=batch,
+                            sku=f"EXT-{batch.product_id}", quantity=qty, unit_price=price, total_price=qty * price,
+                            unit_cost=batch.unit_cost, total_cost=qty * batch.unit_cost,
+                        ))
+                        subtotal += qty * price
+                    header.subtotal = subtotal
+                    header.grand_total = subtotal
+                    header.tax_amount = (subtotal - subtotal / Decimal('1.07')).quantize(Decimal('0.01'))
+                Invoice.objects.bulk_update(headers, ['subtotal', 'grand_total', 'tax_amount'], batch_size=BATCH_SIZE)
+                InvoiceItem.objects.bulk_create(lines, batch_size=BATCH_SIZE)
+                counts['invoice_items'] += len(lines)
+
+            Transaction.objects.bulk_create([
+                Transaction(
+                    company=company, transaction_number=f"TX-{c}-{t:06d}", transaction_date=random_day(),
+                    type=rng.choice(['INCOME', 'EXPENSE']), category=rng.choice(['RENT', 'SALARY', 'DELIVERY', 'OTHER']),
+                    amount=Decimal(rng.randint(100, 50000)), description='benchmark', created_by=user,
+                ) for t in range(max(1, invoices // 100))
+            ], batch_size=BATCH_SIZE)
+
+            counts['invoices'] += invoices
+            counts['purchase_orders'] += len(orders)
+            counts['purchase_items'] += len(batches)
+
+    # Stock ledger + month-end checkpoints (as the production command would)
+    rebuild_stock_movements()
+    build_stock_snapshots(upto=end_date)
+
+    return counts
+
+
+# --- 2. TIMING ---
+def report_specs(company, start_date, end_date):
+    """(name, callable) pairs covering every report the dashboard can produce."""
+    return [
+        ('purchase_tax', lambda: generate_purchase_tax_report(
+            PurchaseOrder.objects.filter(company=company, order_date__range=[start_date, end_date]).order_by('order_date'),
+            company, start_date, end_date)),
+        ('sales_tax', lambda: generate_sales_tax_report(
+            Invoice.objects.filter(invoice_date__range=[start_date, end_date]).order_by('invoice_date', 'invoice_number'),
+            company, start_date, end_date)),
+        ('stock_report', lambda: generate_stock_report(company, start_date, end_date)),
+        ('stock_as_of', lambda: generate_stock_report(company, start_date, end_date, as_of_date=end_date)),
+        ('profit_loss', lambda: generate_pnl_report(company, start_date, end_date)),
+    ]
+
+
+def measure(func):
+    """
+    Runs func twice: once for wall time + query count, once under tracemalloc
+    for peak Python memory (tracemalloc slows execution, so it is kept separate).
+    """
+    with CaptureQueriesContext(connection) as ctx:
+        started = time.perf_counter()
+        response = func()
+        seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'seconds': round(seconds, 4),
+        'queries': len(ctx.captured_queries),
+        'peak_memory_bytes': peak,
+        'output_bytes': len(response.content),
+    }
+
+
+def run_report_benchmarks(company, start_date, end_date, only=None):
+    results = []
+    for name, func in report_specs(company, start_date, end_date):
+        if only and name not in only:
+            continue
+        results.append({'report': name, **measure(func)})
+    return results
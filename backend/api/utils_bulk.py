@@ -0,0 +1,443 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .models import (
+    Company,
+    Customer,
+    Invoice,
+    InvoiceItem,
+    Product,
+    PurchaseItem,
+    PurchaseOrder,
+    Vendor,
+)
+from .serializers import (
+    BulkInvoiceSerializer,
+    BulkInvoiceUpdateSerializer,
+    BulkPurchaseOrderSerializer,
+    BulkPurchaseOrderUpdateSerializer,
+)
+from .utils_allocation import StockAllocationError, allocate_lines, release_invoice_items
+from .utils_partitions import ensure_partitions_for, lock_invoice_numbers
+from .utils_pdf import schedule_invoice_pdf
+from .utils_search import index_queryset
+from .utils_stock import delete_stock_movements, invalidate_open_batches, sync_stock_movements
+from .utils_versions import bump_data_version
+
+MAX_BULK_DOCUMENTS = 1000
+BATCH_SIZE = 1000
+
+
+# --- 1. VALIDATION (whole batch, before any write) ---
+def _existing_ids(model, ids):
+    ids = {pk for pk in ids if pk is not None}
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True)) if ids else set()
+
+
+def _validate_shapes(serializer_class, payload):
+    """
+    Field-level validation per document (no queries: relations are plain ids).
+    Returns (documents, errors) with one entry per input document;
+    documents[i] is None when errors[i] is set.
+    """
+    documents, errors = [], []
+    for data in payload:
+        serializer = serializer_class(data=data)
+        if serializer.is_valid():
+            documents.append(serializer.validated_data)
+            errors.append({})
+        else:
+            documents.append(None)
+            errors.append(serializer.errors)
+    return documents, errors
+
+
+def _add_error(errors, index, field, message):
+    errors[index].setdefault(field, []).append(message)
+
+
+def _results(documents, errors, created_ids=None, status='created'):
+    """Per-document outcome. If anything failed, nothing was written."""
+    results = []
+    for index, document in enumerate(documents):
+        if errors[index]:
+            results.append({'index': index, 'status': 'error', 'errors': errors[index]})
+        elif created_ids is None:
+            results.append({'index': index, 'status': 'skipped'})  # Valid, but the batch was rejected
+        else:
+            results.append({'index': index, 'status': status, 'id': created_ids[index]})
+    return results
+
+
+# --- 2. INVOICES ---
+INVOICE_HEADER_FIELDS = [
+    name for name in BulkInvoiceSerializer.Meta.fields if name != 'items'
+] + ['subtotal', 'tax_amount', 'grand_total', 'updated_at']  # bulk_update() skips auto_now
+
+
+def _check_invoices(valid, errors, updating=()):
+    """
+    Reference and invoice-number checks, one query per model. `updating`: ids of
+    the invoices being replaced (their current numbers don't count as taken, and
+    the stock their lines hold counts as available). Chosen batches are locked
+    in pk order so concurrent batches can't oversell or deadlock each other.
+    """
+    # A. References
+    companies = _existing_ids(Company, (doc['company'] for _, doc in valid))
+    customers = _existing_ids(Customer, (doc.get('customer') for _, doc in valid))
+    products = _existing_ids(Product, (item.get('product') for _, doc in valid for item in doc['items']))
+    batch_ids = {item.get('purchase_item') for _, doc in valid for item in doc['items']} - {None}
+    batches = {
+        row['pk']: row for row in
+        PurchaseItem.objects.select_for_update().filter(pk__in=batch_ids).order_by('pk')
+        .values('pk', 'product_id', 'remaining_quantity')
+    }
+    if updating and batches:
+        held = (
+            InvoiceItem.objects.filter(invoice_id__in=updating, purchase_item_id__in=batches)
+            .values('purchase_item_id').annotate(qty=Sum('quantity')).order_by()
+        )
+        for row in held:  # Released before the new lines are allocated
+            batches[row['purchase_item_id']]['remaining_quantity'] += row['qty']
+
+    # B. Invoice numbers: unique per company, within the batch and against the DB
+    keys = Counter((doc['company'], doc['invoice_number']) for _, doc in valid)
+    lock_invoice_numbers(keys)  # Until commit: no concurrent writer can take them after this check
+    taken = set()
+    if keys:
+        condition = Q()
+        for company_id, number in keys:
+            condition |= Q(company_id=company_id, invoice_number=number)
+        taken = set(Invoice.objects.filter(condition).exclude(pk__in=updating).values_list('company_id', 'invoice_number'))
+
+    requested = Counter()
+    for index, doc in valid:
+        key = (doc['company'], doc['invoice_number'])
+        if doc['company'] not in companies:
+            _add_error(errors, index, 'company', f"Company {doc['company']} does not exist.")
+        if doc.get('customer') is not None and doc['customer'] not in customers:
+            _add_error(errors, index, 'customer', f"Customer {doc['customer']} does not exist.")
+        if key in taken:
+            _add_error(errors, index, 'invoice_number', f"Invoice {doc['invoice_number']} already exists.")
+        elif keys[key] > 1:
+            _add_error(errors, index, 'invoice_number', f"Invoice {doc['invoice_number']} is repeated in this batch.")
+
+        for line, item in enumerate(doc['items'], start=1):
+            product_id, batch_id = item.get('product'), item.get('purchase_item')
+            if product_id is not None and product_id not in products:
+                _add_error(errors, index, 'items', f"Line {line}: product {product_id} does not exist.")
+            if batch_id is not None:
+                batch = batches.get(batch_id)
+                if batch is None:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {batch_id} does not exist.")
+                elif product_id is not None and batch['product_id'] != product_id:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {batch_id} does not belong to product {product_id}.")
+                else:
+                    requested[batch_id] += item['quantity']
+
+    # C. Chosen batches: everything asked for in this batch must fit (blank lines are checked by the FIFO planner)
+    for batch_id, quantity in requested.items():
+        if quantity > batches[batch_id]['remaining_quantity']:
+            for index, doc in valid:
+                if any(item.get('purchase_item') == batch_id for item in doc['items']):
+                    _add_error(errors, index, 'items', (
+                        f"Batch {batch_id}: {quantity} requested in this batch, "
+                        f"only {batches[batch_id]['remaining_quantity']} available."
+                    ))
+
+
+def _invoice_lines(headers, valid):
+    """Unsaved lines for saved headers + the document index each line came from."""
+    lines, owners = [], []
+    for invoice, (index, doc) in zip(headers, valid):
+        for item in doc['items']:
+            lines.append(InvoiceItem(
+                invoice=invoice,
+                product_id=item.get('product'),
+                purchase_item_id=item.get('purchase_item'),
+                sku=item.get('sku', ''),
+                item_name=item.get('item_name', ''),
+                quantity=item['quantity'],
+                unit_price=item['unit_price'],
+            ))
+            owners.append(index)
+    return lines, owners
+
+
+def _set_header(invoice, doc):
+    """Header fields + totals in memory (FIFO splits keep the line sums)."""
+    for name, value in doc.items():
+        if name not in ('id', 'items', 'company', 'customer'):
+            setattr(invoice, name, value)
+    invoice.company_id = doc['company']
+    invoice.customer_id = doc.get('customer')
+    invoice.updated_at = timezone.now()  # Change feed cursor, PDF cache key / ETag
+    invoice.apply_totals(sum(item['quantity'] * item['unit_price'] for item in doc['items']))
+
+
+def _finish_invoices(headers):
+    """Ledger, cache versions, search index and PDF pre-render (bulk writes skip save() and signals)."""
+    sync_stock_movements(invoice_items=InvoiceItem.objects.filter(invoice__in=headers))
+    for company_id in {invoice.company_id for invoice in headers}:
+        bump_data_version('invoices', company_id)
+    index_queryset(Invoice.objects.filter(pk__in=[invoice.pk for invoice in headers]))
+    for invoice in headers:
+        if invoice.status == 'BILLED':
+            schedule_invoice_pdf(invoice.pk)
+
+
+def bulk_create_invoices(payload, user):
+    """
+    Creates invoices + lines from a list of JSON documents in one transaction.
+    All or nothing: returns (results, created_count).
+    Stock goes through the allocation service like single invoices: a chosen batch
+    (purchase_item) is used as given, a blank one is filled FIFO. Totals are computed once per invoice.
+    """
+    documents, errors = _validate_shapes(BulkInvoiceSerializer, payload)
+    valid = [(i, doc) for i, doc in enumerate(documents) if doc is not None]
+
+    with transaction.atomic():
+        _check_invoices(valid, errors)
+        if any(errors):
+            return _results(documents, errors), 0
+
+        headers = []
+        for _, doc in valid:
+            invoice = Invoice(created_by=user)
+            _set_header(invoice, doc)
+            headers.append(invoice)
+        ensure_partitions_for(invoice.invoice_date for invoice in headers)  # bulk_create skips Invoice.save()
+
+        try:
+            with transaction.atomic():
+                Invoice.objects.bulk_create(headers, batch_size=BATCH_SIZE)
+                lines, owners = _invoice_lines(headers, valid)
+                allocate_lines(lines)  # Set-based for the whole batch
+        except StockAllocationError as e:
+            for line in e.lines:
+                _add_error(errors, owners[line], 'items', str(e))
+            return _results(documents, errors), 0
+
+        _finish_invoices(headers)
+
+    created_ids = {index: invoice.pk for (index, _), invoice in zip(valid, headers)}
+    return _results(documents, errors, created_ids), len(headers)
+
+
+def bulk_update_invoices(payload, user):
+    """
+    Replaces existing invoices (header + all lines) from JSON documents carrying
+    their "id". Same whole-batch validation and all-or-nothing rule as creation:
+    returns (results, updated_count). The old lines' stock is released, then the
+    new lines are allocated like bulk_create_invoices().
+    """
+    documents, errors = _validate_shapes(BulkInvoiceUpdateSerializer, payload)
+    valid = [(i, doc) for i, doc in enumerate(documents) if doc is not None]
+
+    with transaction.atomic():
+        ids = Counter(doc['id'] for _, doc in valid)
+        invoices = Invoice.objects.select_for_update().filter(pk__in=ids).order_by('pk').in_bulk()
+        for index, doc in valid:
+            if doc['id'] not in invoices:
+                _add_error(errors, index, 'id', f"Invoice {doc['id']} does not exist.")
+            elif ids[doc['id']] > 1:
+                _add_error(errors, index, 'id', f"Invoice {doc['id']} is repeated in this batch.")
+        _check_invoices(valid, errors, updating=list(invoices))
+        if any(errors):
+            return _results(documents, errors), 0
+
+        headers = [invoices[doc['id']] for _, doc in valid]
+        for invoice, (_, doc) in zip(headers, valid):
+            _set_header(invoice, doc)
+        ensure_partitions_for(invoice.invoice_date for invoice in headers)  # bulk_update skips Invoice.save()
+
+        try:
+            with transaction.atomic():
+                old_lines = InvoiceItem.objects.filter(invoice__in=headers)
+                release_invoice_items(old_lines)
+                delete_stock_movements(invoice_items=old_lines)
+                old_lines.delete()
+                Invoice.objects.bulk_update(headers, INVOICE_HEADER_FIELDS, batch_size=BATCH_SIZE)
+                lines, owners = _invoice_lines(headers, valid)
+                allocate_lines(lines)
+        except StockAllocationError as e:
+            for line in e.lines:
+                _add_error(errors, owners[line], 'items', str(e))
+            return _results(documents, errors), 0
+
+        _finish_invoices(headers)
+
+    updated_ids = {index: invoice.pk for (index, _), invoice in zip(valid, headers)}
+    return _results(documents, errors, updated_ids, status='updated'), len(headers)
+
+
+# --- 3. PURCHASE ORDERS ---
+PURCHASE_ORDER_HEADER_FIELDS = [
+    name for name in BulkPurchaseOrderSerializer.Meta.fields if name != 'items'
+] + ['subtotal', 'tax_amount', 'total_amount', 'updated_at']  # bulk_update() skips auto_now
+
+
+def _check_purchase_orders(valid, errors):
+    """Reference checks, one query per model."""
+    companies = _existing_ids(Company, (doc['company'] for _, doc in valid))
+    vendors = _existing_ids(Vendor, (doc['vendor'] for _, doc in valid))
+    products = _existing_ids(Product, (item['product'] for _, doc in valid for item in doc['items']))
+
+    for index, doc in valid:
+        if doc['company'] not in companies:
+            _add_error(errors, index, 'company', f"Company {doc['company']} does not exist.")
+        if doc['vendor'] not in vendors:
+            _add_error(errors, index, 'vendor', f"Vendor {doc['vendor']} does not exist.")
+        for line, item in enumerate(doc['items'], start=1):
+            if item['product'] not in products:
+                _add_error(errors, index, 'items', f"Line {line}: product {item['product']} does not exist.")
+
+
+def _set_order_header(order, doc):
+    """Header fields + totals in memory."""
+    for name, value in doc.items():
+        if name not in ('id', 'items', 'company', 'vendor'):
+            setattr(order, name, value)
+    order.company_id = doc['company']
+    order.vendor_id = doc['vendor']
+    order.updated_at = timezone.now()  # Change feed cursor
+    order.apply_totals(sum(item['quantity'] * item['unit_cost'] for item in doc['items']))
+
+
+def _finish_purchase_orders(headers, product_ids):
+    """Ledger, cache versions, search index and open-batch cache (bulk writes skip save() and signals)."""
+    sync_stock_movements(purchase_items=PurchaseItem.objects.filter(purchase_order__in=headers))
+    for company_id in {order.company_id for order in headers}:
+        bump_data_version('purchase_orders', company_id)
+    index_queryset(PurchaseOrder.objects.filter(pk__in=[order.pk for order in headers]))
+    invalidate_open_batches(product_ids)
+
+
+def bulk_create_purchase_orders(payload, user):
+    """
+    Creates POs + batches from a list of JSON documents in one transaction.
+    All or nothing: returns (results, created_count). Totals are computed once per PO.
+    """
+    documents, errors = _validate_shapes(BulkPurchaseOrderSerializer, payload)
+    valid = [(i, doc) for i, doc in enumerate(documents) if doc is not None]
+
+    _check_purchase_orders(valid, errors)
+    if any(errors):
+        return _results(documents, errors), 0
+
+    with transaction.atomic():
+        headers = []
+        for _, doc in valid:
+            order = PurchaseOrder(created_by=user)
+            _set_order_header(order, doc)
+            headers.append(order)
+        PurchaseOrder.objects.bulk_create(headers, batch_size=BATCH_SIZE)
+
+        batches = [
+            PurchaseItem(
+                purchase_order=order,
+                product_id=item['product'],
+                quantity=item['quantity'],
+                unit_cost=item['unit_cost'],
+                total_price=item['quantity'] * item['unit_cost'],
+                remaining_quantity=item['quantity'],
+            )
+            for order, (_, doc) in zip(headers, valid) for item in doc['items']
+        ]
+        PurchaseItem.objects.bulk_create(batches, batch_size=BATCH_SIZE)
+        _finish_purchase_orders(headers, {batch.product_id for batch in batches})
+
+    created_ids = {index: order.pk for (index, _), order in zip(valid, headers)}
+    return _results(documents, errors, created_ids), len(headers)
+
+
+def bulk_update_purchase_orders(payload, user):
+    """
+    Replaces existing POs (header + batches) from JSON documents carrying their "id".
+    A line with an "id" edits that batch, one without adds a batch, and batches left
+    out are removed. Units already sold stay sold: a batch keeps quantity - remaining
+    as sold, can't shrink below it, and can only change product or be removed when
+    nothing was sold. All or nothing: returns (results, updated_count).
+    """
+    documents, errors = _validate_shapes(BulkPurchaseOrderUpdateSerializer, payload)
+    valid = [(i, doc) for i, doc in enumerate(documents) if doc is not None]
+
+    with transaction.atomic():
+        ids = Counter(doc['id'] for _, doc in valid)
+        orders = PurchaseOrder.objects.select_for_update().filter(pk__in=ids).order_by('pk').in_bulk()
+        # Locked: allocations change remaining_quantity under the same lock
+        current = {
+            row['pk']: row for row in
+            PurchaseItem.objects.select_for_update().filter(purchase_order_id__in=orders).order_by('pk')
+            .values('pk', 'purchase_order_id', 'product_id', 'quantity', 'remaining_quantity')
+        }
+        listed = Counter(item.get('id') for _, doc in valid for item in doc['items'])
+
+        for index, doc in valid:
+            if doc['id'] not in orders:
+                _add_error(errors, index, 'id', f"Purchase order {doc['id']} does not exist.")
+                continue
+            if ids[doc['id']] > 1:
+                _add_error(errors, index, 'id', f"Purchase order {doc['id']} is repeated in this batch.")
+            for line, item in enumerate(doc['items'], start=1):
+                if item.get('id') is None:
+                    continue
+                batch = current.get(item['id'])
+                if batch is None or batch['purchase_order_id'] != doc['id']:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {item['id']} is not on this purchase order.")
+                    continue
+                sold = batch['quantity'] - batch['remaining_quantity']
+                if listed[item['id']] > 1:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {item['id']} is repeated.")
+                if item['quantity'] < sold:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {item['id']} has already sold {sold}.")
+                if sold and item['product'] != batch['product_id']:
+                    _add_error(errors, index, 'items', f"Line {line}: batch {item['id']} has sales, its product can't change.")
+        removed = [batch for batch in current.values() if batch['pk'] not in listed]
+        for batch in removed:
+            if batch['quantity'] != batch['remaining_quantity']:
+                for index, doc in valid:
+                    if doc['id'] == batch['purchase_order_id']:
+                        _add_error(errors, index, 'items', f"Batch {batch['pk']} has sales and can't be removed.")
+        _check_purchase_orders(valid, errors)
+        if any(errors):
+            return _results(documents, errors), 0
+
+        headers = [orders[doc['id']] for _, doc in valid]
+        for order, (_, doc) in zip(headers, valid):
+            _set_order_header(order, doc)
+        PurchaseOrder.objects.bulk_update(headers, PURCHASE_ORDER_HEADER_FIELDS, batch_size=BATCH_SIZE)
+
+        # Release: batches left out go with their ledger rows
+        gone = PurchaseItem.objects.filter(pk__in=[batch['pk'] for batch in removed])
+        delete_stock_movements(purchase_items=gone)
+        gone.delete()
+
+        # Re-derive: edited batches keep what they sold, new ones start full
+        edited, added = [], []
+        for order, (_, doc) in zip(headers, valid):
+            for item in doc['items']:
+                batch = PurchaseItem(
+                    pk=item.get('id'), purchase_order=order, product_id=item['product'],
+                    quantity=item['quantity'], unit_cost=item['unit_cost'],
+                    total_price=item['quantity'] * item['unit_cost'], remaining_quantity=item['quantity'],
+                )
+                if batch.pk is None:
+                    added.append(batch)
+                else:
+                    old = current[batch.pk]
+                    batch.remaining_quantity -= old['quantity'] - old['remaining_quantity']
+                    edited.append(batch)
+        PurchaseItem.objects.bulk_update(
+            edited, ['product', 'quantity', 'unit_cost', 'total_price', 'remaining_quantity'], batch_size=BATCH_SIZE,
+        )
+        PurchaseItem.objects.bulk_create(added, batch_size=BATCH_SIZE)
+
+        product_ids = {batch['product_id'] for batch in current.values()} | {batch.product_id for batch in edited + added}
+        _finish_purchase_orders(headers, product_ids)
+
+    updated_ids = {index: order.pk for (index, _), order in zip(valid, headers)}
+    return _results(documents, errors, updated_ids, status='updated'), len(headers)
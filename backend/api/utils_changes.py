@@ -0,0 +1,132 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Customer, Invoice, Product, Tombstone, Transaction, Vendor
+
+# Feed name -> (model, fields sent to clients). Every model here has updated_at
+# and an (updated_at, id) index; deletes are recorded as Tombstones (see signals.py).
+CHANGE_FEEDS = {
+    'invoices': (Invoice, [
+        'id', 'company_id', 'invoice_number', 'invoice_date', 'status', 'customer_id',
+        'subtotal', 'tax_amount', 'discount_amount', 'shipping_cost', 'grand_total',
+        'platform_name', 'platform_order_id', 'platform_order_status', 'platform_tracking_number',
+        'recipient_name', 'updated_at',
+    ]),
+    'products': (Product, [
+        'id', 'company_id', 'sku', 'name', 'category', 'cost_price', 'selling_price', 'is_active', 'updated_at',
+    ]),
+    'customers': (Customer, [
+        'id', 'company_id', 'name', 'phone', 'email', 'tax_id', 'is_active', 'updated_at',
+    ]),
+    'vendors': (Vendor, [
+        'id', 'company_id', 'name', 'contact_person', 'phone', 'email', 'tax_id', 'is_active', 'updated_at',
+    ]),
+    'transactions': (Transaction, [
+        'id', 'company_id', 'transaction_number', 'transaction_date', 'type', 'category', 'amount',
+        'description', 'reference', 'updated_at',
+    ]),
+}
+
+MAX_CHANGES_LIMIT = 1000
+
+
+def feed_for_model(model):
+    for resource, (feed_model, _) in CHANGE_FEEDS.items():
+        if feed_model is model:
+            return resource
+    return None
+
+
+# --- Cursor: keyset positions (timestamp, id) for the changed and the deleted stream ---
+def encode_cursor(changed, deleted):
+    data = {
+        'c': [changed[0].isoformat(), changed[1]] if changed else None,
+        'd': [deleted[0].isoformat(), deleted[1]] if deleted else None,
+    }
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError on a malformed cursor."""
+    if not cursor:
+        return None, None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return tuple(
+            (datetime.fromisoformat(data[key][0]), int(data[key][1])) if data.get(key) else None
+            for key in ('c', 'd')
+        )
+    except (TypeError, KeyError, IndexError, AttributeError, json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _after(queryset, field, position):
+    if position is None:
+        return queryset
+    stamp, pk = position
+    return queryset.filter(Q(**{f"{field}__gt": stamp}) | Q(**{field: stamp, 'id__gt': pk}))
+
+
+def settled_until():
+    """
+    Newest updated_at / deleted_at the feed may hand out: later stamps can still belong
+    to transactions that haven't committed (bulk writes, imports, archiving stamp rows at
+    statement time and commit much later). On Postgres that is the start of the oldest
+    open transaction that has written something, however long it runs; minus
+    CHANGES_SETTLE_SECONDS for stamps taken just before BEGIN and the app / DB clock gap.
+    """
+    upper = timezone.now()
+    if connection.vendor == 'postgresql':
+        # Sessions of the same role are visible without extra privileges; the activity view is
+        # snapshotted once per transaction, so drop that snapshot first (ATOMIC_REQUESTS, tests)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_stat_clear_snapshot(); SELECT min(xact_start) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND backend_xid IS NOT NULL AND pid <> pg_backend_pid()"
+            )
+            oldest = cursor.fetchone()[0]
+        if oldest is not None:
+            upper = min(upper, oldest)
+    return upper - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+
+
+def get_changes(resource, cursor=None, company=None, limit=500):
+    """
+    Rows changed and rows deleted after `cursor`, oldest first, plus the next cursor.
+    Rows stamped after settled_until() are held back until a later poll, so a
+    transaction that commits late with an older updated_at is not skipped.
+    """
+    model, fields = CHANGE_FEEDS[resource]
+    changed_pos, deleted_pos = decode_cursor(cursor)
+    upper = settled_until()
+
+    changed = _after(model.objects.filter(updated_at__lte=upper), 'updated_at', changed_pos)
+    deleted = _after(Tombstone.objects.filter(resource=resource, deleted_at__lte=upper), 'deleted_at', deleted_pos)
+    if company is not None:
+        changed = changed.filter(company_id=company)
+        deleted = deleted.filter(company_id=company)
+
+    rows = list(changed.order_by('updated_at', 'id').values(*fields)[:limit + 1])
+    tombstones = list(deleted.order_by('deleted_at', 'id').values_list('deleted_at', 'id', 'object_id')[:limit + 1])
+    has_more = len(rows) > limit or len(tombstones) > limit
+    rows, tombstones = rows[:limit], tombstones[:limit]
+
+    if rows:
+        changed_pos = (rows[-1]['updated_at'], rows[-1]['id'])
+    if tombstones:
+        deleted_pos = tombstones[-1][:2]
+
+    return {
+        'resource': resource,
+        'changed': [{k: str(v) if isinstance(v, Decimal) else v for k, v in row.items()} for row in rows],
+        'deleted': [object_id for _, _, object_id in tombstones],
+        'cursor': encode_cursor(changed_pos, deleted_pos),
+        'has_more': has_more,
+    }
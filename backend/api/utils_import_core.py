@@ -4,7 +4,10 @@ from decimal import Decimal, InvalidOperation
 from django.contrib.auth.models import User
 from django.utils import timezone
 from .models import Invoice, Company, InvoiceItem,ProductAlias
+from .utils_metrics import IMPORT_ORDERS, IMPORT_ROWS, IMPORT_SECONDS
+from .utils_stock import delete_stock_movements, sync_stock_movements
 import os
+import time
 
 # --- 1. SHARED HELPERS ---
 def load_data(file_path):
@@ -33,6 +36,7 @@ def universal_invoice_import(header_df, items_df, company_id, user_id, platform_
     It expects standard column names (standardized by the Processor functions).
     """
     print(f"--- Starting Import for {platform_name} ---")
+    started = time.perf_counter()
     
     # Validation
     required_cols = ['order_id', 'total_amount', 'subtotal']
@@ -115,8 +119,10 @@ def universal_invoice_import(header_df, items_df, company_id, user_id, platform_
                     }
                 )
 
-                # 2. Handle Items
-                InvoiceItem.objects.filter(invoice=invoice).delete()
+                # 2. Handle Items (a re-import replaces them; their ledger rows' checkpoints go stale)
+                old_items = InvoiceItem.objects.filter(invoice=invoice)
+                delete_stock_movements(invoice_items=old_items)
+                old_items.delete()
                 new_items = []
 
                 if order_id in items_grouped.groups:
@@ -130,6 +136,7 @@ def universal_invoice_import(header_df, items_df, company_id, user_id, platform_
 
                         new_items.append(InvoiceItem(
                             invoice=invoice,
+                            invoice_date=invoice.invoice_date,
                             product=internal_product,
                             purchase_item=None,
                             sku=external_key[:100], # Store the external key for mapping UI
@@ -141,12 +148,21 @@ def universal_invoice_import(header_df, items_df, company_id, user_id, platform_
 
                 if new_items:
                     InvoiceItem.objects.bulk_create(new_items)
+
+                # 3. Stock ledger (bulk_create skips InvoiceItem.save)
+                sync_stock_movements(invoice_items=InvoiceItem.objects.filter(invoice=invoice))
                 
                 success_count += 1
 
         except Exception as e:
             errors.append(f"Order {row.get('order_id')}: {str(e)}")
 
+    # Metrics: orders / rows per second per platform = rate() of these counters
+    IMPORT_ORDERS.labels(platform_name, 'imported').inc(success_count)
+    IMPORT_ORDERS.labels(platform_name, 'failed').inc(len(errors))
+    IMPORT_ROWS.labels(platform_name).inc(len(items_df))
+    IMPORT_SECONDS.labels(platform_name).observe(time.perf_counter() - started)
+
     return {
         "status": "completed",
         "imported": success_count,
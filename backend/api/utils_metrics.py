@@ -0,0 +1,76 @@
+import os
+
+from django.db import connection
+from prometheus_client import CONTENT_TYPE_LATEST as METRICS_CONTENT_TYPE, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Several gunicorn workers: PROMETHEUS_MULTIPROC_DIR (settings / gunicorn.conf.py) must be
+# set before this module is imported. Every process then writes its samples to files
+# there and /metrics/ sums them over all workers (see gunicorn.conf.py for the cleanup).
+
+# Seconds; reports and imports take far longer than page views
+REQUEST_BUCKETS = (.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+JOB_BUCKETS = (.1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+# --- 1. METRICS ---
+REQUESTS = Counter(
+    'http_requests', 'Requests handled, per view (URL pattern) and status code',
+    ['view', 'method', 'status'],
+)
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency per view (URL pattern)',
+    ['view', 'method'], buckets=REQUEST_BUCKETS,
+)
+IMPORT_ORDERS = Counter(
+    'import_orders', 'Platform orders imported (outcome: imported / failed)', ['platform', 'outcome'],
+)
+IMPORT_ROWS = Counter('import_rows', 'Platform order lines read from import files', ['platform'])
+IMPORT_SECONDS = Histogram('import_duration_seconds', 'Platform import time', ['platform'], buckets=JOB_BUCKETS)
+PDF_RENDER_SECONDS = Histogram('invoice_pdf_render_seconds', 'WeasyPrint render time per invoice PDF', buckets=JOB_BUCKETS)
+REPORT_SECONDS = Histogram('report_generation_seconds', 'Report generation time per report type', ['report'], buckets=JOB_BUCKETS)
+ALLOCATION_CONFLICTS = Counter(
+    'stock_allocation_conflicts',
+    'Invoice stock allocations that hit a conflict (lock_wait: batches held by another transaction, '
+    'rejected: not enough stock)',
+    ['reason'],
+)
+
+
+# --- 2. DATABASE CONNECTIONS (read at scrape time, not per process) ---
+class DatabaseConnectionsCollector:
+    """Server connections to this database by state, and the server's max_connections (Postgres)."""
+
+    def collect(self):
+        if connection.vendor != 'postgresql':
+            return
+        connections = GaugeMetricFamily(
+            'db_connections', 'Connections to this database by state (pg_stat_activity)', labels=['state'],
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COALESCE(state, 'unknown'), COUNT(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() GROUP BY 1"
+            )
+            for state, count in cursor.fetchall():
+                connections.add_metric([state], count)
+            cursor.execute("SELECT setting::int FROM pg_settings WHERE name = 'max_connections'")
+            max_connections = cursor.fetchone()[0]
+        yield connections
+        yield GaugeMetricFamily('db_max_connections', 'Server connection limit (max_connections)', value=max_connections)
+
+
+# --- 3. EXPOSITION ---
+_database_registry = CollectorRegistry()
+_database_registry.register(DatabaseConnectionsCollector())
+
+
+def render_metrics():
+    """Prometheus text format: every worker's samples when multiprocess (else this process), plus the database."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY  # runserver / a single process
+    return generate_latest(registry) + generate_latest(_database_registry)
@@ -0,0 +1,127 @@
+import base64
+import binascii
+import json
+from datetime import date
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 50
+
+
+# --- 1. CURSORS (opaque: base64 JSON of the boundary row's sort key) ---
+def _jsonable(value):
+    # Full precision: DjangoJSONEncoder would cut datetimes to milliseconds
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values, direction):
+    raw = json.dumps({'v': [_jsonable(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, fields):
+    """Returns (values, direction) or None for a missing / tampered cursor."""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values, direction = data['v'], data['d']
+        if direction not in ('n', 'p') or len(values) != len(fields):
+            return None
+        return [field.to_python(value) for field, value in zip(fields, values)], direction
+    except (ValueError, KeyError, TypeError, binascii.Error, ValidationError):
+        return None
+
+
+# --- 2. SEEK FILTER ---
+def _seek(ordering, values, forward):
+    """
+    Rows strictly after `values` in `ordering` (or before, if not forward):
+    (a, b) < (x, y)  ->  a <= x AND (a < x OR (a = x AND b < y)).
+    The redundant leading bound lets the planner use it as an index range.
+    """
+    condition = Q()
+    equal = Q()
+    for (name, descending), value in zip(ordering, values):
+        lookup = 'lt' if descending == forward else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    name, descending = ordering[0]
+    leading = Q(**{f"{name}__{'lte' if descending == forward else 'gte'}": values[0]})
+    return leading & condition
+
+
+# --- 3. PAGE ---
+class KeysetPage:
+    """One page of rows plus the query strings for the neighbouring pages."""
+
+    def __init__(self, object_list, request, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.next_query = self._query(request, next_cursor)
+        self.prev_query = self._query(request, prev_cursor)
+
+    @staticmethod
+    def _query(request, cursor):
+        if cursor is None:
+            return None
+        params = request.GET.copy()
+        params['cursor'] = cursor
+        return params.urlencode()
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def keyset_paginate(request, queryset, ordering, page_size=PAGE_SIZE):
+    """
+    Seek pagination for the HTML list views: ?cursor=... from the previous page.
+    `ordering` must end in a unique column (e.g. ('-invoice_date', '-id')) and
+    should match an index, so page N costs the same single range scan as page 1.
+    A bad cursor falls back to the first page.
+    """
+    ordering = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+    fields = [queryset.model._meta.get_field(name) for name, _ in ordering]
+    cursor = decode_cursor(request.GET.get('cursor'), fields)
+    values, direction = cursor if cursor else (None, 'n')
+    forward = direction == 'n'
+
+    order_by = [f"{'-' if descending == forward else ''}{name}" for name, descending in ordering]
+    rows = queryset.order_by(*order_by)
+    if values is not None:
+        rows = rows.filter(_seek(ordering, values, forward))
+    rows = list(rows[:page_size + 1])
+
+    more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+
+    def key(row):
+        return [getattr(row, field.attname) for field in fields]
+
+    has_next = more if forward else True
+    has_previous = (values is not None) if forward else more
+    return KeysetPage(
+        rows, request,
+        next_cursor=encode_cursor(key(rows[-1]), 'n') if rows and has_next else None,
+        prev_cursor=encode_cursor(key(rows[0]), 'p') if rows and has_previous else None,
+    )
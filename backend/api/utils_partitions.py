@@ -0,0 +1,245 @@
+import re
+from datetime import date
+
+from django.conf import settings
+from django.db import connection, models, transaction
+
+# Range-partitioned by month on invoice_date (migration 0023). Lines carry a copy of
+# the header date, so a date-filtered query prunes both tables to the months it touches.
+PARTITIONED_TABLES = ('invoices', 'invoice_items')
+PARTITION_KEY = 'invoice_date'
+PARTITION_LOCK = 72530023  # pg_advisory_xact_lock key serialising partition creation
+# Attaching clones the parents' FKs, which locks the referenced tables (products, ...):
+# a side transaction gives up after this and the caller's transaction attaches instead
+ATTACH_LOCK_TIMEOUT = '1s'
+LOCK_NOT_AVAILABLE = '55P03'  # SQLSTATE of a lock_timeout
+
+# Months known (committed) to have a partition in both tables, per process: lets
+# Invoice.save() skip the catalog lookup. Months this process created in a transaction
+# that hasn't committed yet are kept apart: a rollback would drop them again.
+_covered = set()
+_uncommitted = set()
+_BOUND = re.compile(r"FROM \((MINVALUE|'([0-9-]+)')\) TO \('([0-9-]+)'\)")
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y_%m}"
+
+
+def is_partitioned(table='invoices'):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s AND pg_table_is_visible(c.oid)", [table]
+        )
+        return cursor.fetchone() is not None
+
+
+def list_partitions(table, cursor=None):
+    """[(partition name, bound expression)] of one partitioned table."""
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return list_partitions(table, cursor)
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND pg_table_is_visible(p.oid) ORDER BY c.relname", [table]
+    )
+    return cursor.fetchall()
+
+
+def _add_partition(cursor, table, month):
+    """
+    Creates the month's table on its own and attaches it: ATTACH PARTITION takes a
+    SHARE UPDATE EXCLUSIVE lock on the parent, which doesn't block reads or writes
+    (CREATE TABLE ... PARTITION OF would take ACCESS EXCLUSIVE). The table is empty,
+    so attaching scans nothing; the parent's indexes and keys are added to it.
+    """
+    name = partition_name(table, month)
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cursor.execute(
+        f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+    return name
+
+
+# --- 1. FUTURE PARTITIONS ---
+def ensure_partitions(months_ahead=None, today=None):
+    """
+    Creates the monthly partitions from the current month up to `months_ahead`
+    months later (settings.INVOICE_PARTITION_MONTHS_AHEAD) where missing.
+    Runs after every migrate and from `manage.py manage_partitions` (cron).
+    Returns the names created. No-op when the tables aren't partitioned.
+    """
+    if not is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = settings.INVOICE_PARTITION_MONTHS_AHEAD
+    first = month_start(today or date.today())
+    months = {add_months(first, offset) for offset in range(months_ahead + 1)}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        created, _ = _add_missing(cursor, months)
+    return created
+
+
+# --- 2. ARCHIVING ---
+def detach_month(month):
+    """
+    Detaches one month from both tables (lines first), leaving standalone tables
+    that can be dumped, moved to cheaper storage or dropped.
+    DETACH ... CONCURRENTLY only takes a SHARE UPDATE EXCLUSIVE lock, so reads and
+    writes to other months continue; it must run outside a transaction (autocommit).
+    Returns the detached table names.
+    """
+    if connection.in_atomic_block:
+        raise RuntimeError("detach_month() must run outside transaction.atomic() (DETACH CONCURRENTLY)")
+    month = month_start(month)
+    detached = []
+    with connection.cursor() as cursor:
+        for table in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, month)
+            if name not in {existing for existing, _ in list_partitions(table)}:
+                continue
+            cursor.execute(f'ALTER TABLE "{table}" DETACH PARTITION "{name}" CONCURRENTLY')
+            detached.append(name)
+    _covered.discard(month)
+    return detached
+
+
+# --- 3. PARTITION ON DEMAND (before inserting) ---
+def _months_with_partition(cursor, table, months):
+    """The given months a partition of `table` covers (a monthly one or the history range)."""
+    covered = set()
+    for _, bound in list_partitions(table, cursor):
+        match = _BOUND.search(bound)
+        if not match:
+            continue
+        low = None if match.group(1) == 'MINVALUE' else date.fromisoformat(match.group(2))
+        high = date.fromisoformat(match.group(3))
+        covered |= {month for month in months if (low is None or low <= month) and month < high}
+    return covered
+
+
+def _commit_months(months):
+    _uncommitted.difference_update(months)
+    _covered.update(months)
+
+
+def _add_missing(cursor, months):
+    """Adds the partitions the months lack (both tables). Returns (names, months added)."""
+    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [PARTITION_LOCK])  # Concurrent requests for the same month
+    created, new_months = [], set()
+    for table in PARTITIONED_TABLES:
+        for month in sorted(months - _months_with_partition(cursor, table, months)):
+            created.append(_add_partition(cursor, table, month))
+            new_months.add(month)
+    return created, new_months
+
+
+def _add_missing_committed(months):
+    """
+    _add_missing() in a short transaction of its own on a second connection, so the
+    new partitions are committed at once instead of with the caller's request /
+    import / bulk transaction. Returns the names created, or None if that had to
+    wait for locks (e.g. ones the caller's transaction holds on referenced tables).
+    """
+    side = connection.copy()
+    try:
+        with side.cursor() as cursor:
+            cursor.execute('BEGIN')
+            try:
+                cursor.execute(f"SET LOCAL lock_timeout = '{ATTACH_LOCK_TIMEOUT}'")
+                created, _ = _add_missing(cursor, months)
+            except Exception as exc:
+                cursor.execute('ROLLBACK')
+                if getattr(exc.__cause__, 'pgcode', None) == LOCK_NOT_AVAILABLE:
+                    return None
+                raise
+            cursor.execute('COMMIT')
+        return created
+    finally:
+        side.close()
+
+
+def ensure_partitions_for(days):
+    """
+    Creates the monthly partitions (both tables) the given invoice dates need, so an
+    insert never fails with "no partition of relation invoices found for row" when the
+    post_migrate / cron creation didn't run or a date lies far ahead.
+    They are committed on their own right away; only when that would wait for locks
+    are they added in the caller's transaction (still without blocking other sessions'
+    reads and writes, see _add_partition).
+    Cached per process: a known month costs no query. Call before bulk_create();
+    Invoice.save() calls it itself. Returns the names created.
+    """
+    to_date = models.DateField().to_python
+    months = {month_start(to_date(day)) for day in days if day} - _covered
+    if not months or not is_partitioned():
+        return []
+
+    # Months an enclosing transaction of this process added are only visible to it
+    committed = months - _uncommitted
+    created = _add_missing_committed(committed) if committed else []
+    if created is None:
+        created, committed = [], set()
+    _covered.update(committed)
+
+    rest = months - committed
+    if rest:
+        with transaction.atomic(), connection.cursor() as cursor:
+            added, new_months = _add_missing(cursor, rest)
+            # Added here or by an enclosing transaction still open: only known once committed
+            pending = new_months | (rest & _uncommitted)
+            _uncommitted.update(pending)
+            transaction.on_commit(lambda: _commit_months(pending))
+            _covered.update(rest - pending)
+        created += added
+    return created
+
+
+def ensure_partitions_between(start_date, end_date):
+    """ensure_partitions_for() every month from start_date to end_date (bulk loaders)."""
+    months, month = [], month_start(start_date)
+    while month <= end_date:
+        months.append(month)
+        month = add_months(month, 1)
+    return ensure_partitions_for(months)
+
+
+def create_future_partitions(sender, **kwargs):
+    """post_migrate receiver: new months exist before anyone can insert into them."""
+    ensure_partitions()
+
+
+# --- 4. UNIQUE INVOICE NUMBERS ---
+def lock_invoice_numbers(keys):
+    """
+    Serialises writers of the same (company_id, invoice_number) until their transaction
+    ends: a unique index on the partitioned invoices table would have to include
+    invoice_date, so the check-then-insert in Invoice.save() / utils_bulk / imports is
+    guarded by transaction-level advisory locks instead. Must run inside
+    transaction.atomic(). Taken in one fixed order, so concurrent batches can't deadlock.
+    """
+    keys = {(company_id, number) for company_id, number in keys if company_id and number}
+    if not keys or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(k.company_id, k.number_hash) FROM ("
+            "SELECT company_id, hashtext(number) AS number_hash FROM unnest(%s::int[], %s::text[]) AS u(company_id, number) "
+            "ORDER BY 1, 2) AS k",
+            [[company_id for company_id, _ in keys], [number for _, number in keys]],
+        )
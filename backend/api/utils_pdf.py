@@ -1,6 +1,26 @@
+import glob
+import hashlib
+import io
+import logging
+import mimetypes
+import multiprocessing
 import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from urllib.parse import urlparse
+
 from django.conf import settings
 from django.contrib.staticfiles import finders
+from django.db import close_old_connections, transaction
+from django.template.loader import get_template, render_to_string
+
+from .utils_metrics import PDF_RENDER_SECONDS
+
+logger = logging.getLogger(__name__)
 
 def link_callback(uri, rel):
     """
@@ -28,4 +48,254 @@ def link_callback(uri, rel):
     # Make sure that file exists
     if not os.path.isfile(path):
         raise Exception(f'media URI must start with {sUrl} or {mUrl}')
-    return path
\ No newline at end of file
+    return path
+
+# --- Invoice PDF rendering + on-disk cache ---
+
+INVOICE_PDF_TEMPLATE = 'pdf/invoice_print.html'
+INVOICE_PDF_STYLESHEET = 'css/invoice_print.css'
+
+# One background worker per process is enough: pre-rendering is best effort,
+# a cache miss on download simply renders inline.
+_prerender_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='invoice-pdf')
+
+
+@lru_cache(maxsize=None)
+def invoice_stylesheet_path():
+    """Filesystem path of the invoice stylesheet (fonts inside it resolve relative to it)."""
+    return finders.find(INVOICE_PDF_STYLESHEET)
+
+
+@lru_cache(maxsize=None)
+def invoice_template_version():
+    """Manual version from settings + hash of the template and stylesheet (edits invalidate the cache)."""
+    source = get_template(INVOICE_PDF_TEMPLATE).template.source
+    digest = hashlib.sha1(source.encode('utf-8'))
+    with open(invoice_stylesheet_path(), 'rb') as fh:
+        digest.update(fh.read())
+    return f"{settings.INVOICE_PDF_TEMPLATE_VERSION}{digest.hexdigest()[:8]}"
+
+
+def invoice_pdf_cache_key(invoice_id, updated_at):
+    """Changes whenever the invoice is saved or the template changes. Also used as the ETag."""
+    return f"{invoice_id}-{int(updated_at.timestamp() * 1000000)}-{invoice_template_version()}"
+
+
+def invoice_pdf_path(cache_key):
+    return os.path.join(settings.INVOICE_PDF_CACHE_DIR, f"{cache_key}.pdf")
+
+
+def render_invoice_html(invoice):
+    context = {
+        'invoice': invoice,
+        'items': invoice.invoice_items.all(),
+        'company': invoice.company,
+    }
+    return render_to_string(INVOICE_PDF_TEMPLATE, context)
+
+
+def static_url_fetcher(url, *args, **kwargs):
+    """
+    WeasyPrint URL fetcher: /static/... (on any host) is read straight from disk
+    via the staticfiles finders instead of an HTTP round trip to our own server.
+    Anything else goes to WeasyPrint's default fetcher.
+    """
+    path = urlparse(url).path
+    if path.startswith(settings.STATIC_URL):
+        relative = path[len(settings.STATIC_URL):]
+        local_path = finders.find(relative) or os.path.join(settings.STATIC_ROOT, relative)  # After collectstatic
+        if os.path.isfile(local_path):
+            with open(local_path, 'rb') as fh:
+                return {
+                    'string': fh.read(),
+                    'mime_type': mimetypes.guess_type(local_path)[0],
+                    'redirected_url': url,
+                }
+
+    from weasyprint import default_url_fetcher
+
+    return default_url_fetcher(url, *args, **kwargs)
+
+
+class InvoicePdfRenderer:
+    """
+    Long-lived WeasyPrint renderer (one per process, see get_pdf_renderer).
+    The stylesheet is parsed and fonts are configured once, then reused for every invoice.
+    """
+
+    def __init__(self, stylesheet_path=None):
+        import weasyprint  # Heavy; loaded on first render only
+        from weasyprint.text.fonts import FontConfiguration
+
+        self._weasyprint = weasyprint
+        self.font_config = FontConfiguration()
+        self.stylesheets = [weasyprint.CSS(
+            filename=stylesheet_path or invoice_stylesheet_path(),
+            font_config=self.font_config,
+            url_fetcher=static_url_fetcher,
+        )]
+        # The shared font configuration is not thread-safe (request threads + pre-render thread)
+        self._lock = threading.Lock()
+
+    def render(self, html_string, base_url):
+        with self._lock, PDF_RENDER_SECONDS.time():
+            return self._weasyprint.HTML(
+                string=html_string, base_url=base_url, url_fetcher=static_url_fetcher,
+            ).write_pdf(stylesheets=self.stylesheets, font_config=self.font_config)
+
+
+@lru_cache(maxsize=None)
+def get_pdf_renderer():
+    return InvoicePdfRenderer()
+
+
+def render_invoice_pdf(invoice, base_url):
+    """Render one invoice to PDF bytes (WeasyPrint)."""
+    return get_pdf_renderer().render(render_invoice_html(invoice), base_url)
+
+
+def _pdf_version(path):
+    """The updated_at stamp in a cached PDF's name ({invoice_id}-{stamp}-{template}.pdf)."""
+    return int(os.path.basename(path).split('-', 2)[1])
+
+
+def _store_invoice_pdf(invoice_id, path, pdf_file):
+    """
+    Write atomically (readers never see a half-written file) and drop versions older
+    than this one. Newer ones are kept: a request that loaded the invoice before this
+    writer's may be about to open them.
+    """
+    os.makedirs(settings.INVOICE_PDF_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as fh:
+        fh.write(pdf_file)
+    os.replace(tmp_path, path)
+
+    version = _pdf_version(path)
+    for old in glob.glob(os.path.join(settings.INVOICE_PDF_CACHE_DIR, f"{invoice_id}-*.pdf")):
+        if _pdf_version(old) < version:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+def get_or_render_invoice_pdf(invoice, base_url):
+    """
+    Returns the path of the cached PDF for the invoice's current version,
+    rendering and storing it first if needed. Older versions are removed.
+    """
+    path = invoice_pdf_path(invoice_pdf_cache_key(invoice.pk, invoice.updated_at))
+    if not os.path.isfile(path):
+        _store_invoice_pdf(invoice.pk, path, render_invoice_pdf(invoice, base_url))
+    return path
+
+
+def open_invoice_pdf(invoice, path, base_url):
+    """
+    Opens a path from get_or_render_invoice_pdf(s). If a writer of a newer version removed
+    the file in between, the invoice as loaded is rendered again (in memory, not stored).
+    """
+    try:
+        return open(path, 'rb')
+    except FileNotFoundError:
+        return io.BytesIO(render_invoice_pdf(invoice, base_url))
+
+
+def prerender_invoice_pdf(invoice_id):
+    """Background job: warm the cache for one invoice."""
+    from .models import Invoice
+
+    close_old_connections()
+    try:
+        invoice = Invoice.objects.select_related('company').get(pk=invoice_id)
+        get_or_render_invoice_pdf(invoice, settings.PDF_BASE_URL)
+    except Exception:
+        logger.exception("Pre-rendering PDF for invoice %s failed", invoice_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_invoice_pdf(invoice_id):
+    """Queue a pre-render once the current transaction commits."""
+    transaction.on_commit(lambda: _prerender_executor.submit(prerender_invoice_pdf, invoice_id))
+
+
+
+# --- Bulk printing (process pool) ---
+
+_bulk_pool = None
+
+
+def _init_pdf_worker():
+    """
+    Pool initializer: set up Django (static file finders need the app registry; the
+    database is never touched) and build the worker's renderer up front.
+    """
+    import django
+
+    django.setup()
+    get_pdf_renderer()
+
+
+def _render_pdf_job(job):
+    """Runs in a worker: HTML string -> PDF bytes. No database access."""
+    invoice_id, html_string, base_url = job
+    return invoice_id, get_pdf_renderer().render(html_string, base_url)
+
+
+def _get_bulk_pool():
+    global _bulk_pool
+    if _bulk_pool is None:
+        # 'spawn': workers never inherit the parent's DB connections or threads
+        _bulk_pool = ProcessPoolExecutor(
+            max_workers=settings.INVOICE_PDF_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_pdf_worker,
+        )
+    return _bulk_pool
+
+
+def get_or_render_invoice_pdfs(invoices, base_url):
+    """
+    Bulk version of get_or_render_invoice_pdf: returns [(invoice, path)] in input order.
+    Cached PDFs are reused; misses are rendered to HTML here (templates + DB stay in
+    this process) and converted to PDF in parallel by the process pool.
+    """
+    global _bulk_pool
+
+    results = [(invoice, invoice_pdf_path(invoice_pdf_cache_key(invoice.pk, invoice.updated_at))) for invoice in invoices]
+    missing = {invoice.pk: path for invoice, path in results if not os.path.isfile(path)}
+    if not missing:
+        return results
+
+    jobs = [(invoice.pk, render_invoice_html(invoice), base_url) for invoice, _ in results if invoice.pk in missing]
+    pool = _get_bulk_pool()
+    try:
+        chunksize = max(1, len(jobs) // (settings.INVOICE_PDF_WORKERS * 4))
+        for invoice_id, pdf_file in pool.map(_render_pdf_job, jobs, chunksize=chunksize):
+            _store_invoice_pdf(invoice_id, missing[invoice_id], pdf_file)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM); start a fresh pool on the next request
+        _bulk_pool = None
+        raise
+    return results
+
+
+def merge_invoice_pdfs(files, output):
+    """Concatenate PDFs (open binary files, closed here) into one file-like object."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for fh in files:
+        with fh:
+            writer.append(io.BytesIO(fh.read()))  # pypdf reads pages lazily, after the file is closed
+    writer.write(output)
+
+
+def zip_invoice_pdfs(entries, output):
+    """entries: [(filename inside the archive, open binary file)]. PDFs are already compressed, so store as-is."""
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for filename, fh in entries:
+            with fh, archive.open(filename, 'w') as member:
+                shutil.copyfileobj(fh, member)
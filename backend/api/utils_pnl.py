@@ -0,0 +1,198 @@
+from decimal import Decimal
+
+import openpyxl
+import pandas as pd
+from openpyxl.styles import Font, Alignment, Border, Side
+from django.http import HttpResponse, JsonResponse
+
+from .models import InvoiceItem, Product, Transaction
+from .utils_archive import archived_invoice_lines
+from .utils_reports import get_thai_datetime
+
+
+# --- 1. BULK LOADING (a few queries, no per-row model access) ---
+def load_pnl_frames(company, start_date, end_date):
+    """
+    Returns (lines_df, txn_df) for the period.
+    lines_df: one row per invoice line with channel, category, revenue and cogs.
+    txn_df: one row per Transaction with type, category and amount.
+    """
+    # A. Invoice lines (cancelled invoices are not revenue)
+    lines = list(
+        InvoiceItem.objects.filter(
+            invoice__company=company,
+            invoice_date__range=[start_date, end_date],  # Lines' own copy: prunes invoice_items partitions
+        ).exclude(invoice__status='CANCELLED').values_list(
+            'invoice__platform_name', 'product__category', 'total_price', 'total_cost'
+        )
+    )
+    # Archived months (utils_archive) are read from the archive
+    archived = [line for line in archived_invoice_lines(start_date, end_date, company) if line['status'] != 'CANCELLED']
+    if archived:
+        categories = dict(Product.objects.filter(pk__in={line['product_id'] for line in archived}).values_list('pk', 'category'))
+        lines += [
+            (line['platform_name'], categories.get(line['product_id']), Decimal(line['total_price']), Decimal(line['total_cost']))
+            for line in archived
+        ]
+    # COGS is the cost frozen on each line (no batch lookup, unaffected by later cost edits)
+    lines_df = pd.DataFrame(lines, columns=['channel', 'category', 'revenue', 'cogs'])
+
+    # B. Other income / expenses
+    txns = list(
+        Transaction.objects.filter(
+            company=company,
+            transaction_date__range=[start_date, end_date],
+        ).values_list('type', 'category', 'amount')
+    )
+    txn_df = pd.DataFrame(txns, columns=['type', 'category', 'amount'])
+
+    lines_df['revenue'] = lines_df['revenue'].astype(float)
+    lines_df['cogs'] = lines_df['cogs'].astype(float)
+    lines_df['channel'] = lines_df['channel'].where(lines_df['channel'].astype(bool), 'Offline')
+    lines_df['category'] = lines_df['category'].fillna('UNMAPPED')
+
+    txn_df['amount'] = txn_df['amount'].astype(float)
+
+    return lines_df, txn_df
+
+
+def _margin_table(lines_df, key):
+    """Revenue / COGS / gross profit grouped by one column."""
+    grouped = lines_df.groupby(key, sort=True)[['revenue', 'cogs']].sum().reset_index()
+    grouped['gross_profit'] = grouped['revenue'] - grouped['cogs']
+    grouped['gross_margin_pct'] = (grouped['gross_profit'] / grouped['revenue'].where(grouped['revenue'] != 0)).fillna(0) * 100
+    return grouped.round(2).to_dict('records')
+
+
+# --- 2. ENGINE ---
+def build_profit_and_loss(company, start_date, end_date):
+    """
+    P&L for one company and date range as a plain dict (JSON-serializable).
+    """
+    lines_df, txn_df = load_pnl_frames(company, start_date, end_date)
+
+    revenue = float(lines_df['revenue'].sum())
+    cogs = float(lines_df['cogs'].sum())
+    gross_profit = revenue - cogs
+
+    other_income = float(txn_df.loc[txn_df['type'] == 'INCOME', 'amount'].sum())
+    expenses = float(txn_df.loc[txn_df['type'] == 'EXPENSE', 'amount'].sum())
+
+    category_labels = dict(Transaction.CATEGORY_CHOICES)
+    txn_groups = txn_df.groupby(['type', 'category'], sort=True)['amount'].sum().reset_index()
+    txn_groups['label'] = txn_groups['category'].map(category_labels).fillna(txn_groups['category'])
+
+    return {
+        'company': str(company),
+        'start_date': start_date.isoformat(),
+        'end_date': end_date.isoformat(),
+        'summary': {
+            'revenue': round(revenue, 2),
+            'cogs': round(cogs, 2),
+            'gross_profit': round(gross_profit, 2),
+            'gross_margin_pct': round(gross_profit / revenue * 100, 2) if revenue else 0,
+            'other_income': round(other_income, 2),
+            'expenses': round(expenses, 2),
+            'net_profit': round(gross_profit + other_income - expenses, 2),
+        },
+        'by_channel': _margin_table(lines_df, 'channel'),
+        'by_category': _margin_table(lines_df, 'category'),
+        'transactions': txn_groups.round(2).to_dict('records'),
+    }
+
+
+# --- 3. OUTPUTS ---
+def generate_pnl_json(company, start_date, end_date):
+    return JsonResponse(build_profit_and_loss(company, start_date, end_date), json_dumps_params={'ensure_ascii': False})
+
+
+def generate_pnl_report(company, start_date, end_date):
+    """Profit & Loss XLSX (same look as the tax reports)."""
+    pnl = build_profit_and_loss(company, start_date, end_date)
+
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Profit and Loss"
+
+    # --- Styles ---
+    font_header = Font(name='Sarabun', size=14, bold=True)
+    font_sub = Font(name='Sarabun', size=11)
+    font_bold = Font(name='Sarabun', size=11, bold=True)
+    border_thin = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    align_center = Alignment(horizontal='center', vertical='center')
+    align_right = Alignment(horizontal='right', vertical='center')
+    align_left = Alignment(horizontal='left', vertical='center')
+
+    # --- 1. HEADER SECTION ---
+    ws.merge_cells('A1:B1')
+    ws['A1'] = get_thai_datetime()
+    ws['A1'].alignment = align_left
+
+    ws.merge_cells('C1:E1')
+    ws['C1'] = str(company)
+    ws['C1'].font = font_header
+    ws['C1'].alignment = align_center
+
+    ws.merge_cells('C2:E2')
+    ws['C2'] = "งบกำไรขาดทุน"  # Profit & Loss
+    ws['C2'].font = font_bold
+    ws['C2'].alignment = align_center
+
+    ws.merge_cells('C3:E3')
+    start_thai = f"{start_date.day}/{start_date.month}/{start_date.year+543}"
+    end_thai = f"{end_date.day}/{end_date.month}/{end_date.year+543}"
+    ws['C3'] = f"ข้อมูลตั้งแต่วันที่ {start_thai} ถึง {end_thai}"
+    ws['C3'].alignment = align_center
+
+    for col, width in [('A', 30), ('B', 18), ('C', 18), ('D', 18), ('E', 15)]:
+        ws.column_dimensions[col].width = width
+
+    current_row = 5
+
+    def write_row(values, bold=False):
+        nonlocal current_row
+        for i, value in enumerate(values):
+            cell = ws.cell(row=current_row, column=i + 1, value=value)
+            cell.font = font_bold if bold else font_sub
+            cell.border = border_thin
+            if isinstance(value, (int, float)):
+                cell.number_format = '#,##0.00'
+                cell.alignment = align_right
+            else:
+                cell.alignment = align_left
+        current_row += 1
+
+    # --- 2. SUMMARY ---
+    s = pnl['summary']
+    write_row(['สรุป', 'จำนวนเงิน'], bold=True)
+    for label, key in [
+        ('รายได้จากการขาย', 'revenue'),
+        ('ต้นทุนขาย (COGS)', 'cogs'),
+        ('กำไรขั้นต้น', 'gross_profit'),
+        ('อัตรากำไรขั้นต้น (%)', 'gross_margin_pct'),
+        ('รายได้อื่น', 'other_income'),
+        ('ค่าใช้จ่าย', 'expenses'),
+        ('กำไรสุทธิ', 'net_profit'),
+    ]:
+        write_row([label, s[key]], bold=key in ('gross_profit', 'net_profit'))
+    current_row += 1
+
+    # --- 3. BY CHANNEL / BY CATEGORY ---
+    for title, key, rows in [
+        ('ช่องทางการขาย', 'channel', pnl['by_channel']),
+        ('ประเภทสินค้า', 'category', pnl['by_category']),
+    ]:
+        write_row([title, 'รายได้', 'ต้นทุนขาย', 'กำไรขั้นต้น', '%'], bold=True)
+        for row in rows:
+            write_row([row[key], row['revenue'], row['cogs'], row['gross_profit'], row['gross_margin_pct']])
+        current_row += 1
+
+    # --- 4. OTHER INCOME / EXPENSES ---
+    write_row(['รายรับ/รายจ่ายอื่น', 'ประเภท', 'จำนวนเงิน'], bold=True)
+    for row in pnl['transactions']:
+        write_row([row['label'], row['type'], row['amount']])
+
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = f'attachment; filename="Profit_Loss_Report_{start_date}.xlsx"'
+    wb.save(response)
+    return response
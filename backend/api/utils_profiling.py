@@ -0,0 +1,134 @@
+import functools
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.template.base import Template
+
+# Profile of the request being handled on this thread (None when profiling is off)
+_current = ContextVar('request_profile', default=None)
+
+
+# --- 1. PER-REQUEST MEASUREMENTS ---
+class RequestProfile:
+    """SQL and template time of one request, collected by ProfilingMiddleware."""
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.statements = Counter()  # (sql, params) -> executions
+        self.template_ms = 0.0
+        self.template_depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook: times every query (DEBUG not required)."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.sql_count += 1
+            self.statements[(sql, str(params))] += 1
+
+    @property
+    def duplicates(self):
+        """Executions repeating an earlier query exactly (same SQL and parameters)."""
+        return sum(count - 1 for count in self.statements.values())
+
+    def most_repeated(self):
+        """(sql, executions) of the statement run most often with any parameters: N+1 suspects."""
+        similar = Counter()
+        for (sql, _), count in self.statements.items():
+            similar[sql] += count
+        return similar.most_common(1)[0] if similar else ('', 0)
+
+    def server_timing(self, total_ms):
+        """Server-Timing header value (browser dev tools show it under Network > Timing)."""
+        return (
+            f'total;dur={total_ms:.1f}, '
+            f'db;dur={self.sql_ms:.1f};desc="{self.sql_count} queries, {self.duplicates} duplicates", '
+            f'tpl;dur={self.template_ms:.1f};desc="templates"'
+        )
+
+
+def start_profile():
+    profile = RequestProfile()
+    return profile, _current.set(profile)
+
+
+def stop_profile(token):
+    _current.reset(token)
+
+
+def _timed_render(render):
+    @functools.wraps(render)
+    def wrapper(self, context):
+        profile = _current.get()
+        if profile is None or profile.template_depth:
+            return render(self, context)  # Not profiling, or an {% include %} inside a timed render
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            profile.template_ms += (time.perf_counter() - start) * 1000
+            profile.template_depth -= 1
+
+    wrapper.profiled = True
+    return wrapper
+
+
+def install_template_timer():
+    """Times Template.render while a request is profiled (installed once, by the middleware)."""
+    if not getattr(Template.render, 'profiled', False):
+        Template.render = _timed_render(Template.render)
+
+
+# --- 2. ROLLING STORE (per process, newest PROFILING_HISTORY requests) ---
+_recent = deque(maxlen=settings.PROFILING_HISTORY)
+_lock = threading.Lock()
+
+
+def record(entry):
+    with _lock:
+        _recent.append(entry)
+
+
+def recent_requests():
+    with _lock:
+        return list(_recent)
+
+
+def clear():
+    with _lock:
+        _recent.clear()
+
+
+def slowest_endpoints(limit=20):
+    """Per endpoint over the stored requests: counts, average / worst times and query counts, slowest first."""
+    groups = {}
+    for entry in recent_requests():
+        groups.setdefault(entry['endpoint'], []).append(entry)
+
+    rows = []
+    for endpoint, entries in groups.items():
+        count = len(entries)
+        rows.append({
+            'endpoint': endpoint,
+            'count': count,
+            'avg_ms': sum(e['total_ms'] for e in entries) / count,
+            'max_ms': max(e['total_ms'] for e in entries),
+            'avg_sql_ms': sum(e['sql_ms'] for e in entries) / count,
+            'avg_queries': sum(e['sql_count'] for e in entries) / count,
+            'max_queries': max(e['sql_count'] for e in entries),
+            'max_duplicates': max(e['duplicates'] for e in entries),
+            'avg_template_ms': sum(e['template_ms'] for e in entries) / count,
+        })
+    rows.sort(key=lambda row: row['avg_ms'], reverse=True)
+    return rows[:limit]
+
+
+def slowest_requests(limit=20):
+    return sorted(recent_requests(), key=lambda entry: entry['total_ms'], reverse=True)[:limit]
@@ -3,8 +3,13 @@ from openpyxl.styles import Font, Alignment, Border, Side
 from django.http import HttpResponse
 from datetime import datetime
 from django.db.models import Sum, Q, F
-from django.db.models.functions import Coalesce
-from .models import Product, PurchaseItem, InvoiceItem # Ensure Product is imported
+from .models import Product, PurchaseItem, InvoiceItem, StockMovement # Ensure Product is imported
+from .utils_archive import archived_stock_quantities
+from .utils_stock import get_stock_balances_as_of
+
+def _quantities_by_product(queryset):
+    """{product_id: SUM(quantity)} of purchase / invoice lines or ledger rows, one grouped query."""
+    return dict(queryset.values('product').annotate(sum_qty=Sum('quantity')).values_list('product', 'sum_qty'))
 
 def get_thai_datetime():
     """Returns current datetime in Thai format: 2 ตุลาคม 2568 18:46 น."""
@@ -347,10 +352,13 @@ def generate_sales_tax_report(queryset, company, start_date, end_date):
     return response
 
 
-def generate_stock_report(company, start_date, end_date):
+def generate_stock_report(company, start_date, end_date, as_of_date=None):
     """
     Generates Stock Report showing movement within range and absolute current balance.
     Formula: Actual Stock = All Time Buy - All Time Sell (Allows negative results)
+
+    If as_of_date is given, the balance column is the stock as of that date,
+    read from the stock ledger (month-end snapshot + bounded delta scan).
     """
     wb = openpyxl.Workbook()
     ws = wb.active
@@ -410,6 +418,9 @@ def generate_stock_report(company, start_date, end_date):
         ('E6:E6', 'ขายออก', 15),
         ('F5:F6', 'คงเหลือปัจจุบัน\n(ทั้งหมด)', 20),
     ]
+    if as_of_date:
+        as_of_thai = f"{as_of_date.day}/{as_of_date.month}/{as_of_date.year+543}"
+        headers[-1] = ('F5:F6', f'คงเหลือ ณ วันที่\n{as_of_thai}', 20)
 
     # Merge Parent Header "Movement"
     ws.merge_cells('D5:E5')
@@ -447,36 +458,37 @@ def generate_stock_report(company, start_date, end_date):
     # Fetch all active products
     products = Product.objects.filter(is_active=True).order_by('name')
 
+    # Point-in-time balances: one query for all products
+    as_of_balances = get_stock_balances_as_of(as_of_date, products) if as_of_date else None
+    # Archived months (utils_archive): their lines are no longer in the tables below
+    archived = archived_stock_quantities(start_date, end_date)
+
+    # Per-product sums: one grouped query each, not two or four queries per product
+    # Note: not filtered by company (same scope as the product list above)
+    range_receives = _quantities_by_product(PurchaseItem.objects.filter(
+        #purchase_order__company=company,
+        purchase_order__order_date__range=[start_date, end_date]
+    ))
+    range_sales_by_product = _quantities_by_product(InvoiceItem.objects.filter(
+        #invoice__company=company,
+        invoice__status='BILLED', # Only count Billed sales
+        invoice_date__range=[start_date, end_date]  # Lines' own copy (partition pruning)
+    ))
+    if as_of_balances is None:
+        # Signed ledger rows (in - out), archived months included
+        all_time_balances = _quantities_by_product(StockMovement.objects.all())
+
     for product in products:
         # A. Movement within Date Range
-        # Note: Filter by company to ensure multi-company isolation
-        range_receive = PurchaseItem.objects.filter(
-            product=product,
-            #purchase_order__company=company,
-            purchase_order__order_date__range=[start_date, end_date]
-        ).aggregate(sum_qty=Coalesce(Sum('quantity'), 0))['sum_qty']
-
-        range_sales = InvoiceItem.objects.filter(
-            product=product,
-            #invoice__company=company,
-            invoice__status='BILLED', # Only count Billed sales
-            invoice__invoice_date__range=[start_date, end_date]
-        ).aggregate(sum_qty=Coalesce(Sum('quantity'), 0))['sum_qty']
-
-        # B. Actual Stock (All Time)
+        range_receive = range_receives.get(product.pk, 0) + archived['received'][product.pk]
+        range_sales = range_sales_by_product.get(product.pk, 0) + archived['sold'][product.pk]
+
+        # B. Actual Stock (All Time, or as of the requested date)
         # Formula: Total In - Total Out
-        all_time_in = PurchaseItem.objects.filter(
-            product=product,
-            #purchase_order__company=company
-        ).aggregate(sum_qty=Coalesce(Sum('quantity'), 0))['sum_qty']
-
-        all_time_out = InvoiceItem.objects.filter(
-            product=product,
-            #invoice__company=company,
-            #invoice__status='BILLED'
-        ).aggregate(sum_qty=Coalesce(Sum('quantity'), 0))['sum_qty']
-
-        actual_stock = all_time_in - all_time_out
+        if as_of_balances is not None:
+            actual_stock = as_of_balances.get(product.pk, 0)
+        else:
+            actual_stock = all_time_balances.get(product.pk, 0)
 
         # Skip rows if no movement AND no stock (optional, keeps report clean)
         if range_receive == 0 and range_sales == 0 and actual_stock == 0:
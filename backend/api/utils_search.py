@@ -0,0 +1,171 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.urls import reverse
+
+from .models import Company, Customer, Invoice, Product, PurchaseOrder, SearchDocument, Transaction, Vendor
+
+MIN_GLOBAL_SEARCH_LENGTH = 3  # Shorter terms can't use the trigram index
+GLOBAL_SEARCH_LIMIT = 20
+
+# Columns each list view's search box matches (substring, case-insensitive).
+# Local columns have a pg_trgm GIN index on UPPER(column) (migration 0020), which is
+# exactly the expression Django's icontains compiles to on Postgres:
+#   UPPER("col"::text) LIKE UPPER('%term%')
+# so the planner can answer it from the index instead of a sequential scan.
+# Related columns (customer__name, ...) become an id IN (...) on the related table,
+# which is searched through its own index.
+SEARCH_FIELDS = {
+    Company: ('name',),
+    Customer: ('name', 'phone', 'tax_id', 'email'),
+    Vendor: ('name', 'contact_person', 'phone', 'company__name'),
+    Product: ('name', 'sku', 'category'),
+    Transaction: ('transaction_number', 'reference', 'description'),
+    PurchaseOrder: ('po_number', 'vendor__name'),
+    Invoice: ('invoice_number', 'platform_order_id', 'platform_tracking_number', 'customer__name'),
+}
+
+
+def _condition(model, field, term):
+    relation, _, rest = field.partition('__')
+    if not rest:
+        return Q(**{f'{field}__icontains': term})
+    related = model._meta.get_field(relation).related_model
+    return Q(**{f'{relation}__in': related.objects.filter(_condition(related, rest, term)).values('pk')})
+
+
+def search(queryset, term, fields=None):
+    """
+    Shared search-box lookup for the list views: rows where any of `fields`
+    (default SEARCH_FIELDS[model]) contains `term`. Plain icontains, so it runs
+    unchanged on SQLite; on Postgres the trigram indexes keep it off a seq scan.
+    """
+    term = (term or '').strip()
+    if not term:
+        return queryset
+    model = queryset.model
+    condition = Q()
+    for field in fields or SEARCH_FIELDS[model]:
+        condition |= _condition(model, field, term)
+
+    # Amounts match exactly (a LIKE over numeric::text can't use any index)
+    if model is Transaction:
+        try:
+            condition |= Q(amount=Decimal(term.replace(',', '')))
+        except InvalidOperation:
+            pass
+    return queryset.filter(condition)
+
+
+def trigram_columns():
+    """(table, column) for every local search column: what migration 0020 indexes."""
+    columns = []
+    for model, fields in SEARCH_FIELDS.items():
+        for field in fields:
+            if '__' not in field:
+                columns.append((model._meta.db_table, model._meta.get_field(field).column))
+    return columns
+
+
+# --- GLOBAL SEARCH (one denormalized SearchDocument per invoice / PO / customer) ---
+def normalize(value):
+    """Uppercase without spaces/dashes, so '081-555 0199' finds 0815550199."""
+    return re.sub(r'[\s\-|]+', '', str(value or '')).upper()
+
+
+def _invoice_document(invoice):
+    return (
+        invoice.invoice_number,
+        ' · '.join(filter(None, [invoice.recipient_name, invoice.platform_name, invoice.platform_tracking_number])),
+        [invoice.invoice_number, invoice.platform_order_id, invoice.platform_tracking_number,
+         invoice.recipient_phone, invoice.recipient_name],
+    )
+
+
+def _purchase_order_document(order):
+    return order.po_number, order.vendor.name, [order.po_number, order.vendor.name]
+
+
+def _customer_document(customer):
+    return (
+        customer.name,
+        ' · '.join(filter(None, [customer.phone, customer.email])),
+        [customer.name, customer.phone, customer.tax_id, customer.email],
+    )
+
+
+# model -> (resource, builder returning (title, subtitle, tokens), edit url name, select_related)
+SEARCH_DOCUMENTS = {
+    Invoice: ('invoices', _invoice_document, 'invoice_edit', ()),
+    PurchaseOrder: ('purchase_orders', _purchase_order_document, 'purchase_edit', ('vendor',)),
+    Customer: ('customers', _customer_document, 'customer_edit', ()),
+}
+URL_NAMES = {resource: url_name for resource, _, url_name, _ in SEARCH_DOCUMENTS.values()}
+
+
+def index_documents(objects):
+    """Upserts the SearchDocument of each instance (all of one model), one query."""
+    objects = list(objects)
+    if not objects:
+        return 0
+    resource, build, _, _ = SEARCH_DOCUMENTS[type(objects[0])]
+    documents = []
+    for obj in objects:
+        title, subtitle, tokens = build(obj)
+        tokens = [token for token in map(normalize, tokens) if token]
+        documents.append(SearchDocument(
+            resource=resource, object_id=obj.pk, company_id=obj.company_id,
+            title=str(title)[:200], subtitle=str(subtitle)[:300], document='|' + '|'.join(tokens) + '|',
+        ))
+    SearchDocument.objects.bulk_create(
+        documents, update_conflicts=True, unique_fields=['resource', 'object_id'],
+        update_fields=['company', 'title', 'subtitle', 'document', 'updated_at'],
+    )
+    return len(documents)
+
+
+def index_queryset(queryset, batch_size=2000):
+    """(Re)indexes every row of an Invoice / PurchaseOrder / Customer queryset."""
+    _, _, _, related = SEARCH_DOCUMENTS[queryset.model]
+    batch, count = [], 0
+    with transaction.atomic():
+        for obj in queryset.select_related(*related).iterator(chunk_size=batch_size):
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                count += index_documents(batch)
+                batch = []
+        count += index_documents(batch)
+    return count
+
+
+def global_search(term, company_id=None, limit=GLOBAL_SEARCH_LIMIT):
+    """
+    Ranked matches across invoices, POs and customers:
+    3 = a whole identifier (tracking no., phone, order id ...), 2 = identifier prefix, 1 = substring.
+    """
+    needle = normalize(term)
+    if len(needle) < MIN_GLOBAL_SEARCH_LENGTH:
+        return []
+    documents = SearchDocument.objects.filter(document__contains=needle)
+    if company_id:
+        documents = documents.filter(company_id=company_id)
+    documents = documents.annotate(rank=Case(
+        When(document__contains=f'|{needle}|', then=Value(3)),
+        When(document__contains=f'|{needle}', then=Value(2)),
+        default=Value(1),
+        output_field=IntegerField(),
+    )).order_by('-rank', '-updated_at')[:limit]
+
+    return [
+        {
+            'type': doc.resource,
+            'id': doc.object_id,
+            'title': doc.title,
+            'subtitle': doc.subtitle,
+            'rank': doc.rank,
+            'url': reverse(URL_NAMES[doc.resource], args=[doc.object_id]),
+        }
+        for doc in documents
+    ]
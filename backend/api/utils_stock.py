@@ -0,0 +1,243 @@
+import calendar
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import DateField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+
+from .models import InvoiceItem, Product, PurchaseItem, StockMovement, StockSnapshot
+
+# Used when a product has no checkpoint yet (scan from the beginning)
+LEDGER_START = date(1900, 1, 1)
+
+
+# --- 1. LEDGER WRITES ---
+def _invalidate_snapshots(stale):
+    """
+    Drop checkpoints made stale by a (possibly back-dated) movement change.
+    stale: {product_id: earliest affected date}
+    """
+    if not stale:
+        return
+    condition = Q()
+    for product_id, from_date in stale.items():
+        condition |= Q(product_id=product_id, snapshot_date__gte=from_date)
+    StockSnapshot.objects.filter(condition).delete()
+
+
+def _mark_stale(stale, product_id, movement_date):
+    if product_id is None or movement_date is None:
+        return
+    if product_id not in stale or movement_date < stale[product_id]:
+        stale[product_id] = movement_date
+
+
+def _delete_movements(stale, purchase_items=None, invoice_items=None):
+    old = StockMovement.objects.none()
+    if purchase_items is not None:
+        old = old | StockMovement.objects.filter(purchase_item__in=purchase_items.values('pk'))
+    if invoice_items is not None:
+        old = old | StockMovement.objects.filter(invoice_item__in=invoice_items.values('pk'))
+    for product_id, movement_date in old.values_list('product_id', 'movement_date'):
+        _mark_stale(stale, product_id, movement_date)
+    old.delete()
+
+
+def delete_stock_movements(purchase_items=None, invoice_items=None):
+    """
+    Call before deleting PurchaseItem / InvoiceItem rows: the ledger rows would
+    cascade anyway, but later checkpoints must be invalidated too.
+    """
+    stale = {}
+    with transaction.atomic():
+        _delete_movements(stale, purchase_items, invoice_items)
+        _invalidate_snapshots(stale)
+
+
+def sync_stock_movements(purchase_items=None, invoice_items=None):
+    """
+    Re-derive ledger rows for the given PurchaseItem / InvoiceItem querysets.
+    Values are read back from the DB, so in-memory header dates (datetime, str,
+    pandas Timestamp from imports) never leak into the ledger.
+    """
+    stale = {}
+    new_rows = []
+
+    with transaction.atomic():
+        _delete_movements(stale, purchase_items, invoice_items)
+
+        if purchase_items is not None:
+            for row in purchase_items.values(
+                'id', 'product_id', 'quantity',
+                'purchase_order__order_date', 'purchase_order__company_id'
+            ):
+                new_rows.append(StockMovement(
+                    company_id=row['purchase_order__company_id'],
+                    product_id=row['product_id'],
+                    movement_date=row['purchase_order__order_date'],
+                    quantity=row['quantity'],
+                    source='PURCHASE',
+                    purchase_item_id=row['id'],
+                ))
+
+        if invoice_items is not None:
+            # Unmapped platform lines (product is NULL) don't move stock
+            for row in invoice_items.filter(product__isnull=False).values(
+                'id', 'product_id', 'quantity',
+                'invoice__invoice_date', 'invoice__company_id'
+            ):
+                new_rows.append(StockMovement(
+                    company_id=row['invoice__company_id'],
+                    product_id=row['product_id'],
+                    movement_date=row['invoice__invoice_date'],
+                    quantity=-row['quantity'],
+                    source='SALE',
+                    invoice_item_id=row['id'],
+                ))
+
+        for movement in new_rows:
+            _mark_stale(stale, movement.product_id, movement.movement_date)
+
+        StockMovement.objects.bulk_create(new_rows, batch_size=1000)
+        _invalidate_snapshots(stale)
+
+    return len(new_rows)
+
+
+def rebuild_stock_movements():
+    """Full rebuild of the ledger from purchase and invoice lines."""
+    with transaction.atomic():
+        # Rows of archived lines (utils_archive) have no source line left to re-derive them from
+        StockMovement.objects.exclude(purchase_item__isnull=True, invoice_item__isnull=True).delete()
+        StockSnapshot.objects.all().delete()
+        return sync_stock_movements(PurchaseItem.objects.all(), InvoiceItem.objects.all())
+
+
+# --- 2. CHECKPOINTS ---
+def month_end(day):
+    return day.replace(day=calendar.monthrange(day.year, day.month)[1])
+
+
+def build_stock_snapshots(upto=None):
+    """
+    (Re)build month-end checkpoints for every product with movements,
+    from the first movement month up to the last complete month before `upto`.
+    One grouped query over the ledger; running totals are accumulated in Python.
+    """
+    upto = upto or date.today()
+    last_checkpoint = upto.replace(day=1) - timedelta(days=1)
+
+    monthly = (
+        StockMovement.objects
+        .filter(movement_date__lte=last_checkpoint)
+        .annotate(month=TruncMonth('movement_date'))
+        .values('product_id', 'month')
+        .annotate(qty=Sum('quantity'))
+        .order_by('product_id', 'month')
+    )
+
+    # {product_id: {month_end: net qty}}
+    per_product = {}
+    for row in monthly:
+        per_product.setdefault(row['product_id'], {})[month_end(row['month'])] = row['qty']
+
+    snapshots = []
+    for product_id, months in per_product.items():
+        balance = 0
+        current = min(months)
+        while current <= last_checkpoint:
+            balance += months.get(current, 0)
+            snapshots.append(StockSnapshot(product_id=product_id, snapshot_date=current, balance=balance))
+            current = month_end(current + timedelta(days=1))
+
+    with transaction.atomic():
+        StockSnapshot.objects.filter(snapshot_date__lte=last_checkpoint).delete()
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+
+    return len(snapshots)
+
+
+# --- 3. POINT-IN-TIME LOOKUP ---
+def get_stock_balances_as_of(as_of_date, products=None):
+    """
+    Returns {product_id: balance} as of the end of `as_of_date`.
+    Per product: latest checkpoint <= as_of_date + movements after it (bounded scan).
+    Runs as a single query.
+    """
+    if products is None:
+        products = Product.objects.all()
+
+    latest = StockSnapshot.objects.filter(
+        product=OuterRef('pk'),
+        snapshot_date__lte=as_of_date,
+    ).order_by('-snapshot_date')
+
+    delta = StockMovement.objects.filter(
+        product=OuterRef('pk'),
+        movement_date__gt=OuterRef('checkpoint_date'),
+        movement_date__lte=as_of_date,
+    ).values('product').annotate(total=Sum('quantity')).values('total')
+
+    rows = products.annotate(
+        checkpoint_date=Coalesce(
+            Subquery(latest.values('snapshot_date')[:1]),
+            Value(LEDGER_START, output_field=DateField()),
+        ),
+        checkpoint_balance=Coalesce(
+            Subquery(latest.values('balance')[:1]), Value(0), output_field=IntegerField()
+        ),
+        delta=Coalesce(Subquery(delta, output_field=IntegerField()), Value(0)),
+    ).values_list('pk', 'checkpoint_balance', 'delta')
+
+    return {pk: checkpoint_balance + delta for pk, checkpoint_balance, delta in rows}
+
+
+def with_current_stock(products):
+    """
+    Annotates `stock_balance` (all-time units purchased - units sold, as Product.current_stock)
+    in the products query itself, instead of an aggregate query per product.
+    Summed over the ledger, which keeps archived periods: archiving doesn't change stock.
+    """
+    rows = StockMovement.objects.filter(product=OuterRef('pk')).values('product').annotate(total=Sum('quantity')).values('total')
+    return products.annotate(stock_balance=Coalesce(Subquery(rows, output_field=IntegerField()), Value(0)))
+
+
+# --- 4. OPEN BATCHES (invoice line dropdown, cached per product) ---
+def open_batches_cache_key(product_id):
+    return f'open_batches:{product_id}'
+
+
+def get_open_batches(product_id):
+    """
+    Batches of one product that still have stock, in FIFO order, as plain dicts.
+    Cached per product; invalidate_open_batches() drops the entry when stock moves.
+    """
+    key = open_batches_cache_key(product_id)
+    batches = cache.get(key)
+    if batches is None:
+        rows = PurchaseItem.objects.filter(
+            product_id=product_id, remaining_quantity__gt=0
+        ).order_by('id').values('id', 'purchase_order__po_number', 'remaining_quantity', 'unit_cost')
+        batches = [
+            {
+                'id': row['id'],
+                'po_number': row['purchase_order__po_number'],
+                'remaining_quantity': row['remaining_quantity'],
+                'unit_cost': str(row['unit_cost']),
+            }
+            for row in rows
+        ]
+        cache.set(key, batches, settings.OPEN_BATCHES_CACHE_SECONDS)
+    return batches
+
+
+def invalidate_open_batches(product_ids):
+    """
+    Drops the cached batch lists of these products once the current transaction
+    commits (earlier, a concurrent request could re-cache the old quantities).
+    """
+    keys = [open_batches_cache_key(pk) for pk in set(product_ids) if pk is not None]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,336 @@
+import io
+import itertools
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    Company,
+    Invoice,
+    InvoiceItem,
+    Product,
+    ProductAlias,
+    PurchaseItem,
+    PurchaseOrder,
+    StockMovement,
+    Transaction,
+    Vendor,
+)
+from .utils_partitions import ensure_partitions_between
+from .utils_stock import build_stock_snapshots
+from .utils_versions import bump_data_version
+
+# (Invoice.platform_name, ProductAlias.platform, share of orders)
+PLATFORMS = [('Shopee', 'SHOPEE', 50), ('TikTok Shop', 'TIKTOK', 30), ('Lazada', 'LAZADA', 20)]
+STATUSES = [('BILLED', 90), ('DRAFT', 5), ('CANCELLED', 5)]
+LINES_PER_INVOICE = [(1, 60), (2, 30), (3, 10)]
+UNITS_PER_LINE = [(1, 70), (2, 20), (3, 7), (5, 3)]
+CATEGORIES = ['SMARTPHONE', 'ACCESSORY', 'TABLET', 'OTHER']
+VENDORS_PER_COMPANY = 20
+UNMAPPED_SHARE = 0.02  # Lines whose platform SKU has no alias (product mapping page)
+SUPPLY_FACTOR = 1.2  # Units purchased per unit expected to sell
+INVOICE_CHUNK = 20000  # Invoices generated (and held in memory) per COPY round
+COPY_CHUNK = 100000  # Rows per COPY statement
+
+
+# --- 1. COPY LOADING (Postgres) ---
+_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _text(value):
+    """One value in COPY text format (the common types are tested first: this runs per value)."""
+    kind = type(value)
+    if kind is int:
+        return str(value)
+    if kind is str:
+        if '\\' in value or '\t' in value or '\n' in value or '\r' in value:
+            return value.translate(_ESCAPES)
+        return value
+    if value is None:
+        return r'\N'
+    return str(value)
+
+
+def _constant_columns(model, given):
+    """[(column, text)] for the model's other columns: their defaults, auto_now(_add) = now."""
+    now = timezone.now()
+    constants = []
+    for field in model._meta.concrete_fields:
+        if field.primary_key or field.attname in given:
+            continue
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+            value = now
+        else:
+            value = field.get_default()
+        if value is None and not field.null:
+            raise ValueError(f"{model.__name__}.{field.name} has no default: pass it to copy_rows()")
+        constants.append((field.column, _text(field.to_python(value))))
+    return constants
+
+
+def copy_rows(model, fields, rows):
+    """
+    Loads row tuples (values in `fields` order, attnames; 'id' when ids are reserved)
+    with COPY ... FROM STDIN, COPY_CHUNK rows per statement. No save() / signals.
+    Columns not listed get their model default. Returns the number of rows.
+    """
+    columns = [model._meta.get_field(name).column if name != 'id' else 'id' for name in fields]
+    constants = _constant_columns(model, set(fields))
+    suffix = ''.join(f"\t{text}" for _, text in constants)
+    names = ', '.join(f'"{column}"' for column in columns + [column for column, _ in constants])
+    sql = f'COPY "{model._meta.db_table}" ({names}) FROM STDIN'
+
+    total = 0
+    with connection.cursor() as cursor:
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, COPY_CHUNK))
+            if not chunk:
+                return total
+            buffer = io.StringIO(''.join('\t'.join(map(_text, row)) + suffix + '\n' for row in chunk))
+            cursor.copy_expert(sql, buffer)
+            total += len(chunk)
+
+
+def reserve_ids(model, count):
+    """
+    First of `count` consecutive ids taken from the table's sequence, so rows loaded
+    by copy_rows() can reference each other. Nothing else may insert into the table
+    meanwhile (the nextval / setval pair is not atomic): run on an idle database.
+    """
+    with connection.cursor() as cursor:
+        table = f'"{model._meta.db_table}"'
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id'))", [table])
+        first = cursor.fetchone()[0]
+        if count > 1:
+            cursor.execute("SELECT setval(pg_get_serial_sequence(%s, 'id'), %s)", [table, first + count - 1])
+    return first
+
+
+# --- 2. GENERATION ---
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _choices(rng, pairs, k):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights, k=k)
+
+
+class _Company:
+    """Generates one company's rows; batches are sized from the expected demand and sold FIFO."""
+
+    def __init__(self, rng, company, user, products, invoices, start_date, span_days, skew):
+        self.rng, self.company, self.user = rng, company, user
+        self.invoices, self.start_date, self.span_days = invoices, start_date, span_days
+        self.counts = {}
+
+        # A. Master data
+        vendors = Vendor.objects.bulk_create([Vendor(company=company, name=f"Vendor {v + 1}") for v in range(VENDORS_PER_COMPANY)])
+        self.vendor_ids = [vendor.pk for vendor in vendors]
+        first = reserve_ids(Product, products)
+        self.product_ids = list(range(first, first + products))
+        self.skus = [f"S{company.pk}-{index:06d}" for index in range(products)]
+        self.prices = [rng.randint(50, 30000) for _ in range(products)]
+        self.counts['products'] = copy_rows(Product, ('id', 'company_id', 'sku', 'name', 'category', 'cost_price', 'selling_price'), (
+            (pk, company.pk, sku, f"Synthetic Product {index + 1}", rng.choice(CATEGORIES), price * 80 // 100, price)
+            for index, (pk, sku, price) in enumerate(zip(self.product_ids, self.skus, self.prices))
+        ))
+        self.counts['product_aliases'] = copy_rows(ProductAlias, ('external_key', 'product_id', 'platform'), (
+            (f"{code}-{sku}", pk, code) for pk, sku in zip(self.product_ids, self.skus) for _, code, _ in PLATFORMS
+        ))
+
+        # B. Popularity: Zipf weights over a shuffled product order (best sellers aren't the first SKUs)
+        ranks = list(range(1, products + 1))
+        rng.shuffle(ranks)
+        weights = [1 / rank ** skew for rank in ranks]
+        self.popularity = _cumulative(weights)
+        self.indexes = range(products)
+
+        # C. Purchase batches covering the expected demand, each product's in date (FIFO) order
+        mean_lines = sum(n * w for n, w in LINES_PER_INVOICE) / sum(w for _, w in LINES_PER_INVOICE)
+        mean_units = sum(n * w for n, w in UNITS_PER_LINE) / sum(w for _, w in UNITS_PER_LINE)
+        demand = invoices * mean_lines * mean_units * (1 - UNMAPPED_SHARE) * SUPPLY_FACTOR / sum(weights)
+        sizes = []  # (product index, quantity)
+        for index, weight in enumerate(weights):
+            left = max(1, round(demand * weight))
+            while left > 0:
+                quantity = min(left, rng.randint(20, 200))
+                sizes.append((index, quantity))
+                left -= quantity
+        rng.shuffle(sizes)
+
+        order_count = max(1, len(sizes) // 3)  # 1-5 batches per order, 3 on average
+        self.order_first = reserve_ids(PurchaseOrder, order_count)
+        self.order_dates = sorted(start_date + timedelta(days=rng.randint(0, span_days)) for _ in range(order_count))
+        batch_first = reserve_ids(PurchaseItem, len(sizes))
+        # (id, order index, product index, quantity, unit cost) -> remaining tracked in self.left
+        self.batches = [
+            (batch_first + number, number * order_count // len(sizes), index, quantity,
+             self.prices[index] * rng.randint(60, 85) // 100)
+            for number, (index, quantity) in enumerate(sizes)
+        ]
+        self.left = [quantity for _, _, _, quantity, _ in self.batches]
+        self.fifo = [[] for _ in range(products)]  # product index -> batch numbers, oldest order first
+        for number in sorted(range(len(self.batches)), key=lambda number: self.batches[number][1]):
+            self.fifo[self.batches[number][2]].append(number)
+        self.cursor = [0] * products
+
+    def _allocate(self, index, quantity):
+        """Batch number a line sells from (oldest with enough left), or None when sold out."""
+        queue, position = self.fifo[index], self.cursor[index]
+        while position < len(queue) and self.left[queue[position]] < quantity:
+            position += 1
+        self.cursor[index] = position
+        if position == len(queue):
+            return None
+        number = queue[position]
+        self.left[number] -= quantity
+        return number
+
+    def _invoice_chunk(self, start, stop):
+        """Headers, lines and ledger rows of invoices start..stop-1 (dates rise with the number)."""
+        rng, company_id, count = self.rng, self.company.pk, stop - start
+        first = reserve_ids(Invoice, count)
+        platforms = _choices(rng, [((name, code), share) for name, code, share in PLATFORMS], count)
+        statuses = _choices(rng, STATUSES, count)
+        line_counts = _choices(rng, LINES_PER_INVOICE, count)
+        total_lines = sum(line_counts)
+        products = rng.choices(self.indexes, cum_weights=self.popularity, k=total_lines)
+        units = _choices(rng, UNITS_PER_LINE, total_lines)
+        line_id = reserve_ids(InvoiceItem, total_lines)
+
+        headers, lines, movements, position = [], [], [], 0
+        for offset in range(count):
+            number = start + offset
+            invoice_id = first + offset
+            day = self.start_date + timedelta(days=number * self.span_days // self.invoices)
+            (platform_name, code), subtotal = platforms[offset], 0
+            for _ in range(line_counts[offset]):
+                index, quantity = products[position], units[position]
+                position += 1
+                price = self.prices[index]
+                if rng.random() < UNMAPPED_SHARE:
+                    lines.append((line_id, invoice_id, day, None, None, f"{code}-UNMAPPED-{index % 500}",
+                                  f"Unmapped item {index % 500}", quantity, price, quantity * price, 0, 0))
+                else:
+                    product_id = self.product_ids[index]
+                    batch = self._allocate(index, quantity)
+                    batch_id, unit_cost = (None, 0) if batch is None else (self.batches[batch][0], self.batches[batch][4])
+                    lines.append((line_id, invoice_id, day, product_id, batch_id, f"{code}-{self.skus[index]}",
+                                  f"Synthetic Product {index + 1}", quantity, price, quantity * price,
+                                  unit_cost, quantity * unit_cost))
+                    movements.append((company_id, product_id, day, -quantity, 'SALE', line_id))
+                subtotal += quantity * price
+                line_id += 1
+            headers.append((
+                invoice_id, company_id, f"SYN-{company_id}-{number + 1:09d}", day, statuses[offset], platform_name,
+                f"{company_id}{number + 1:012d}", f"TH{company_id}{number + 1:012d}", f"Customer {number % 100000}",
+                f"08{number % 100000000:08d}", subtotal, f"{subtotal * 7 / 107:.2f}", subtotal, self.user.pk,
+            ))
+        return headers, lines, movements
+
+    def generate(self):
+        # A. Purchases first (lines reference them); sold quantities are written back in C
+        totals = [0] * len(self.order_dates)
+        for _, order, _, quantity, cost in self.batches:
+            totals[order] += quantity * cost
+        company_id = self.company.pk
+        self.counts['purchase_orders'] = copy_rows(PurchaseOrder, (
+            'id', 'company_id', 'po_number', 'vendor_id', 'order_date', 'status', 'subtotal', 'tax_amount',
+            'total_amount', 'created_by_id',
+        ), (
+            (self.order_first + order, company_id, f"SYN-PO-{company_id}-{order + 1:07d}", self.rng.choice(self.vendor_ids),
+             day, 'PAID', total, f"{total * 7 / 107:.2f}", total, self.user.pk)
+            for order, (day, total) in enumerate(zip(self.order_dates, totals))
+        ))
+        self.counts['purchase_items'] = copy_rows(PurchaseItem, (
+            'id', 'purchase_order_id', 'product_id', 'quantity', 'unit_cost', 'total_price', 'remaining_quantity',
+        ), (
+            (pk, self.order_first + order, self.product_ids[index], quantity, cost, quantity * cost, quantity)
+            for pk, order, index, quantity, cost in self.batches
+        ))
+        copy_rows(StockMovement, ('company_id', 'product_id', 'movement_date', 'quantity', 'source', 'purchase_item_id'), (
+            (company_id, self.product_ids[index], self.order_dates[order], quantity, 'PURCHASE', pk)
+            for pk, order, index, quantity, _ in self.batches
+        ))
+
+        # B. Invoices, lines and their ledger rows, INVOICE_CHUNK invoices at a time
+        invoices = lines = 0
+        for start in range(0, self.invoices, INVOICE_CHUNK):
+            headers, items, movements = self._invoice_chunk(start, min(self.invoices, start + INVOICE_CHUNK))
+            invoices += copy_rows(Invoice, (
+                'id', 'company_id', 'invoice_number', 'invoice_date', 'status', 'platform_name', 'platform_order_id',
+                'platform_tracking_number', 'recipient_name', 'recipient_phone', 'subtotal', 'tax_amount',
+                'grand_total', 'created_by_id',
+            ), headers)
+            lines += copy_rows(InvoiceItem, (
+                'id', 'invoice_id', 'invoice_date', 'product_id', 'purchase_item_id', 'sku', 'item_name',
+                'quantity', 'unit_price', 'total_price', 'unit_cost', 'total_cost',
+            ), items)
+            copy_rows(StockMovement, ('company_id', 'product_id', 'movement_date', 'quantity', 'source', 'invoice_item_id'), movements)
+        self.counts.update(invoices=invoices, invoice_items=lines)
+
+        # C. Unsold quantities, one UPDATE for the batches that sold anything
+        sold = [(pk, left) for (pk, _, _, quantity, _), left in zip(self.batches, self.left) if left != quantity]
+        if sold:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE "{PurchaseItem._meta.db_table}" AS batch SET remaining_quantity = s.remaining '
+                    'FROM unnest(%s::bigint[], %s::int[]) AS s(id, remaining) WHERE batch.id = s.id',
+                    [[pk for pk, _ in sold], [left for _, left in sold]],
+                )
+
+        self.counts['transactions'] = copy_rows(Transaction, (
+            'company_id', 'transaction_number', 'transaction_date', 'type', 'category', 'amount', 'description', 'created_by_id',
+        ), (
+            (company_id, f"SYN-TX-{company_id}-{number + 1:07d}",
+             self.start_date + timedelta(days=self.rng.randint(0, self.span_days)),
+             *self.rng.choice([('EXPENSE', 'RENT'), ('EXPENSE', 'SALARY'), ('EXPENSE', 'DELIVERY'), ('INCOME', 'OTHER')]),
+             self.rng.randint(100, 50000), 'synthetic', self.user.pk)
+            for number in range(max(1, self.invoices // 50))
+        ))
+        return self.counts
+
+
+def generate_dataset(companies=1, products=500, invoices=100000, months=12, end_date=None, skew=1.1, seed=42, log=None):
+    """
+    Production-shaped data, loaded with COPY (Postgres): per company vendors, products
+    with one alias per platform, purchase orders with batches, invoices over
+    Shopee / TikTok / Lazada whose lines pick products by Zipf popularity (`skew`) and
+    sell from batches FIFO, transactions, and the stock ledger. Month-end stock
+    snapshots are rebuilt at the end. Each company is one transaction.
+    Search documents are not built (rebuild_search_documents). Returns row counts.
+    """
+    if connection.vendor != 'postgresql':
+        raise RuntimeError("generate_dataset() loads with COPY: Postgres only")
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=30 * months)
+    span_days = (end_date - start_date).days
+    ensure_partitions_between(start_date, end_date)  # COPY skips Invoice.save()
+    user, _ = User.objects.get_or_create(username='synthetic')
+
+    counts = {}
+    existing = Company.objects.count()
+    for number in range(existing + 1, existing + companies + 1):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Check foreign keys per COPY statement instead of queueing millions of checks for COMMIT
+                cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+            company = Company.objects.create(name=f"Synthetic Company {number}", tax_id=f"{number:013d}")
+            for table, rows in _Company(rng, company, user, products, invoices, start_date, span_days, skew).generate().items():
+                counts[table] = counts.get(table, 0) + rows
+            for resource in ('vendors', 'products', 'purchase_orders', 'invoices', 'transactions'):
+                bump_data_version(resource, company.pk)  # COPY sends no signals
+        if log:
+            log(f"{company}: {counts.get('invoice_items', 0):,} invoice lines so far")
+
+    build_stock_snapshots(upto=end_date)
+    with connection.cursor() as cursor:  # Fresh planner statistics for the benchmarks that follow
+        for model in (Product, ProductAlias, PurchaseOrder, PurchaseItem, Invoice, InvoiceItem, StockMovement, Transaction):
+            cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+    return counts
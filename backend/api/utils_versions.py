@@ -0,0 +1,84 @@
+import hashlib
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.middleware.csrf import get_token
+from django.views.decorators.http import condition
+
+from .models import Company, Customer, DataVersion, Invoice, Product, PurchaseOrder, Transaction, Vendor
+
+# Models whose save/delete bumps a data version (lines bump through their header's save)
+VERSIONED_MODELS = {
+    Company: 'companies',
+    Customer: 'customers',
+    Vendor: 'vendors',
+    Product: 'products',
+    PurchaseOrder: 'purchase_orders',
+    Invoice: 'invoices',
+    Transaction: 'transactions',
+}
+
+
+# --- 1. BUMPING ---
+def _bump(resource, company_id):
+    updated = DataVersion.objects.filter(resource=resource, company_id=company_id).update(version=F('version') + 1)
+    if not updated:
+        try:
+            with transaction.atomic():
+                DataVersion.objects.create(resource=resource, company_id=company_id, version=1)
+        except IntegrityError:  # Created concurrently
+            DataVersion.objects.filter(resource=resource, company_id=company_id).update(version=F('version') + 1)
+
+
+def bump_data_version(resource, company_id=None):
+    """
+    Runs after commit: the counter row is only locked for a single autocommit UPDATE,
+    and rolled back changes don't invalidate anything.
+    Call directly after queryset.update()/bulk_create(), which send no signals.
+    """
+    transaction.on_commit(partial(_bump, resource, company_id))
+
+
+def bump_for_instance(sender, instance, **kwargs):
+    company_id = instance.pk if sender is Company else instance.company_id
+    bump_data_version(VERSIONED_MODELS[sender], company_id)
+
+
+# --- 2. ETAGS ---
+def data_version_etag_value(resources, company_id=None, extra=''):
+    """One small query over data_versions; changes whenever any listed resource changes."""
+    rows = DataVersion.objects.filter(resource__in=resources)
+    if company_id is not None:
+        rows = rows.filter(company_id=company_id)
+    state = sorted(rows.values_list('resource', 'company_id', 'version'), key=str)
+    digest = hashlib.sha1(f"{settings.PAGE_ETAG_VERSION}|{extra}|{state}".encode()).hexdigest()[:20]
+    return digest
+
+
+def _has_pending_messages(request):
+    # A flash message must be rendered, not hidden behind a 304 (len() doesn't consume them)
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def data_version_etag(*resources):
+    """
+    View decorator: ETag from the data versions of `resources` (+ user and CSRF secret:
+    pages embed {% csrf_token %}, which a 304 would keep stale after a new login; query
+    string is per-URL in browser caches), and 304 on a matching If-None-Match before the view runs.
+    Works on function views and on DRF view methods (via method_decorator).
+    """
+    def etag_func(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or _has_pending_messages(request):
+            return None
+        company = request.GET.get('company')
+        user_id = request.user.pk if request.user.is_authenticated else ''
+        get_token(request)  # Creates the secret on a first visit; the cookie is then set even on a 304
+        return data_version_etag_value(
+            resources,
+            company_id=int(company) if company and company.isdigit() else None,
+            extra=f"{user_id}|{request.META['CSRF_COOKIE']}|{request.get_full_path()}",
+        )
+    return condition(etag_func=etag_func)
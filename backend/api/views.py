@@ -1,23 +1,34 @@
 # Django core
+import hmac
 import os
+import tempfile
+import time
+from datetime import date
 
 from django import forms
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.core.files.storage import FileSystemStorage
 from django.db import transaction
-from django.db.models import Count, Q
-from django.http import HttpResponse
+from django.db.models import Count, Prefetch
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string,get_template
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 
 # Third-party
-import weasyprint
-from xhtml2pdf import pisa
 from rest_framework import generics
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from pybaht import bahttext
 
 # Local apps – models
@@ -39,6 +50,8 @@ from .models import (
 from .forms import (
     CustomerForm,
     ImportFileForm,
+    InvoiceBulkPrintForm,
+    InvoiceFilterForm,
     InvoiceForm,
     InvoiceItemFormSet,
     ProductForm,
@@ -50,21 +63,36 @@ from .forms import (
 )
 
 # Local apps – serializers
-from .serializers import NoteSerializer, UserSerializer
+from .pagination import InvoiceCursorPagination
+from .serializers import InvoiceSerializer, NoteSerializer, UserSerializer, requested_fields
 
 # Local apps – utilities
-from .utils_import_core import universal_invoice_import
-from .utils_pdf import link_callback
-from .utils_processors import (
-    process_lazada_orders,
-    process_shopee_orders,
-    process_tiktok_orders,
+from .utils_bulk import (
+    MAX_BULK_DOCUMENTS,
+    bulk_create_invoices,
+    bulk_create_purchase_orders,
+    bulk_update_invoices,
+    bulk_update_purchase_orders,
 )
-from .utils_reports import (
-    generate_purchase_tax_report,
-    generate_sales_tax_report,
-    generate_stock_report,
+from .utils_changes import CHANGE_FEEDS, MAX_CHANGES_LIMIT, get_changes
+from .utils_metrics import METRICS_CONTENT_TYPE, REPORT_SECONDS, render_metrics
+from .utils_paging import keyset_paginate
+from .utils_profiling import slowest_endpoints, slowest_requests
+from .utils_search import global_search, search
+# PDF (WeasyPrint), import (pandas) and report (openpyxl/pandas) modules are imported
+# inside the views that need them, so workers serving list pages never load them.
+from .utils_pdf import (
+    get_or_render_invoice_pdf,
+    get_or_render_invoice_pdfs,
+    invoice_pdf_cache_key,
+    merge_invoice_pdfs,
+    open_invoice_pdf,
+    schedule_invoice_pdf,
+    zip_invoice_pdfs,
 )
+from .utils_allocation import allocate_invoice_items, release_invoice_items
+from .utils_stock import delete_stock_movements, get_open_batches, sync_stock_movements, with_current_stock
+from .utils_versions import bump_data_version, data_version_etag
 
 
 
@@ -95,6 +123,126 @@ class CreateUserView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [AllowAny]  # Allow anyone to create a user
+
+
+class InvoiceAPIMixin:
+    """
+    Shared queryset for the invoice API: customer joined, lines prefetched
+    (skipped when ?fields= leaves them out), filters on indexed columns
+    (InvoiceFilterForm, shared with the invoice table; invalid values -> 400).
+    """
+    serializer_class = InvoiceSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Invoice.objects.select_related('customer')
+        wanted = requested_fields(self.request)
+        if not wanted or 'items' in wanted:
+            queryset = queryset.prefetch_related(
+                Prefetch('invoice_items', queryset=InvoiceItem.objects.order_by('id'))
+            )
+
+        filters = InvoiceFilterForm(self.request.query_params)
+        if not filters.is_valid():
+            raise ValidationError(filters.errors)
+        return filters.filter(queryset)
+
+
+@method_decorator(data_version_etag('invoices', 'customers'), name='get')
+class InvoiceListCreateView(InvoiceAPIMixin, generics.ListCreateAPIView):
+    """
+    GET: cursor-paginated invoices (?ordering=invoice_date|-invoice_date|id|-id, ?fields=...).
+    POST: create an invoice with nested items.
+    """
+    pagination_class = InvoiceCursorPagination
+    filter_backends = [OrderingFilter]
+    ordering_fields = ['invoice_date', 'id']  # Indexed (invoice_date_id_idx / PK) only
+
+    def perform_create(self, serializer):
+        invoice = serializer.save(created_by=self.request.user)
+        if invoice.status == 'BILLED':
+            schedule_invoice_pdf(invoice.pk)
+
+
+@method_decorator(data_version_etag('invoices', 'customers'), name='get')
+class InvoiceDetailView(InvoiceAPIMixin, generics.RetrieveUpdateDestroyAPIView):
+
+    def perform_update(self, serializer):
+        invoice = serializer.save()
+        if invoice.status == 'BILLED':
+            schedule_invoice_pdf(invoice.pk)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            serializer = self.get_serializer(instance)
+            serializer.replace_items(instance, [])  # Gives the stock back
+            instance.delete()
+
+
+class BulkCreateView(APIView):
+    """
+    POST a JSON array of documents with nested "items" (max MAX_BULK_DOCUMENTS) to create them;
+    PUT replaces existing ones (each document carries its "id").
+    The whole batch is validated first and written in one transaction (all or nothing).
+    Response: {"created" | "updated": n, "results": [{"index", "status", "id" | "errors"}, ...]}
+    """
+    permission_classes = [IsAuthenticated]
+    bulk_create = None
+    bulk_update = None
+
+    def _run(self, request, write, key, success_status):
+        payload = request.data
+        if not isinstance(payload, list) or not payload:
+            return Response({'detail': "Expected a non-empty JSON array of documents."}, status=400)
+        if len(payload) > MAX_BULK_DOCUMENTS:
+            return Response({'detail': f"At most {MAX_BULK_DOCUMENTS} documents per request."}, status=400)
+
+        results, written = write(payload, request.user)
+        return Response({key: written, 'results': results}, status=success_status if written else 400)
+
+    def post(self, request):
+        return self._run(request, self.bulk_create, 'created', 201)
+
+    def put(self, request):
+        return self._run(request, self.bulk_update, 'updated', 200)
+
+
+class InvoiceBulkCreateView(BulkCreateView):
+    """Invoice lines are (re-)allocated like single invoices: released first on PUT."""
+    bulk_create = staticmethod(bulk_create_invoices)
+    bulk_update = staticmethod(bulk_update_invoices)
+
+
+class PurchaseOrderBulkCreateView(BulkCreateView):
+    """On PUT a line with an "id" edits that batch (sold units stay sold), one without adds a batch."""
+    bulk_create = staticmethod(bulk_create_purchase_orders)
+    bulk_update = staticmethod(bulk_update_purchase_orders)
+
+
+class ChangesView(APIView):
+    """
+    Change feed: /api/v1/changes/<resource>/?cursor=...&company=1&limit=500
+    resource: invoices, products, customers, vendors, transactions.
+    No cursor = everything (initial sync). Keep calling with the returned cursor
+    while has_more is true; apply "changed" as upserts and "deleted" ids as removals.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, resource):
+        if resource not in CHANGE_FEEDS:
+            return Response({'detail': f"Unknown resource. Use one of: {', '.join(CHANGE_FEEDS)}"}, status=404)
+        try:
+            limit = min(int(request.query_params.get('limit', 500)), MAX_CHANGES_LIMIT)
+            company = request.query_params.get('company')
+            data = get_changes(
+                resource,
+                cursor=request.query_params.get('cursor'),
+                company=int(company) if company else None,
+                limit=max(limit, 1),
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        return Response(data)
     
 def home(request):
     # Get all Posts
@@ -159,7 +307,7 @@ def customer_list(request):
     # ---------------------------------------------------------
     # 3. Get Data & Filter (GET)
     # ---------------------------------------------------------
-    customers = Customer.objects.all().order_by('-created_at')
+    customers = Customer.objects.all()
     
     # Filter by Company (Multi-tenancy)
     if current_company:
@@ -167,13 +315,7 @@ def customer_list(request):
 
     # Search Logic
     search_query = request.GET.get('q')
-    if search_query:
-        customers = customers.filter(
-            Q(name__icontains=search_query) | 
-            Q(phone__icontains=search_query) | 
-            Q(tax_id__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
+    customers = search(customers, search_query)  # name / phone / tax id / email
 
     # Status Filter
     status_filter = request.GET.get('status')
@@ -184,12 +326,13 @@ def customer_list(request):
 
     context = {
         'form': form,
-        'customers': customers,
+        'customers': keyset_paginate(request, customers, ('-created_at', '-id')),
         'search_query': search_query
     }
     return render(request, 'customer_list.html', context)
 
 #@login_required
+@data_version_etag('customers', 'companies')
 def customer_view(request, pk=None):
     # ---------------------------------------------------------
     # 1. Determine Context (Create vs Edit)
@@ -227,20 +370,14 @@ def customer_view(request, pk=None):
     # ---------------------------------------------------------
     # 3. Get Data & Filter (GET)
     # ---------------------------------------------------------
-    customers = Customer.objects.all().order_by('-created_at')
+    customers = Customer.objects.all()
     
     if current_company:
         customers = customers.filter(company=current_company)
 
     # Search Logic
     search_query = request.GET.get('q')
-    if search_query:
-        customers = customers.filter(
-            Q(name__icontains=search_query) | 
-            Q(phone__icontains=search_query) | 
-            Q(tax_id__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
+    customers = search(customers, search_query)  # name / phone / tax id / email
 
     # Status Filter
     status_filter = request.GET.get('status')
@@ -251,7 +388,7 @@ def customer_view(request, pk=None):
 
     context = {
         'form': form,
-        'customers': customers,
+        'customers': keyset_paginate(request, customers, ('-created_at', '-id')),
         'search_query': search_query,
         'is_editing': is_editing,             # Flag for Template
         'editing_customer': customer_instance # Object for Template
@@ -288,17 +425,11 @@ def vendor_list(request):
     all_companies = Company.objects.filter(is_active=True)
     
     # We need vendors for the table
-    vendors = Vendor.objects.all().select_related('company').order_by('-created_at')
+    vendors = Vendor.objects.all().select_related('company')
 
     # 3. Search & Filter Logic
     search_query = request.GET.get('q')
-    if search_query:
-        vendors = vendors.filter(
-            Q(name__icontains=search_query) |
-            Q(contact_person__icontains=search_query) |
-            Q(phone__icontains=search_query) |
-            Q(company__name__icontains=search_query) # Search by related company name too
-        )
+    vendors = search(vendors, search_query)  # Incl. the related company name
 
     status_filter = request.GET.get('status')
     if status_filter == 'active':
@@ -308,13 +439,14 @@ def vendor_list(request):
 
     context = {
         'form': form,
-        'vendors': vendors,
+        'vendors': keyset_paginate(request, vendors, ('-created_at', '-id')),
         'all_companies': all_companies, # Passed to template for <datalist>
         'search_query': search_query
     }
     return render(request, 'vendor_list.html', context)
 
 #@login_required
+@data_version_etag('vendors', 'companies')
 def vendor_view(request, pk=None):
     # 1. Determine Context (Create vs Edit)
     if pk:
@@ -351,15 +483,10 @@ def vendor_view(request, pk=None):
 
     # 3. Get Data for Table & Search
     all_companies = Company.objects.filter(is_active=True)
-    vendors = Vendor.objects.all().select_related('company').order_by('-created_at')
+    vendors = Vendor.objects.all().select_related('company')
 
     search_query = request.GET.get('q')
-    if search_query:
-        vendors = vendors.filter(
-            Q(name__icontains=search_query) |
-            Q(contact_person__icontains=search_query) |
-            Q(company__name__icontains=search_query)
-        )
+    vendors = search(vendors, search_query)
     
     # Status Filter
     status_filter = request.GET.get('status')
@@ -370,7 +497,7 @@ def vendor_view(request, pk=None):
 
     context = {
         'form': form,
-        'vendors': vendors,
+        'vendors': keyset_paginate(request, vendors, ('-created_at', '-id')),
         'all_companies': all_companies,
         'search_query': search_query,
         'is_editing': is_editing, # Pass this flag to template
@@ -379,6 +506,7 @@ def vendor_view(request, pk=None):
     return render(request, 'vendor_list.html', context)
 
 #@login_required
+@data_version_etag('products', 'companies', 'purchase_orders', 'invoices')
 def product_view(request, pk=None):
     # ---------------------------------------------------------
     # 1. Determine Context (Create vs Edit)
@@ -404,16 +532,11 @@ def product_view(request, pk=None):
     # ---------------------------------------------------------
     # 3. Get Data & Filter (GET)
     # ---------------------------------------------------------
-    products = Product.objects.all().select_related('company').order_by('-created_at')
+    products = with_current_stock(Product.objects.all().select_related('company'))
     
     # Search Logic
     search_query = request.GET.get('q')
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(sku__icontains=search_query) |
-            Q(category__icontains=search_query)
-        )
+    products = search(products, search_query)
 
     # Filter by Category (Optional extra filter)
     cat_filter = request.GET.get('category')
@@ -433,7 +556,7 @@ def product_view(request, pk=None):
     
     context = {
         'form': form,
-        'products': products,
+        'products': keyset_paginate(request, products, ('-created_at', '-id')),
         'search_query': search_query,
         'existing_categories': set(existing_categories), # Use set to remove duplicates
         'is_editing': is_editing,
@@ -442,6 +565,7 @@ def product_view(request, pk=None):
     return render(request, 'product_list.html', context)
 
 #@login_required
+@data_version_etag('transactions', 'companies')
 def transaction_view(request, pk=None):
     # ---------------------------------------------------------
     # 1. Determine Context (Create vs Edit)
@@ -471,17 +595,11 @@ def transaction_view(request, pk=None):
     # ---------------------------------------------------------
     # 3. Get Data & Filter (GET)
     # ---------------------------------------------------------
-    transactions = Transaction.objects.all().order_by('-transaction_date', '-created_at')
+    transactions = Transaction.objects.all()
 
-    # --- A. Search (Number, Ref, Desc, Amount) ---
+    # --- A. Search (Number, Ref, Desc; a numeric term also matches the exact Amount) ---
     search_query = request.GET.get('q')
-    if search_query:
-        transactions = transactions.filter(
-            Q(transaction_number__icontains=search_query) | 
-            Q(reference__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(amount__icontains=search_query)
-        )
+    transactions = search(transactions, search_query)
 
     # --- B. Dropdown Filters (Type & Category) ---
     type_filter = request.GET.get('type')
@@ -510,7 +628,7 @@ def transaction_view(request, pk=None):
 
     context = {
         'form': form,
-        'transactions': transactions,
+        'transactions': keyset_paginate(request, transactions, ('-transaction_date', '-id')),
         'search_query': search_query,
         'type_choices': type_choices,
         'category_choices': category_choices,
@@ -521,6 +639,7 @@ def transaction_view(request, pk=None):
 
 
 #@login_required
+@data_version_etag('purchase_orders', 'vendors', 'products', 'companies')
 def purchase_order_view(request, pk=None):
     # 1. Setup Context
     if pk:
@@ -565,12 +684,18 @@ def purchase_order_view(request, pk=None):
                             po.company = Company.objects.first() # Placeholder logic
                         po.save()
                         
-                        # B. Save Items
+                        # B. Save Items (removed lines leave the stock ledger first)
                         formset.instance = po
+                        removed = [f.instance.pk for f in formset.deleted_forms if f.instance.pk]
+                        if removed:
+                            delete_stock_movements(purchase_items=PurchaseItem.objects.filter(pk__in=removed))
                         formset.save()
                         
                         # C. Recalculate Totals (The model method we wrote earlier)
                         po.calculate_totals()
+
+                        # D. Re-date stock ledger rows (order_date may have changed)
+                        sync_stock_movements(purchase_items=PurchaseItem.objects.filter(purchase_order=po))
                         
                         return redirect('purchase_list')
                 except Exception as e:
@@ -580,17 +705,15 @@ def purchase_order_view(request, pk=None):
         formset = PurchaseItemFormSet(instance=po_instance)
 
     # 3. List View Logic (If viewing list)
-    orders = PurchaseOrder.objects.all().order_by('-order_date')
+    orders = PurchaseOrder.objects.select_related('vendor')
     
     # Simple Filters
-    if request.GET.get('q'):
-        q = request.GET.get('q')
-        orders = orders.filter(Q(po_number__icontains=q) | Q(vendor__name__icontains=q))
+    orders = search(orders, request.GET.get('q'))
 
     context = {
         'form': form,
         'formset': formset,
-        'orders': orders,
+        'orders': keyset_paginate(request, orders, ('-order_date', '-id')),
         'is_editing': is_editing,
         'editing_po': po_instance
     }
@@ -713,6 +836,7 @@ def purchase_order_view(request, pk=None):
 #     }
 #     return render(request, 'invoice_form.html', context)
 
+@data_version_etag('invoices', 'customers', 'products', 'purchase_orders', 'companies')
 def invoice_view(request, pk=None):
     """
     Combined List + Create + Edit View.
@@ -726,10 +850,13 @@ def invoice_view(request, pk=None):
         invoice_instance = None
         is_editing = False
 
+    # Each row renders its current batch (the rest are fetched per product by product_batches_view)
+    item_rows = InvoiceItem.objects.select_related('purchase_item__purchase_order')
+
     # 2. Handle Form Submission
     if request.method == 'POST':
         form = InvoiceForm(request.POST, instance=invoice_instance)
-        formset = InvoiceItemFormSet(request.POST, instance=invoice_instance)
+        formset = InvoiceItemFormSet(request.POST, instance=invoice_instance, queryset=item_rows)
         
         if form.is_valid() and formset.is_valid():
             try:
@@ -746,63 +873,21 @@ def invoice_view(request, pk=None):
                     # --- B. Process Items (The "Service" Layer Logic) ---
                     items = formset.save(commit=False)
                     
-                    # B1. Handle Deletions (Restore Stock)
+                    # B1. Stock held by deleted and edited lines goes back first
+                    # (edited lines are re-allocated below with their new batch/quantity)
+                    deleted = [obj.pk for obj in formset.deleted_objects]
+                    release_invoice_items(InvoiceItem.objects.filter(pk__in=deleted + [item.pk for item in items if item.pk]))
+                    delete_stock_movements(invoice_items=InvoiceItem.objects.filter(pk__in=deleted))
                     for obj in formset.deleted_objects:
-                        if obj.purchase_item:
-                            obj.purchase_item.remaining_quantity += obj.quantity
-                            obj.purchase_item.save()
                         obj.delete()
 
-                    # B2. Handle Updates/Inserts
-                    for item in items:
-                        selected_batch = item.purchase_item # Might be None (if user left blank)
-                        selected_product = item.product     # Always set (required by form)
-                        
-                        # --- SCENARIO 1: User left Batch BLANK (Auto-Assign FIFO) ---
-                        if not selected_batch:
-                            # Find oldest batch for this product with stock
-                            stock_batch = PurchaseItem.objects.filter(
-                                product=selected_product, 
-                                remaining_quantity__gt=0
-                            ).order_by('id').first()
-                            
-                            if not stock_batch:
-                                raise Exception(f"No stock available for Product: {selected_product.name}")
-                            
-                            # Check if that batch has enough
-                            if item.quantity > stock_batch.remaining_quantity:
-                                raise Exception(f"Auto-assign failed. Batch {stock_batch} only has {stock_batch.remaining_quantity} left, but you requested {item.quantity}.")
-                                
-                            item.purchase_item = stock_batch
-                            
-                        # --- SCENARIO 2: User SELECTED a specific Batch ---
-                        else:
-                            # Integrity check: Does batch match product?
-                            if selected_batch.product != selected_product:
-                                raise Exception(f"Mismatch: Batch {selected_batch} does not belong to product {selected_product.name}")
-                            
-                            # If editing, we need to revert the *original* quantity first to check math
-                            if item.pk:
-                                original_item = InvoiceItem.objects.get(pk=item.pk)
-                                # Only restore if the batch hasn't changed (or logic gets too complex)
-                                if original_item.purchase_item == selected_batch:
-                                    selected_batch.remaining_quantity += original_item.quantity
-
-                            if item.quantity > selected_batch.remaining_quantity:
-                                raise Exception(f"Not enough stock in selected batch {selected_batch}. Available: {selected_batch.remaining_quantity}")
-
-                            item.purchase_item = selected_batch
-
-                        # --- C. Deduct Stock & Save ---
-                        # Note: Ensure InvoiceItem.save() in models.py DOES NOT deduct stock again.
-                        item.purchase_item.remaining_quantity -= item.quantity
-                        item.purchase_item.save()
-                        
-                        item.invoice = invoice
-                        item.save() # This triggers calculate_totals via Model, but that's fine.
-                    
-                    # --- D. Final Totals ---
-                    invoice.calculate_totals()
+                    # B2. Updates/Inserts: locked FIFO allocation (a blank batch may span several
+                    # batches -> one line per batch); also re-dates the ledger and recalculates totals
+                    allocate_invoice_items(invoice, items)
+
+                    # --- C. Billed invoices get their PDF pre-rendered in the background ---
+                    if invoice.status == 'BILLED':
+                        schedule_invoice_pdf(invoice.pk)
                     
                     messages.success(request, "Invoice saved successfully.")
                     return redirect('invoice_list') # Redirect to clear POST data
@@ -816,22 +901,22 @@ def invoice_view(request, pk=None):
     # 3. Handle GET Request (Display Form)
     else:
         form = InvoiceForm(instance=invoice_instance)
-        formset = InvoiceItemFormSet(instance=invoice_instance)
+        formset = InvoiceItemFormSet(instance=invoice_instance, queryset=item_rows)
 
     # 4. Fetch Recent Data for the Table
     # Optimized with select_related to prevent N+1 queries on Customer
-    invoices = Invoice.objects.select_related('customer').order_by('-invoice_date', '-created_at')
+    invoices = Invoice.objects.select_related('customer')
     
-    # Optional Server-Side Search (in addition to JS filter)
-    if request.GET.get('q'):
-        q = request.GET.get('q')
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=q) | 
-            Q(customer__name__icontains=q)
-        )
+    # Column filters run in the DB (invalid values are ignored, not an error page)
+    filter_form = InvoiceFilterForm(request.GET)
+    invoices = filter_form.filter(invoices)
     
-    # Limit to last 1000 for performance
-    invoices = invoices[:1000]
+    # One page at a time (seek on invoice_date_id_idx), not a 1000-row cap
+    invoices = keyset_paginate(request, invoices, ('-invoice_date', '-id'))
+
+    # The table's filter inputs fetch just the rows + pager
+    if request.GET.get('partial') == 'table':
+        return render(request, 'partials/invoice_table.html', {'invoices': invoices})
     # get second element (display labels) from STATUS_CHOICES
     schoices = [label for _, label in Invoice.STATUS_CHOICES]
 
@@ -839,6 +924,7 @@ def invoice_view(request, pk=None):
         'form': form,
         'formset': formset,
         'invoices': invoices,
+        'filter_form': filter_form,
         'is_editing': is_editing,
         'editing_invoice': invoice_instance,
         'status_choices': [1,2,3]
@@ -931,6 +1017,10 @@ def platform_import_view(request):
 
             # --- 2. PROCESS & IMPORT ---
             try:
+                # Lazy: pandas is only loaded by workers that actually run an import
+                from .utils_import_core import universal_invoice_import
+                from .utils_processors import process_lazada_orders, process_shopee_orders, process_tiktok_orders
+
                 header_df = None
                 items_df = None
                 company_id = 1 # TODO: Make dynamic e.g. request.user.company_id
@@ -1011,7 +1101,14 @@ def product_mapping_view(request):
             
             # B. Retroactively Fix Existing InvoiceItems
             # Find all items with this SKU string that have NO product yet
-            InvoiceItem.objects.filter(sku=external_key, product__isnull=True).update(product=product)
+            fixed_ids = list(InvoiceItem.objects.filter(sku=external_key, product__isnull=True).values_list('id', flat=True))
+            InvoiceItem.objects.filter(id__in=fixed_ids).update(product=product)
+
+            # C. Newly mapped lines now move stock
+            sync_stock_movements(invoice_items=InvoiceItem.objects.filter(id__in=fixed_ids))
+            # .update() sends no signals: product stock / invoice pages changed
+            for company_id in set(Invoice.objects.filter(invoice_items__id__in=fixed_ids).values_list('company_id', flat=True)):
+                bump_data_version('invoices', company_id)
             
             messages.success(request, f"Mapped '{external_key}' to '{product.name}' successfully.")
             return redirect('product_mapping')
@@ -1038,18 +1135,26 @@ def report_dashboard_view(request):
     form = ReportFilterForm(request.POST or None)
     
     if request.method == 'POST' and form.is_valid():
+        # Lazy: openpyxl/pandas are only loaded when a report is generated
+        from .utils_pnl import generate_pnl_report
+        from .utils_archive import with_archived
+        from .utils_reports import generate_purchase_tax_report, generate_sales_tax_report, generate_stock_report
+
         report_type = request.POST.get('report_type')
         company = form.cleaned_data['company']
         start_date = form.cleaned_data['start_date']
         end_date = form.cleaned_data['end_date']
+        started = time.perf_counter()
+        response = None
 
         # --- Report 1: Purchase Tax ---
         if report_type == 'purchase_tax':
             queryset = PurchaseOrder.objects.filter(
                 company=company,
                 order_date__range=[start_date, end_date]
-            ).order_by('order_date')
-            return generate_purchase_tax_report(queryset, company, start_date, end_date)
+            ).select_related('vendor').order_by('order_date')
+            queryset = with_archived(queryset, start_date, end_date, company)
+            response = generate_purchase_tax_report(queryset, company, start_date, end_date)
             
         # --- Report 2: Sales Tax (NEW) ---
         elif report_type == 'sales_tax':
@@ -1058,13 +1163,26 @@ def report_dashboard_view(request):
                 #company=company,
                 #status='BILLED',  # Only include finalized tax invoices
                 invoice_date__range=[start_date, end_date]
-            ).order_by('invoice_date', 'invoice_number')
+            ).select_related('customer').order_by('invoice_date', 'invoice_number')
+            queryset = with_archived(queryset, start_date, end_date)  # Same (all companies) scope as above
             
-            return generate_sales_tax_report(queryset, company, start_date, end_date)
+            response = generate_sales_tax_report(queryset, company, start_date, end_date)
         
         # --- NEW: Stock Report ---
         elif report_type == 'stock_report':
-            return generate_stock_report(company, start_date, end_date)
+            response = generate_stock_report(company, start_date, end_date)
+
+        # --- Stock as of end date (point-in-time, from the stock ledger) ---
+        elif report_type == 'stock_as_of':
+            response = generate_stock_report(company, start_date, end_date, as_of_date=end_date)
+
+        # --- Profit & Loss (vectorized engine) ---
+        elif report_type == 'profit_loss':
+            response = generate_pnl_report(company, start_date, end_date)
+
+        if response is not None:  # Known report types only (the label comes from the form)
+            REPORT_SECONDS.labels(report_type).observe(time.perf_counter() - started)
+            return response
 
     context = {
         'form': form,
@@ -1074,28 +1192,150 @@ def report_dashboard_view(request):
 
 
 #@login_required
-def invoice_pdf_view(request, pk):
-    invoice = get_object_or_404(Invoice, pk=pk)
-    
-    context = {
-        'invoice': invoice,
-        'items': invoice.invoice_items.all(),
-        'company': invoice.company,
-    }
+def profit_loss_json_view(request):
+    """
+    JSON version of the P&L report.
+    Usage: /reports/profit-loss/?company=1&start_date=2025-01-01&end_date=2025-01-31
+    """
+    form = ReportFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
 
-    # 1. Render HTML
-    html_string = render_to_string('pdf/invoice_print.html', context)
+    from .utils_pnl import generate_pnl_json  # Lazy: pandas
 
-    # 2. Base URL for static files
-    # WeasyPrint needs to know where to find /static/ files on disk
-    base_url = request.build_absolute_uri('/')
+    with REPORT_SECONDS.labels('profit_loss_json').time():
+        return generate_pnl_json(
+            form.cleaned_data['company'],
+            form.cleaned_data['start_date'],
+            form.cleaned_data['end_date'],
+        )
+
+
+#@login_required
+def global_search_view(request):
+    """
+    One box for tracking numbers, phones, platform order ids, invoice/PO numbers and names.
+    Usage: /search/?q=TH0123&company=1  ->  {"results": [{type, id, title, subtitle, rank, url}, ...]}
+    """
+    company = request.GET.get('company')
+    return JsonResponse({
+        'query': request.GET.get('q', ''),
+        'results': global_search(request.GET.get('q'), company_id=int(company) if company and company.isdigit() else None),
+    }, json_dumps_params={'ensure_ascii': False})
+
+
+@staff_member_required
+def profiling_view(request):
+    """Slowest endpoints / requests recorded by ProfilingMiddleware in this process."""
+    return render(request, 'profiling.html', {
+        'enabled': settings.PROFILING_ENABLED,
+        'history': settings.PROFILING_HISTORY,
+        'endpoints': slowest_endpoints(),
+        'requests': slowest_requests(),
+        'page_title': 'Request Profiling',
+    })
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape target (text format). Needs "Authorization: Bearer <METRICS_TOKEN>";
+    without a token configured it is only served when DEBUG is on.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if not settings.METRICS_TOKEN:
+        if not settings.DEBUG:
+            return HttpResponse("Set METRICS_TOKEN to enable /metrics/.", status=403, content_type='text/plain')
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {settings.METRICS_TOKEN}"):
+        return HttpResponse(status=401)
+    return HttpResponse(render_metrics(), content_type=METRICS_CONTENT_TYPE)
 
-    # 3. Generate PDF
-    # WeasyPrint handles fonts and images automatically if base_url is correct
-    pdf_file = weasyprint.HTML(string=html_string, base_url=base_url).write_pdf()
 
-    # 4. Return Response
-    response = HttpResponse(pdf_file, content_type='application/pdf')
+#@login_required
+def product_batches_view(request, pk):
+    """
+    Open batches of one product (FIFO order) for the invoice line dropdown, cached per product.
+    Usage: /products/5/batches/  ->  {"product": 5, "batches": [{id, po_number, remaining_quantity, unit_cost}, ...]}
+    """
+    return JsonResponse({'product': pk, 'batches': get_open_batches(pk)})
+
+
+def _invoice_pdf_etag(request, pk):
+    """ETag = PDF cache key (invoice id + updated_at + template version). One small query."""
+    updated_at = Invoice.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return invoice_pdf_cache_key(pk, updated_at) if updated_at else None
+
+
+#@login_required
+@condition(etag_func=_invoice_pdf_etag)
+def invoice_pdf_view(request, pk):
+    """
+    Serves the invoice PDF from the on-disk cache (renders on a miss).
+    Unchanged invoices answer If-None-Match with 304 before loading anything else.
+    """
+    invoice = get_object_or_404(Invoice.objects.select_related('company'), pk=pk)
+
+    # 1. Cached file for the current version (WeasyPrint only runs on a miss)
+    # Base URL lets WeasyPrint find /static/ files (fonts)
+    base_url = request.build_absolute_uri('/')
+    path = get_or_render_invoice_pdf(invoice, base_url=base_url)
+
+    # 2. Return Response
     filename = f"Invoice_{invoice.invoice_number}.pdf"
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    return response
\ No newline at end of file
+    response = FileResponse(open_invoice_pdf(invoice, path, base_url), content_type='application/pdf', as_attachment=True, filename=filename)
+    patch_cache_control(response, private=True, no_cache=True)  # Always revalidate via ETag
+    return response
+
+
+#@login_required
+def invoice_bulk_print_view(request):
+    """
+    Prints many invoices at once as one merged PDF (default) or a ZIP of PDFs.
+    Usage: /invoices/print/?start_date=2025-01-01&end_date=2025-01-31&platform_name=Shopee&status=BILLED
+           /invoices/print/?ids=1,2,3&output=zip   (POST with the same fields for long id lists)
+    """
+    form = InvoiceBulkPrintForm(request.POST if request.method == 'POST' else request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    data = form.cleaned_data
+
+    # 1. Select invoices (one query + one prefetch for the lines)
+    invoices = Invoice.objects.select_related('company', 'customer').prefetch_related('invoice_items')
+    if data['ids']:
+        invoices = invoices.filter(pk__in=data['ids'])
+    if data['start_date'] and data['end_date']:
+        invoices = invoices.filter(invoice_date__range=[data['start_date'], data['end_date']])
+    if data['platform_name']:
+        invoices = invoices.filter(platform_name=data['platform_name'])
+    if data['status']:
+        invoices = invoices.filter(status=data['status'])
+
+    invoices = list(invoices.order_by('invoice_date', 'invoice_number')[:settings.INVOICE_PDF_BULK_LIMIT + 1])
+    if not invoices:
+        return JsonResponse({'errors': {'__all__': ["No invoices match the filter."]}}, status=404)
+    if len(invoices) > settings.INVOICE_PDF_BULK_LIMIT:
+        return JsonResponse(
+            {'errors': {'__all__': [f"Too many invoices (max {settings.INVOICE_PDF_BULK_LIMIT} per request)."]}},
+            status=400,
+        )
+
+    # 2. Cached PDFs are reused; the rest are rendered in parallel
+    base_url = request.build_absolute_uri('/')
+    rendered = get_or_render_invoice_pdfs(invoices, base_url=base_url)
+    files = ((invoice, open_invoice_pdf(invoice, path, base_url)) for invoice, path in rendered)  # One open at a time
+
+    # 3. Assemble into a temp file and stream it back
+    output = tempfile.TemporaryFile()
+    stamp = date.today().strftime('%Y%m%d')
+    if data['output'] == 'zip':
+        zip_invoice_pdfs(
+            ((f"Invoice_{invoice.invoice_number.replace('/', '-')}.pdf", fh) for invoice, fh in files),
+            output,
+        )
+        filename, content_type = f"Invoices_{stamp}.zip", 'application/zip'
+    else:
+        merge_invoice_pdfs((fh for _, fh in files), output)
+        filename, content_type = f"Invoices_{stamp}.pdf", 'application/pdf'
+    output.seek(0)
+
+    return FileResponse(output, content_type=content_type, as_attachment=True, filename=filename)
@@ -83,6 +83,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',  # First: times everything below (no-op unless PROFILING_ENABLED)
+    'api.middleware.MetricsMiddleware',  # Request count / latency per view (no-op unless METRICS_ENABLED)
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -181,6 +183,59 @@ STATICFILES_DIRS = [
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Invoice PDF cache
+# Rendered PDFs are stored here, keyed by invoice id + updated_at + template version.
+INVOICE_PDF_CACHE_DIR = config('INVOICE_PDF_CACHE_DIR', default=os.path.join(BASE_DIR, 'pdf_cache'))
+# Bump to invalidate every cached PDF (e.g. after changing company details shown on the PDF)
+INVOICE_PDF_TEMPLATE_VERSION = config('INVOICE_PDF_TEMPLATE_VERSION', default='1')
+# Used by background pre-rendering (no request available to build the base URL)
+PDF_BASE_URL = config('PDF_BASE_URL', default='http://127.0.0.1:8000/')
+# Bulk printing: worker processes for rendering, and max invoices per request
+INVOICE_PDF_WORKERS = config('INVOICE_PDF_WORKERS', default=os.cpu_count() or 1, cast=int)
+INVOICE_PDF_BULK_LIMIT = config('INVOICE_PDF_BULK_LIMIT', default=500, cast=int)
+
+# Change feed (/api/v1/changes/<resource>/): rows stamped after the oldest open writing
+# transaction (Postgres) are held back, so late commits are not skipped; this margin also
+# covers stamps taken just before BEGIN and the clock gap between app servers and the DB.
+# Other databases only have the margin: it must then exceed the longest write transaction.
+CHANGES_SETTLE_SECONDS = config('CHANGES_SETTLE_SECONDS', default=2, cast=int)
+
+# Part of every data-version ETag: bump on deploys that change page markup
+PAGE_ETAG_VERSION = config('PAGE_ETAG_VERSION', default='1')
+
+# Cache (per-product open batches for the invoice form).
+# The default local-memory cache is per process, so stock changes only clear the worker that
+# made them: with several workers CACHE_BACKEND / CACHE_LOCATION must point at a shared cache
+# (e.g. django.core.cache.backends.redis.RedisCache); gunicorn.conf.py refuses to start otherwise
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+# Upper bound on staleness if a stock change ever bypasses invalidation
+OPEN_BATCHES_CACHE_SECONDS = config('OPEN_BATCHES_CACHE_SECONDS', default=300, cast=int)
+
+# Monthly invoice / invoice line partitions created ahead of time (Postgres).
+# Created after every migrate; also run `manage.py manage_partitions` from cron (e.g. daily)
+INVOICE_PARTITION_MONTHS_AHEAD = config('INVOICE_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+
+# Request profiling (api.middleware.ProfilingMiddleware): wall / SQL / template time and
+# duplicate queries per request, a Server-Timing header, slowest endpoints on /profiling/ (staff)
+PROFILING_ENABLED = config('PROFILING_ENABLED', default=False, cast=bool)
+PROFILING_HISTORY = config('PROFILING_HISTORY', default=1000, cast=int)  # Requests kept per process
+
+# Prometheus metrics on /metrics/ (api.utils_metrics): request latency / errors per view,
+# imports, PDF renders, reports, stock allocation conflicts, database connections.
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+# Scrapes must send "Authorization: Bearer <token>"; with no token /metrics/ answers 403 unless DEBUG
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+# Several gunicorn workers: a directory shared by them (emptied on start by gunicorn.conf.py),
+# so /metrics/ sums every worker instead of answering for whichever one served the scrape
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+if PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', PROMETHEUS_MULTIPROC_DIR)  # Read by prometheus_client on import
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOWS_CREDENTIALS = True
\ No newline at end of file
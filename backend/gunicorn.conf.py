@@ -0,0 +1,41 @@
+"""
+gunicorn settings read from the backend directory (`gunicorn backend.wsgi`).
+Prometheus multiprocess metrics (api.utils_metrics): every worker writes its samples to
+PROMETHEUS_MULTIPROC_DIR and /metrics/ sums the files. Several workers also need a shared
+Django cache: stock changes clear cached open-batch lists only in the cache they can reach.
+"""
+import os
+import shutil
+
+from decouple import config
+
+PROMETHEUS_MULTIPROC_DIR = config('PROMETHEUS_MULTIPROC_DIR', default='')
+# Same default as CACHES in backend/settings.py
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+PER_PROCESS_CACHES = {'django.core.cache.backends.locmem.LocMemCache'}
+if PROMETHEUS_MULTIPROC_DIR:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = PROMETHEUS_MULTIPROC_DIR  # Inherited by the workers
+
+
+def on_starting(server):
+    """
+    Refuses several workers on a per-process cache (other workers would serve stale open
+    batches for up to OPEN_BATCHES_CACHE_SECONDS). Samples of a previous run would be
+    summed with the new ones: start from an empty directory.
+    """
+    if server.cfg.workers > 1 and CACHE_BACKEND in PER_PROCESS_CACHES:
+        raise RuntimeError(
+            f"{server.cfg.workers} workers need a shared cache: set CACHE_BACKEND / CACHE_LOCATION "
+            "(e.g. django.core.cache.backends.redis.RedisCache or .db.DatabaseCache + createcachetable)."
+        )
+    if PROMETHEUS_MULTIPROC_DIR:
+        shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+        os.makedirs(PROMETHEUS_MULTIPROC_DIR)
+
+
+def child_exit(server, worker):
+    """Drops the live-gauge files of a worker that exited (counters / histograms keep their totals)."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)